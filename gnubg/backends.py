@@ -0,0 +1,425 @@
+# backends.py
+import json
+import threading
+from pathlib import Path
+
+import cache
+import logic
+import opening
+import pool
+import tracing
+
+WORKER_SCRIPT = str(Path(__file__).resolve().parent / "gnubg_worker.py")
+
+
+class EngineError(Exception):
+    """Engine run failed; the message is what gets reported to the caller."""
+
+
+_CUBE_EQUITIES = ("no_double", "double_take", "double_pass", "optimal")
+
+
+def _candidate(c: dict) -> dict:
+    atomic, reduced = logic.expand_move(c.get("move"))
+    return dict(c, atomic=atomic, reduced=reduced)
+
+
+def _result(raw: str, receiving_double: bool, candidates=None, cube: dict = None) -> dict:
+    """
+    Common result shape for every backend, built from structured engine output
+    (gnubg_worker.py replies or logic.structured_hint lines):
+    raw (for debug logs), move_raw, atomic, reduced, cube_action, cube_text,
+    candidates (ranked: move, equity, eqdiff, probs, atomic, reduced) and
+    cube_equities (no_double, double_take, double_pass, optimal; None for move hints).
+    """
+    candidates = [_candidate(c) for c in candidates or []]
+    move_str = candidates[0]["move"] if candidates else None
+    atomic, reduced = (candidates[0]["atomic"], candidates[0]["reduced"]) if candidates else ([], [])
+    c_act, c_txt = logic.classify_cube(cube["recommendation"] if cube else "", receiving_double)
+    return {
+        "raw": raw,
+        "move_raw": move_str,
+        "atomic": atomic,
+        "reduced": reduced,
+        "cube_action": c_act,
+        "cube_text": c_txt,
+        "candidates": candidates,
+        "cube_equities": {k: cube[k] for k in _CUBE_EQUITIES} if cube else None,
+        "recommendation": cube["recommendation"] if cube else None,
+    }
+
+
+def _text_result(raw: str, move_raw: str, cube_raw: str, receiving_double: bool) -> dict:
+    """Fallback: same shape scraped from hint text, without candidates (cube equities if the hint printed them)."""
+    mv_str, atomic, reduced, _, _ = logic.parse_output(move_raw, receiving_double=receiving_double)
+    _, _, _, c_act, c_txt = logic.parse_output(cube_raw, receiving_double=receiving_double)
+    return {
+        "raw": raw,
+        "move_raw": mv_str,
+        "atomic": atomic,
+        "reduced": reduced,
+        "cube_action": c_act,
+        "cube_text": c_txt,
+        "candidates": [],
+        "cube_equities": logic.parse_cube_equities(cube_raw),
+        "recommendation": logic.cube_recommendation(cube_raw),
+    }
+
+
+# --- 1. CLI BACKEND ---
+
+class CliBackend:
+    """
+    gnubg CLI pool. Hints come back as JSON printed by gnubg's embedded Python
+    (logic.structured_hint); the scraped hint text (logic.parse_output) is only
+    used when that is switched off or produced nothing.
+    """
+
+    name = "cli"
+
+    def analyze(self, pid: str, mid: str, kind: str, receiving_double: bool,
+                plies: int = None, timeout: float = None, max_moves: int = 1) -> dict:
+        plies = plies if plies is not None else logic.PLIES
+        timeout = timeout or logic.TIMEOUT
+
+        if logic.STRUCTURED_OUTPUT:
+            with tracing.span("engine"):
+                raw, data = logic.run_gnubg_structured(pid, mid, kind, plies, timeout, max_moves)
+            if raw.startswith("ERROR"):
+                raise EngineError(raw)
+            if data:
+                with tracing.span("parse"):
+                    return _result(raw, receiving_double, data[0].get("candidates"), data[0].get("cube"))
+
+        with tracing.span("engine"):
+            raw = logic.run_gnubg(pid, mid, plies, timeout)
+        if "ERROR" in raw:
+            raise EngineError(raw)
+        with tracing.span("parse"):
+            return _text_result(raw, raw, raw, receiving_double)
+
+    def analyze_full(self, pid: str, cube_mid: str, move_mid: str,
+                     plies: int = None, timeout: float = None, max_moves: int = 1) -> dict:
+        plies = plies if plies is not None else logic.PLIES
+        timeout = timeout or logic.TIMEOUT
+
+        if logic.STRUCTURED_OUTPUT:
+            with tracing.span("engine"):
+                raw, data = logic.run_gnubg_combined_structured(pid, cube_mid, move_mid, plies, timeout, max_moves)
+            if raw.startswith("ERROR"):
+                raise EngineError(raw)
+            if len(data) == 2:
+                with tracing.span("parse"):
+                    return _result(raw, False, data[1].get("candidates"), data[0].get("cube"))
+
+        with tracing.span("engine"):
+            cube_raw, move_raw = logic.run_gnubg_combined(pid, cube_mid, move_mid, plies, timeout)
+        if "ERROR" in cube_raw or "ERROR" in move_raw:
+            raise EngineError(cube_raw if "ERROR" in cube_raw else move_raw)
+        with tracing.span("parse"):
+            return _text_result(cube_raw + move_raw, move_raw, cube_raw, False)
+
+
+# --- 2. EMBEDDED PYTHON BACKEND ---
+
+class ModuleBackend:
+    """
+    Calls gnubg.hint / gnubg.cfevaluate inside long-lived gnubg processes
+    running gnubg_worker.py. No script text, no stdout scraping.
+    """
+
+    name = "module"
+
+    def __init__(self, size: int = None):
+        self._size = size or max(logic.POOL_SIZE, 1)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get_pool(self) -> pool.GnubgPool:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pool.register(pool.GnubgPool(
+                        [logic.GNUBG_PATH, "-t", "-q", "-p", WORKER_SCRIPT],
+                        logic._WORKER_INIT,
+                        size=self._size,
+                        start_timeout=logic.TIMEOUT,
+                        cpusets=logic.SCHEDULER.cpusets(self._size),
+                        worker_cls=pool.ModuleWorker,
+                    ))
+        return self._pool
+
+    def _call(self, request: dict, timeout: float = None) -> dict:
+        try:
+            with tracing.span("engine"):
+                return self.get_pool().call(request, timeout=timeout or logic.TIMEOUT)
+        except (pool.WorkerError, pool.JobError) as e:
+            raise EngineError(f"ERROR: {e}")
+
+    def analyze(self, pid: str, mid: str, kind: str, receiving_double: bool,
+                plies: int = None, timeout: float = None, max_moves: int = 1) -> dict:
+        res = self._call({
+            "op": "hint",
+            "kind": kind,
+            "pos_id": pid,
+            "match_id": mid,
+            "plies": plies if plies is not None else logic.PLIES,
+            "max_moves": max_moves,
+        }, timeout)
+
+        return _result(json.dumps(res), receiving_double, res.get("candidates"), res.get("cube"))
+
+    def analyze_full(self, pid: str, cube_mid: str, move_mid: str,
+                     plies: int = None, timeout: float = None, max_moves: int = 1) -> dict:
+        res = self._call({
+            "op": "full",
+            "pos_id": pid,
+            "cube_match_id": cube_mid,
+            "match_id": move_mid,
+            "plies": plies if plies is not None else logic.PLIES,
+            "max_moves": max_moves,
+        }, timeout)
+        with tracing.span("parse"):
+            return _result(json.dumps(res), False, res["candidates"], res["cube"])
+
+
+_BACKENDS = {
+    "cli": CliBackend,
+    "module": ModuleBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend selected by logic.ENGINE_BACKEND (GNUBG_BACKEND env var)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    _backend = _BACKENDS[logic.ENGINE_BACKEND]()
+                except KeyError:
+                    raise ValueError(f"unknown GNUBG_BACKEND {logic.ENGINE_BACKEND!r}, expected one of {sorted(_BACKENDS)}")
+    return _backend
+
+
+# --- 3. CACHED ENTRY POINT ---
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> cache.EvalCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = cache.EvalCache(logic.RESULT_CACHE_MB * 1024 * 1024, logic.RESULT_CACHE_DB)
+    return _cache
+
+
+_rollouts = None
+
+
+def get_rollout_store() -> cache.EvalCache:
+    """Finished cube rollouts (rollout.py); few and expensive, so kept apart from the LRU of evaluations."""
+    global _rollouts
+    if _rollouts is None:
+        with _cache_lock:
+            if _rollouts is None:
+                _rollouts = cache.EvalCache(16 * 1024 * 1024, logic.ROLLOUT_DB)
+    return _rollouts
+
+
+def _rollout_key(pid: str, mid: str) -> bytes:
+    """Key of a finished rollout, on the canonical cube match ID like _key()."""
+    return cache.make_key(pid, logic.canonical_match_id(mid, "cube"), "cube/rollout")
+
+
+def store_rollout(pid: str, mid: str, entry: dict):
+    """entry: cube_equities, recommendation and rollout details, from the doubler's perspective."""
+    get_rollout_store().put(_rollout_key(pid, mid), entry)
+
+
+def rollout_result(pid: str, mid: str, receiving_double: bool):
+    """Cube result from a finished rollout of this decision (any ply setting), or None."""
+    entry = get_rollout_store().get(_rollout_key(pid, mid))
+    if entry is None:
+        return None
+    c_act, c_txt = logic.classify_cube(entry["recommendation"], receiving_double)
+    return {
+        "move_raw": None, "atomic": [], "reduced": [],
+        "cube_action": c_act, "cube_text": c_txt, "candidates": [],
+        "cube_equities": entry["cube_equities"], "rollout": entry["rollout"],
+        "ply": None, "source": "rollout",
+    }
+
+
+def eval_profile(kind: str, plies: int = None) -> str:
+    """Everything besides the IDs that changes the engine's answer."""
+    plies = logic.PLIES if plies is None else plies
+    return f"{kind}/p{plies}"
+
+
+def _key(pid: str, mid: str, kind: str, plies: int = None) -> bytes:
+    """
+    Key of an evaluation, on the canonical match ID (logic.canonical_match_id).
+    Taking a double and offering it are one cube entry: the IDs are the
+    doubler's either way, and the answer is classified per side on lookup.
+    """
+    return cache.make_key(pid, logic.canonical_match_id(mid, kind), eval_profile(kind, plies))
+
+
+def _raw_key(pid: str, mid: str, kind: str, receiving_double: bool, plies: int = None) -> bytes:
+    """The key before canonical IDs (match ID as given, one cube entry per side), for KEY_STATS."""
+    return cache.make_key(pid, mid, f"{eval_profile(kind, plies)}/{'rd' if receiving_double else 'od'}")
+
+
+# Hit rate with canonical keys versus raw ones, for /cache/stats.
+KEY_STATS = cache.KeyStats(200000)
+
+
+def _covers(entry: dict, kind: str, top_n: int) -> bool:
+    """A cached move entry answers top_n if it was evaluated with at least that many candidates."""
+    return kind != "move" or entry.get("top_n", 1) >= top_n
+
+
+def _stored(pid: str, mid: str, kind: str, receiving_double: bool, plies: int, top_n: int, count: bool = True):
+    """
+    Precomputed table first, then the result cache; res["source"] says which.
+    count=False probes without touching the hit/miss counters.
+    """
+    key = _key(pid, mid, kind, plies)
+    found = None
+    for name, source in (("opening", opening.get_table()), ("cache", get_cache())):
+        if source is None:
+            continue
+        res = source.get(key, count)
+        if res is not None and _covers(res, kind, top_n):
+            res["source"] = name
+            found = res
+            break
+    # KEY_STATS covers the result cache; the opening table is built on canonical keys either way.
+    if count and (found is None or found["source"] == "cache"):
+        # Move entries answer top_n up to the number evaluated (evaluate() asks for HINT_MOVES or more).
+        size, fill = (top_n, max(top_n, logic.HINT_MOVES)) if kind == "move" else (0, 0)
+        KEY_STATS.lookup(_raw_key(pid, mid, kind, receiving_double, plies), found is not None, size, fill)
+    if found is not None and kind == "cube":
+        for_side(found, receiving_double)
+    return found
+
+
+def for_side(res: dict, receiving_double: bool) -> dict:
+    """A cube result from a side-neutral cache entry or shared run, classified for the asking side."""
+    if res.get("recommendation") is not None:
+        res["cube_action"], res["cube_text"] = logic.classify_cube(res["recommendation"], receiving_double)
+    return res
+
+
+def _put(pid: str, mid: str, kind: str, receiving_double: bool, plies: int, entry: dict):
+    get_cache().put(_key(pid, mid, kind, plies), entry)
+    KEY_STATS.stored(_raw_key(pid, mid, kind, receiving_double, plies), entry.get("top_n", 1) if kind == "move" else 0)
+
+
+def lookup(pid: str, mid: str, kind: str, receiving_double: bool, plies: int = None, top_n: int = 1,
+           count: bool = True):
+    """
+    Stored result or None: a finished cube rollout first, then the opening
+    table and the cache. Stored results carry no raw engine output
+    (raw is None) and are flagged with cached=True.
+    """
+    res = rollout_result(pid, mid, receiving_double) if kind == "cube" else None
+    if res is None:
+        res = _stored(pid, mid, kind, receiving_double, plies, top_n, count)
+    if res is None:
+        return None
+    res["raw"] = None
+    res["cached"] = True
+    return res
+
+
+def evaluate(pid: str, mid: str, kind: str, receiving_double: bool,
+             plies: int = None, timeout: float = None, top_n: int = 1) -> dict:
+    """
+    Engine run (blocking) whose result is stored in the cache. Move hints ask
+    for at least logic.HINT_MOVES candidates so later top_n requests hit.
+    """
+    plies = logic.PLIES if plies is None else plies
+    max_moves = max(top_n, logic.HINT_MOVES)
+    res = get_backend().analyze(pid, mid, kind, receiving_double, plies, timeout, max_moves)
+    res["ply"] = plies
+    res["top_n"] = max_moves
+    _put(pid, mid, kind, receiving_double, plies, {k: v for k, v in res.items() if k != "raw"})
+    res["cached"] = False
+    res["source"] = "engine"
+    return res
+
+
+def analyze(pid: str, mid: str, kind: str, receiving_double: bool, plies: int = None, top_n: int = 1) -> dict:
+    """Backend analysis behind the result cache."""
+    res = lookup(pid, mid, kind, receiving_double, plies, top_n)
+    if res is not None:
+        return res
+    return evaluate(pid, mid, kind, receiving_double, plies, top_n=top_n)
+
+
+_MOVE_FIELDS = ("move_raw", "atomic", "reduced", "candidates", "top_n")
+_CUBE_FIELDS = ("cube_action", "cube_text", "cube_equities")
+
+
+def lookup_full(pid: str, cube_mid: str, move_mid: str, plies: int = None, top_n: int = 1, count: bool = True):
+    """Combined result assembled from the separate move and cube entries, or None."""
+    move_hit = _stored(pid, move_mid, "move", False, plies, top_n, count)
+    if move_hit is None:
+        return None
+    cube_hit = rollout_result(pid, cube_mid, False) or _stored(pid, cube_mid, "cube", False, plies, top_n, count)
+    if cube_hit is None:
+        return None
+
+    res = {k: move_hit.get(k) for k in _MOVE_FIELDS}
+    res.update({k: cube_hit.get(k) for k in _CUBE_FIELDS})
+    res["ply"] = move_hit.get("ply")
+    res["source"] = move_hit["source"] if move_hit["source"] == cube_hit["source"] else "cache"
+    res["raw"] = None
+    res["cached"] = True
+    return res
+
+
+def evaluate_full(pid: str, cube_mid: str, move_mid: str,
+                  plies: int = None, timeout: float = None, top_n: int = 1) -> dict:
+    """One combined engine run; fills the move and the cube cache entries."""
+    plies = logic.PLIES if plies is None else plies
+    max_moves = max(top_n, logic.HINT_MOVES)
+    res = get_backend().analyze_full(pid, cube_mid, move_mid, plies, timeout, max_moves)
+    res["ply"] = plies
+    res["top_n"] = max_moves
+
+    # Same shapes as the single-kind runs would have cached.
+    c_act, c_txt = logic.classify_cube("", False)
+    _put(pid, move_mid, "move", False, plies, {
+        "move_raw": res["move_raw"], "atomic": res["atomic"], "reduced": res["reduced"],
+        "cube_action": c_act, "cube_text": c_txt, "candidates": res["candidates"],
+        "cube_equities": None, "top_n": max_moves, "ply": plies,
+    })
+    _put(pid, cube_mid, "cube", False, plies, {
+        "move_raw": None, "atomic": [], "reduced": [],
+        "cube_action": res["cube_action"], "cube_text": res["cube_text"], "candidates": [],
+        "cube_equities": res["cube_equities"], "recommendation": res.get("recommendation"), "ply": plies,
+    })
+    res["cached"] = False
+    res["source"] = "engine"
+    return res
+
+
+def analyze_full(pid: str, cube_mid: str, move_mid: str, plies: int = None, top_n: int = 1) -> dict:
+    """
+    Cube decision before rolling + checker play for the rolled dice.
+    Served from the separate move/cube cache entries when both exist;
+    otherwise one combined engine run fills both of them.
+    """
+    res = lookup_full(pid, cube_mid, move_mid, plies, top_n)
+    if res is not None:
+        return res
+    return evaluate_full(pid, cube_mid, move_mid, plies, top_n=top_n)
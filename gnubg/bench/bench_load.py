@@ -0,0 +1,252 @@
+# bench_load.py
+"""
+End-to-end load driver for /get-optimal-move and /get-double-decision.
+
+Sends the fixed corpus plus generated positions (bench/positions.py) at a
+fixed concurrency and reports throughput and p50/p95/p99 latency per
+endpoint and game phase.
+
+Sweep mode (default) starts one service per PLIES x WORKERS x THREADS x PIN
+combination, with the result cache and the opening table off so every
+request reaches the engine; other GNUBG_* settings are inherited from the
+environment. "auto" threads/workers are the scheduler's picks (scheduler.py).
+The summary names the best configuration per endpoint and plies:
+
+    python bench/bench_load.py --plies 3 --workers 2,4,auto --threads 1,4,auto --pin 0,1
+
+Against a service that is already running (its own settings, cache included):
+
+    python bench/bench_load.py --url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import positions  # noqa: E402
+
+ENDPOINTS = {"move": "/get-optimal-move", "double": "/get-double-decision"}
+
+
+def _ints(s: str):
+    return [int(x) for x in s.split(",")]
+
+
+def _autos(s: str):
+    """ "1,4,auto" -> [1, 4, "auto"]."""
+    return [x if x == "auto" else int(x) for x in s.split(",")]
+
+
+def _body(p, o, dice, kind: str, match_length: int) -> bytes:
+    return json.dumps({
+        "board": {"player_board": p, "opponent_board": o},
+        "match": {"match_length": match_length},
+        "dice": dice if kind == "move" else [0, 0],
+    }).encode("utf-8")
+
+
+def _post(url: str, body: bytes, timeout: float):
+    """(latency seconds, status, source) for one request; status 0 = connection error."""
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            data = json.loads(resp.read())
+            return time.perf_counter() - t0, resp.status, data.get("source")
+    except urllib.error.HTTPError as e:
+        e.read()
+        return time.perf_counter() - t0, e.code, None
+    except OSError:
+        return time.perf_counter() - t0, 0, None
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    k = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(k, len(sorted_values) - 1)]
+
+
+def summarize(results, elapsed: float) -> dict:
+    ok = sorted(lat for lat, status, _ in results if status == 200)
+    sources = {}
+    for _, status, src in results:
+        if status == 200:
+            sources[src] = sources.get(src, 0) + 1
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "rps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(ok, 50) * 1000,
+        "p95_ms": percentile(ok, 95) * 1000,
+        "p99_ms": percentile(ok, 99) * 1000,
+        "sources": sources,
+    }
+
+
+def run_endpoint(base: str, kind: str, corpus, args) -> dict:
+    """Runs every corpus position through one endpoint; returns {phase or 'all': summary}."""
+    url = base + ENDPOINTS[kind]
+    jobs = [(ph, _body(p, o, dice, kind, args.match_length)) for ph, p, o, dice in corpus] * args.rounds
+
+    for _, body in jobs[:args.warmup]:
+        _post(url, body, args.timeout)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        results = list(ex.map(lambda job: (job[0], *_post(url, job[1], args.timeout)), jobs))
+    elapsed = time.perf_counter() - started
+
+    out = {"all": summarize([r[1:] for r in results], elapsed)}
+    for ph in positions.PHASES:
+        rows = [r[1:] for r in results if r[0] == ph]
+        if rows:
+            # Phases share the run, so their rps is a share of the total, not a separate throughput.
+            out[ph] = summarize(rows, elapsed)
+    return out
+
+
+# --- SERVICE PER CONFIGURATION ---
+
+def _wait_ready(base: str, proc, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"service exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(base + "/engine/stats", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"service not ready after {timeout:.0f}s")
+
+
+def start_service(args, plies: int, workers, threads, pin: int):
+    env = dict(os.environ,
+               GNUBG_PLIES=str(plies),
+               GNUBG_POOL_SIZE=str(workers),
+               GNUBG_THREADS=str(threads),
+               GNUBG_PIN=str(pin),
+               GNUBG_RESULT_CACHE_MB="0",
+               GNUBG_RESULT_CACHE_DB="",
+               GNUBG_OPENING_TABLE="")
+    cmd = [sys.executable, "-m", "uvicorn", args.app, "--host", "127.0.0.1", "--port", str(args.port),
+           "--log-level", "warning"]
+    # The service prints a debug board per request; keep it out of the report.
+    proc = subprocess.Popen(cmd, cwd=str(HERE.parent), env=env, stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        _wait_ready(base, proc, args.start_timeout)
+    except Exception:
+        proc.kill()
+        proc.wait()
+        raise
+    return proc, base
+
+
+def stop_service(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# --- REPORT ---
+
+def print_rows(label: str, kind: str, summary: dict):
+    for name, s in summary.items():
+        print(f"{label:<22} {kind:<7} {name:<8} {s['ok']:>5}/{s['requests']:<5} {s['rps']:>8.2f} "
+              f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+
+
+def print_best(report):
+    """Per endpoint and plies: the configuration with the most throughput and the one with the lowest p99."""
+    print("\nbest per endpoint")
+    groups = {}
+    for run in report:
+        groups.setdefault((run["endpoint"], run["plies"]), []).append(run)
+    for (endpoint, plies), runs in groups.items():
+        runs = [r for r in runs if r["results"]["all"]["ok"]]
+        if not runs:
+            continue
+        fast = max(runs, key=lambda r: r["results"]["all"]["rps"])
+        tail = min(runs, key=lambda r: r["results"]["all"]["p99_ms"])
+        print(f"{endpoint:<22} p{plies}  rps: {fast['label']} ({fast['results']['all']['rps']:.2f})  "
+              f"p99: {tail['label']} ({tail['results']['all']['p99_ms']:.1f} ms)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="benchmark this running service instead of starting one per configuration")
+    ap.add_argument("--plies", type=_ints, default=[0, 1, 2, 3])
+    ap.add_argument("--threads", type=_autos, default=[1, 4, "auto"])
+    ap.add_argument("--workers", type=_autos, default=["auto"], help="GNUBG_POOL_SIZE values")
+    ap.add_argument("--pin", type=_ints, default=[0], help="GNUBG_PIN values (0,1)")
+    ap.add_argument("--endpoints", default="move,double", help="comma list of: " + ", ".join(ENDPOINTS))
+    ap.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    ap.add_argument("--positions", type=int, default=30, help="generated positions per phase")
+    ap.add_argument("--no-corpus", action="store_true", help="generated positions only")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--rounds", type=int, default=1, help="passes over the position set")
+    ap.add_argument("--warmup", type=int, default=4, help="untimed requests per endpoint")
+    ap.add_argument("--match-length", type=int, default=0)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--app", default="main:app", help="uvicorn app for started services")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--start-timeout", type=float, default=60.0)
+    ap.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args()
+
+    corpus = positions.load(args.positions, args.seed, corpus=not args.no_corpus)
+    kinds = [k.strip() for k in args.endpoints.split(",") if k.strip()]
+    counts = {ph: sum(1 for c in corpus if c[0] == ph) for ph in positions.PHASES}
+    print(f"{len(corpus)} positions {counts}, concurrency {args.concurrency}, rounds {args.rounds}")
+    print(f"{'config':<22} {'kind':<7} {'phase':<8} {'ok/sent':>11} {'rps':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+
+    report = []
+    if args.url:
+        configs = [(None, None, None, None)]
+    else:
+        configs = [(plies, workers, threads, pin) for plies in args.plies for workers in args.workers
+                   for threads in args.threads for pin in args.pin]
+
+    for plies, workers, threads, pin in configs:
+        if plies is None:
+            label, proc, base = "external", None, args.url.rstrip("/")
+        else:
+            label = f"p{plies} w{workers} t{threads}" + (" pin" if pin else "")
+            proc, base = start_service(args, plies, workers, threads, pin)
+        try:
+            for kind in kinds:
+                summary = run_endpoint(base, kind, corpus, args)
+                print_rows(label, kind, summary)
+                report.append({"label": label, "plies": plies, "workers": workers, "threads": threads, "pin": pin,
+                               "endpoint": ENDPOINTS[kind], "results": summary})
+        finally:
+            if proc is not None:
+                stop_service(proc)
+
+    if len(configs) > 1:
+        print_best(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "runs": report}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# bench_micro.py
+"""
+Micro-benchmarks for the per-request Python work around the engine:
+logic.get_ids, logic._expand_chain_token, logic._reduce_turn_path and
+logic.parse_output (on the recorded gnubg outputs in bench/outputs/).
+
+    python bench/bench_micro.py [--number N] [--positions N]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import logic  # noqa: E402
+import positions  # noqa: E402
+from models import MatchData  # noqa: E402
+
+OUTPUTS = HERE / "outputs"
+
+# Tokens as gnubg prints them: hits, chains through several points, bar/off, doubles.
+TOKENS = ["24/18", "13/11*", "bar/22", "8/5(2)", "24/20/16", "bar/20*/16", "6/off", "13/7*/1*", "6/2(4)"]
+MOVES = ["24/18 13/11", "bar/22 13/7*/1*", "8/5(2) 6/3(2)", "24/20/16 13/9", "6/off(2) 5/off(2)", "13/7* 7/1*"]
+
+
+def _per_call_us(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def _row(name: str, us: float, items: int):
+    print(f"{name:<26} {us:>10.2f} {us / items:>10.3f} {items:>6}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--number", type=int, default=2000, help="calls per measurement")
+    ap.add_argument("--positions", type=int, default=100, help="generated positions per phase for get_ids")
+    args = ap.parse_args()
+
+    match = MatchData(match_length=7, score_player=2, score_opponent=4, cube_value=2, cube_holder=1)
+    money = MatchData()
+    boards = positions.load(args.positions)
+    atomic = [logic.expand_move(m)[0] for m in MOVES]
+    recorded = [(p.stem, p.read_text()) for p in sorted(OUTPUTS.glob("*.txt")) if not p.name.endswith(".structured.txt")]
+
+    def get_ids_money():
+        for _, p, o, dice in boards:
+            logic.get_ids(p, o, money, dice, double_offered=False)
+
+    def get_ids_match():
+        for _, p, o, dice in boards:
+            logic.get_ids(p, o, match, dice, double_offered=False)
+
+    def expand_tokens():
+        for t in TOKENS:
+            logic._expand_chain_token(t)
+
+    def reduce_paths():
+        for a in atomic:
+            logic._reduce_turn_path(a)
+
+    n = max(args.number // 20, 1)  # get_ids loops over the whole position set
+    print(f"{'benchmark':<26} {'us/batch':>10} {'us/item':>10} {'items':>6}")
+    _row("get_ids (money)", _per_call_us(get_ids_money, n), len(boards))
+    _row("get_ids (match, cube)", _per_call_us(get_ids_match, n), len(boards))
+    _row("_expand_chain_token", _per_call_us(expand_tokens, args.number), len(TOKENS))
+    _row("_reduce_turn_path", _per_call_us(reduce_paths, args.number), len(atomic))
+    for name, raw in recorded:
+        cube = name.startswith("cube")
+        _row(f"parse_output {name}", _per_call_us(lambda: logic.parse_output(raw, receiving_double=cube), args.number), 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# bench_parse.py
+"""
+Text scraping (logic.parse_output) vs structured hints (logic.parse_structured
++ backends._result) on recorded gnubg outputs in bench/outputs/.
+
+    python bench/bench_parse.py [--number N]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import backends  # noqa: E402
+import logic  # noqa: E402
+
+OUTPUTS = HERE / "outputs"
+CASES = ["move_3ply", "move_3ply_top5", "cube_3ply"]
+
+
+def _text(raw: str):
+    return logic.parse_output(raw, receiving_double=False)
+
+
+def _structured(raw: str):
+    data = logic.parse_structured(raw)[0]
+    return backends._result(raw, False, data.get("candidates"), data.get("cube"))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--number", type=int, default=20000, help="calls per measurement")
+    args = ap.parse_args()
+
+    print(f"{'case':<18} {'text us':>9} {'struct us':>10} {'speedup':>8}")
+    for case in CASES:
+        text_raw = (OUTPUTS / f"{case}.txt").read_text()
+        struct_raw = (OUTPUTS / f"{case}.structured.txt").read_text()
+
+        # Both paths must agree before their timings mean anything.
+        t = _text(text_raw)
+        s = _structured(struct_raw)
+        assert (t[0], t[3]) == (s["move_raw"], s["cube_action"]), (case, t, s)
+
+        t_us = min(timeit.repeat(lambda: _text(text_raw), number=args.number, repeat=3)) / args.number * 1e6
+        s_us = min(timeit.repeat(lambda: _structured(struct_raw), number=args.number, repeat=3)) / args.number * 1e6
+        print(f"{case:<18} {t_us:>9.2f} {s_us:>10.2f} {t_us / s_us:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_wire.py
+"""
+HTTP/JSON versus the binary transport (wire.py) against one running
+service started with GNUBG_WIRE_PORT (or GNUBG_WIRE_SOCKET):
+
+    GNUBG_WIRE_PORT=5008 uvicorn main:app --port 8000
+    python bench/bench_wire.py --url http://127.0.0.1:8000 --wire 127.0.0.1:5008
+
+The same checker-play requests go through both: first one pass to fill the
+result cache, then --rounds timed passes, so the numbers are transport and
+request handling, not engine time. HTTP runs --concurrency connections;
+the wire client pipelines --pipeline requests per write on one connection.
+"""
+import argparse
+import json
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import positions  # noqa: E402
+import wire  # noqa: E402
+
+from bench_load import percentile  # noqa: E402
+
+
+def _http_body(p, o, dice) -> bytes:
+    return json.dumps({"board": {"player_board": p, "opponent_board": o}, "match": {}, "dice": dice}).encode("utf-8")
+
+
+def http_pass(url: str, bodies, concurrency: int):
+    def post(body):
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            resp.read()
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        return list(ex.map(post, bodies))
+
+
+def wire_pass(client: wire.WireClient, requests, pipeline: int):
+    """Latency per request = time for the batch it was pipelined in."""
+    out = []
+    for i in range(0, len(requests), pipeline):
+        chunk = requests[i:i + pipeline]
+        t0 = time.perf_counter()
+        answers = client.analyze_many(chunk)
+        dt = time.perf_counter() - t0
+        bad = [a for a in answers if a["status"] != "ok"]
+        if bad:
+            raise RuntimeError(f"wire request failed: {bad[0]}")
+        out.extend([dt] * len(chunk))
+    return out
+
+
+def report(name: str, latencies, elapsed: float):
+    lat = sorted(latencies)
+    print(f"{name:<6} {len(lat):>6} {len(lat) / elapsed:>9.0f} {percentile(lat, 50) * 1000:>9.2f} "
+          f"{percentile(lat, 99) * 1000:>9.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--wire", default="127.0.0.1:5008", help="host:port or Unix socket path")
+    ap.add_argument("--positions", type=int, default=30, help="generated positions per phase")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=8, help="HTTP requests in flight")
+    ap.add_argument("--pipeline", type=int, default=32, help="wire requests per write")
+    args = ap.parse_args()
+
+    corpus = positions.load(args.positions, args.seed)
+    bodies = [_http_body(p, o, dice) for _, p, o, dice in corpus]
+    requests = [dict(kind="move", boards=(p, o), match={"dice": dice}) for _, p, o, dice in corpus]
+    url = args.url.rstrip("/") + "/get-optimal-move"
+
+    with wire.WireClient(args.wire) as client:
+        http_pass(url, bodies, args.concurrency)  # warm the cache
+        print(f"{len(corpus)} positions x {args.rounds} rounds, answered from the result cache")
+        print(f"{'via':<6} {'reqs':>6} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+
+        t0 = time.perf_counter()
+        lat = [x for _ in range(args.rounds) for x in http_pass(url, bodies, args.concurrency)]
+        report("http", lat, time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        lat = [x for _ in range(args.rounds) for x in wire_pass(client, requests, args.pipeline)]
+        report("wire", lat, time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    main()
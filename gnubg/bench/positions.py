@@ -0,0 +1,125 @@
+# positions.py
+"""
+Benchmark positions: a fixed corpus plus a synthetic generator.
+
+The generator plays random legal games from the starting position
+(movegen.legal_moves / apply_move) and samples the positions it passes
+through, classified by phase:
+    contact  some checker still has to pass an enemy checker
+    race     no contact, not both sides home yet
+    bearoff  no contact, both sides have all remaining checkers home
+A fixed seed gives the same positions every run, so results compare.
+
+Each sample is (phase, player_board, opponent_board, dice) with the player
+on roll; dice always leave a real choice (forced moves never reach the engine).
+"""
+import random
+import sys
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import movegen  # noqa: E402
+
+PHASES = ("contact", "race", "bearoff")
+
+START = [0, 0, 0, 0, 0, 0, 5, 0, 3, 0, 0, 0, 0, 5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2]
+
+# (phase, player_board, opponent_board, dice): well-known spots, same perspective as BoardData.
+CORPUS = [
+    ("contact", START, START, [3, 1]),
+    ("contact", START, START, [6, 4]),
+    # Reply with 4-4 after the opponent opened 6-2 24/18 13/11.
+    ("contact",
+     [0, 0, 0, 0, 0, 0, 5, 0, 3, 0, 0, 0, 0, 5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2],
+     [0, 0, 0, 0, 0, 0, 5, 1, 3, 0, 0, 1, 0, 4, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+     [4, 4]),
+    # Back game: two anchors deep in the opponent's board.
+    ("contact",
+     [0, 0, 0, 0, 2, 0, 3, 2, 2, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 2, 0, 2, 0, 0],
+     [0, 2, 2, 0, 2, 0, 2, 3, 3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+     [5, 3]),
+    # Checker on the bar against a 4-point board.
+    ("contact",
+     [1, 2, 0, 0, 0, 3, 3, 0, 2, 0, 0, 0, 0, 3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0],
+     [0, 0, 0, 2, 2, 2, 3, 0, 3, 0, 0, 0, 0, 3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [5, 1]),
+    ("race",
+     [0, 0, 2, 2, 3, 2, 2, 2, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [0, 1, 2, 2, 2, 3, 2, 0, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [5, 2]),
+    ("race",
+     [0, 0, 0, 0, 0, 0, 0, 0, 3, 0, 3, 0, 3, 0, 3, 0, 0, 3, 0, 0, 0, 0, 0, 0, 0],
+     [0, 0, 2, 3, 3, 3, 2, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [6, 5]),
+    ("bearoff",
+     [0, 2, 2, 2, 3, 3, 3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [0, 3, 3, 3, 2, 2, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [4, 1]),
+    ("bearoff",
+     [0, 0, 1, 0, 2, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [0, 1, 1, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+     [3, 2]),
+]
+
+
+def _back(board: List[int]) -> int:
+    """Highest occupied point (bar = 25), 0 if everything is off."""
+    if board[0]:
+        return 25
+    return max((i for i in range(1, 25) if board[i]), default=0)
+
+
+def phase(p_board: List[int], o_board: List[int]) -> str:
+    # Our point i is the opponent's 25-i: contact while our back checker is above theirs.
+    p_back, o_back = _back(p_board), _back(o_board)
+    if p_back + o_back > 25:
+        return "contact"
+    if p_back <= 6 and o_back <= 6:
+        return "bearoff"
+    return "race"
+
+
+def _roll(rng: random.Random) -> List[int]:
+    return [rng.randint(1, 6), rng.randint(1, 6)]
+
+
+def random_positions(seed: int = 1) -> Iterator[Tuple[str, List[int], List[int], List[int]]]:
+    """Endless stream of positions from random games, player on roll."""
+    rng = random.Random(seed)
+    while True:
+        p, o = START[:], START[:]
+        while sum(p) and sum(o):
+            dice = _roll(rng)
+            plays = movegen.legal_moves(p, o, dice)
+            if len(plays) > 1:
+                yield phase(p, o), p[:], o[:], dice
+            if plays:
+                p, o = movegen.apply_move(p, o, rng.choice(plays))
+            p, o = o, p
+
+
+def generate(per_phase: int, seed: int = 1, skip: int = 3) -> list:
+    """per_phase positions of each phase; keeps every skip-th sample so one game does not dominate."""
+    want = {ph: per_phase for ph in PHASES}
+    out = []
+    if per_phase <= 0:
+        return out
+    for n, item in enumerate(random_positions(seed)):
+        if n % skip or not want[item[0]]:
+            continue
+        want[item[0]] -= 1
+        out.append(item)
+        if not any(want.values()):
+            break
+    return out
+
+
+def load(per_phase: int, seed: int = 1, corpus: bool = True) -> list:
+    return (list(CORPUS) if corpus else []) + generate(per_phase, seed)
+
+
+if __name__ == "__main__":
+    for ph, p, o, dice in load(3):
+        print(f"{ph:<8} {dice} p={p} o={o}")
@@ -0,0 +1,155 @@
+# build_opening.py
+"""
+Builds the precomputed analysis table loaded by the service (opening.py).
+
+    python build_opening.py build  [--out PATH] [--replies N] [--match-lengths 0,5,7]
+    python build_opening.py extend --requests saved.jsonl [...] [--top N] [--out PATH]
+
+build:  the 21 opening rolls, then for the best N opening plays of each roll
+        the opponent's cube decision and all 21 replies. Keys are canonical
+        (backends._key), so one entry serves both dice orders and both sides
+        of a double.
+extend: adds the most frequent positions of saved analysis requests (JSONL,
+        one HintRequest per line, or {"request": {...}} as in the service's
+        GNUBG_LOG_FILE) that the table does not cover yet.
+
+Runs the engine through backends.evaluate, i.e. at the service's settings
+(GNUBG_BACKEND, PLIES, GNUBG_HINT_MOVES); rebuild after changing them.
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations_with_replacement
+
+import backends
+import logic
+import movegen
+import opening
+from models import HintRequest, MatchData
+
+START = [0, 0, 0, 0, 0, 0, 5, 0, 3, 0, 0, 0, 0, 5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2]
+ROLLS = [[d1, d2] for d2, d1 in combinations_with_replacement(range(1, 7), 2)]  # 21 rolls, larger die first
+
+
+def _digest(job) -> bytes:
+    pid, mid, kind, _ = job
+    return opening.digest(backends._key(pid, mid, kind))
+
+
+def _stored_form(res: dict) -> dict:
+    return {k: v for k, v in res.items() if k not in ("raw", "cached")}
+
+
+def _evaluate(jobs, workers: int) -> dict:
+    """jobs: (pid, mid, kind, receiving_double) -> {digest: result}, evaluated in parallel."""
+    jobs = list(dict.fromkeys(jobs))
+    out = {}
+
+    def run(job):
+        pid, mid, kind, rd = job
+        return job, backends.evaluate(pid, mid, kind, rd)
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for n, (job, res) in enumerate(ex.map(run, jobs), 1):
+            out[_digest(job)] = _stored_form(res)
+            if n % 50 == 0 or n == len(jobs):
+                print(f"  {n}/{len(jobs)}")
+    return out
+
+
+def _move_jobs(p_board, o_board, match):
+    """Move jobs for every roll that leaves a real choice (forced moves never reach the engine)."""
+    jobs = []
+    for dice in ROLLS:
+        if len(movegen.legal_moves(p_board, o_board, dice, limit=2)) > 1:
+            pid, mid = logic.get_ids(p_board, o_board, match, dice, double_offered=False)
+            jobs.append((pid, mid, "move", False))
+    return jobs
+
+
+def build(args) -> dict:
+    entries = {}
+    for length in args.match_lengths:
+        match = MatchData(match_length=length)
+        print(f"match length {length}: openings")
+        openings = _move_jobs(START, START, match)
+        openings.append((*logic.get_cube_ids(START, START, match, False), "cube", False))
+        entries.update(_evaluate(openings, args.workers))
+
+        # Reply positions: the opponent is on roll after our opening play (0-0, cube centred: no swap needed).
+        replies = []
+        for job in openings[:-1]:
+            res = entries[_digest(job)]
+            for cand in res["candidates"][:args.replies]:
+                p, o = movegen.apply_move(START, START, cand["reduced"])
+                replies.append((*logic.get_cube_ids(o, p, match, False), "cube", False))
+                replies += _move_jobs(o, p, match)
+        print(f"match length {length}: {len(replies)} reply positions")
+        entries.update(_evaluate(replies, args.workers))
+    return entries
+
+
+def _saved_requests(paths):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                    yield HintRequest.model_validate(data.get("request", data))
+                except ValueError:
+                    continue
+
+
+def extend(args) -> dict:
+    table = opening.load(args.out)
+    entries = dict(table.items()) if table is not None else {}
+
+    counts = Counter()
+    for req in _saved_requests(args.requests):
+        if req.double_offered or not any(req.dice) or len(
+                movegen.legal_moves(req.board.player_board, req.board.opponent_board, req.dice, limit=2)) > 1:
+            counts[logic.request_ids(req)] += 1
+
+    missing = [job for job, _ in counts.most_common() if _digest(job) not in entries]
+    print(f"{sum(counts.values())} requests, {len(counts)} positions, {len(missing)} not in the table")
+    entries.update(_evaluate(missing[:args.top], args.workers))
+    return entries
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("build", help="openings and replies")
+    b.add_argument("--replies", type=int, default=1, help="opening plays per roll to expand replies for")
+    b.add_argument("--match-lengths", type=lambda s: [int(x) for x in s.split(",")], default=[0])
+
+    e = sub.add_parser("extend", help="add frequent positions from saved requests")
+    e.add_argument("--requests", nargs="+", required=True, help="JSONL files of HintRequest bodies")
+    e.add_argument("--top", type=int, default=1000, help="most frequent missing positions to add")
+
+    for p in (b, e):
+        p.add_argument("--out", default=logic.OPENING_TABLE)
+        p.add_argument("--workers", type=int, default=max(logic.POOL_SIZE, 1))
+    args = ap.parse_args()
+
+    started = time.time()
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    entries = build(args) if args.cmd == "build" else extend(args)
+    opening.write_table(args.out, entries, {
+        "plies": logic.PLIES,
+        "hint_moves": logic.HINT_MOVES,
+        "backend": logic.ENGINE_BACKEND,
+        "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    print(f"{len(entries)} positions -> {args.out} ({time.time() - started:.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
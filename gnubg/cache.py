@@ -0,0 +1,163 @@
+# cache.py
+import base64
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def _b64(s: str) -> bytes:
+    return base64.b64decode(s + "=" * (-len(s) % 4))
+
+
+def make_key(pid: str, mid: str, profile: str) -> bytes:
+    """10-byte position ID + 9-byte match ID + eval profile (e.g. 'move/p3')."""
+    return _b64(pid) + _b64(mid) + profile.encode("ascii")
+
+
+class EvalCache:
+    """
+    LRU of engine results with a byte budget and an optional SQLite tier.
+    Values are stored JSON-encoded: the size is exact and hits hand out
+    fresh dicts, so callers cannot mutate what is cached.
+    """
+
+    def __init__(self, max_bytes: int, db_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self._mem: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB NOT NULL)")
+            self._db.commit()
+
+    # --- memory tier ---
+
+    def _mem_put(self, key: bytes, blob: bytes):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._bytes -= len(key) + len(old)
+        self._mem[key] = blob
+        self._bytes += len(key) + len(blob)
+
+        while self._bytes > self.max_bytes and self._mem:
+            k, v = self._mem.popitem(last=False)
+            self._bytes -= len(k) + len(v)
+            self.evictions += 1
+
+    # --- public API ---
+
+    def get(self, key: bytes, count: bool = True) -> Optional[dict]:
+        """count=False: a probe that leaves the hit/miss counters alone."""
+        with self._lock:
+            blob = self._mem.get(key)
+            if blob is not None:
+                self._mem.move_to_end(key)
+                self.hits += count
+                return json.loads(blob)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    blob = bytes(row[0])
+                    self._mem_put(key, blob)
+                    self.hits += count
+                    self.disk_hits += count
+                    return json.loads(blob)
+
+            self.misses += count
+            return None
+
+    def put(self, key: bytes, value: dict):
+        blob = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self._mem_put(key, blob)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, blob))
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._mem),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "disk": self.db_path,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class KeyStats:
+    """
+    Hit rate of canonical keys next to the one raw keys would have had. A
+    hit is a raw hit too only if an entry was stored under its raw key (the
+    request's own IDs) that would answer it: `size` at least the one asked
+    for (top_n of a move entry). A raw miss is followed by an evaluation
+    stored under the raw key (`fill`), as it would have been with raw keys.
+    Raw keys of stored entries live in a bounded LRU, so raw entries older
+    than max_keys stores count as evicted.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._stored: "OrderedDict[bytes, int]" = OrderedDict()  # raw key -> size stored
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.raw_hits = 0
+
+    def lookup(self, raw: bytes, hit: bool, size: int = 0, fill: int = 0):
+        with self._lock:
+            self.lookups += 1
+            self.hits += hit
+            stored = self._stored.get(raw)
+            if stored is not None and stored >= size:
+                self._stored.move_to_end(raw)
+                self.raw_hits += hit
+            else:
+                self._store(raw, max(fill, size))
+
+    def stored(self, raw: bytes, size: int = 0):
+        with self._lock:
+            self._store(raw, size)
+
+    def _store(self, raw: bytes, size: int):
+        self._stored[raw] = max(size, self._stored.get(raw, 0))
+        self._stored.move_to_end(raw)
+        if len(self._stored) > self.max_keys:
+            self._stored.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self.lookups
+            return {
+                "lookups": n,
+                "hits": self.hits,
+                "raw_hits": self.raw_hits,
+                "canonical_hits": self.hits - self.raw_hits,
+                "hit_rate": (self.hits / n) if n else 0.0,
+                "raw_hit_rate": (self.raw_hits / n) if n else 0.0,
+            }
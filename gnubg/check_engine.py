@@ -0,0 +1,98 @@
+# check_engine.py
+"""
+Checks engine.py's single-flight sharing without gnubg:
+
+    python check_engine.py
+
+backends.lookup / backends.evaluate are replaced by an in-process stand-in
+that takes EVAL_SECONDS per evaluation and stops like a pooled job when
+pool.ABORT is set or its timeout runs out. Each case prints one line; the
+process exits non-zero if any fails.
+
+mixed deadline: a deadline_ms request starts a run that its deadline will
+    abort; a plain request for the same position (dice reversed, so the
+    same canonical key) arrives meanwhile. The plain one must get its answer
+    rather than the other request's abort.
+same key: two plain requests for the same position share one run.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backends  # noqa: E402
+import engine  # noqa: E402
+import logic  # noqa: E402
+import pool  # noqa: E402
+from models import MatchData  # noqa: E402
+
+EVAL_SECONDS = 1.5
+START = [0, 0, 0, 0, 0, 0, 5, 0, 3, 0, 0, 0, 0, 5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2]
+
+runs = []
+
+
+def _lookup(pid, mid, kind, receiving_double, plies=None, top_n=1, count=True):
+    return None
+
+
+def _evaluate(pid, mid, kind, receiving_double, plies=None, timeout=None, top_n=1):
+    runs.append(mid)
+    abort = pool.ABORT.get()
+    end = time.monotonic() + EVAL_SECONDS
+    limit = time.monotonic() + timeout if timeout else end
+    while time.monotonic() < end:
+        if abort is not None and abort.is_set():
+            raise backends.EngineError("ERROR: job cancelled")
+        if time.monotonic() >= limit:
+            raise backends.EngineError(f"ERROR: timed out after {timeout:.1f}s")
+        time.sleep(0.01)
+    return {"move_raw": "24/18 13/11", "atomic": [], "reduced": [], "cube_action": "no_double",
+            "cube_text": "No Double", "candidates": [], "ply": plies, "raw": None}
+
+
+async def _outcome(coro):
+    try:
+        res = await coro
+    except backends.EngineError as e:
+        return f"error: {e}"
+    return f"ok ({res.get('source', 'engine')})"
+
+
+async def mixed_deadline(pid, mid_a, mid_b):
+    bounded = asyncio.ensure_future(_outcome(engine.analyze(pid, mid_a, "move", False, deadline_ms=200)))
+    await asyncio.sleep(0.1)
+    plain = await _outcome(engine.analyze(pid, mid_b, "move", False))
+    return plain.startswith("ok"), f"deadline request: {await bounded}; plain request: {plain}"
+
+
+async def same_key(pid, mid_a, mid_b):
+    del runs[:]
+    out = await asyncio.gather(_outcome(engine.analyze(pid, mid_a, "move", False)),
+                               _outcome(engine.analyze(pid, mid_b, "move", False)))
+    return len(runs) == 1 and all(o.startswith("ok") for o in out), f"{out}, {len(runs)} engine run(s)"
+
+
+async def main():
+    backends.lookup = _lookup
+    backends.evaluate = _evaluate
+    logic.PLIES = 0
+    engine._engine = engine.AsyncEngine(4, 8)
+
+    match = MatchData()
+    pid, mid_a = logic.get_ids(START, START, match, [6, 2], double_offered=False)
+    _, mid_b = logic.get_ids(START, START, match, [2, 6], double_offered=False)
+
+    failures = 0
+    for name, case in (("mixed deadline", mixed_deadline), ("same key", same_key)):
+        ok, detail = await case(pid, mid_a, mid_b)
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+    print(f"check_engine: {failures} failed")
+    sys.stdout.flush()
+    os._exit(1 if failures else 0)
+
+
+asyncio.run(main())
@@ -0,0 +1,103 @@
+# check_ids.py
+"""
+Cross-checks ids.py against gnubg's own encoders. Runs INSIDE gnubg's
+embedded Python, from this directory:
+
+    gnubg -t -q -p check_ids.py
+
+Random boards that pass gnubg's CheckPosition go through gnubg.positionid /
+positionfromid, random match states through gnubg.matchid; any mismatch is
+printed and the process exits non-zero.
+"""
+import os
+import random
+import sys
+
+import gnubg
+
+sys.path.insert(0, os.getcwd())  # gnubg exec()s the script without __file__
+import ids
+
+ROUNDS = int(os.environ.get("CHECK_IDS_ROUNDS", "2000"))
+
+
+def _random_position():
+    """(p, o) with at most 15 checkers each and no point held by both sides."""
+    p, o = [0] * 25, [0] * 25
+    for _ in range(random.randint(0, 15)):
+        p[random.randint(0, 24)] += 1
+    free = [i for i in range(25) if i == 0 or not p[25 - i]]  # opponent point i = our 25 - i
+    for _ in range(random.randint(0, 15)):
+        o[random.choice(free)] += 1
+    return p, o
+
+
+def _to_gnubg(arr):
+    """BoardData side (0 = bar, 1-24) -> gnubg side (0-23 = points, 24 = bar)."""
+    return tuple(arr[1:25]) + (arr[0],)
+
+
+def _from_gnubg(side):
+    side = list(side)
+    return [side[24]] + side[:24]
+
+
+def check_positions(failures):
+    for _ in range(ROUNDS):
+        p, o = _random_position()
+        ours = ids.encode_position_id(p, o)
+        theirs = gnubg.positionid((_to_gnubg(o), _to_gnubg(p)))
+        if ours != theirs:
+            failures.append(f"positionid {p} {o}: {ours} != {theirs}")
+            continue
+        g_o, g_p = gnubg.positionfromid(theirs)
+        if ids.decode_position_id(ours) != (_from_gnubg(g_p), _from_gnubg(g_o)):
+            failures.append(f"positionfromid {ours}")
+
+
+def check_matches(failures):
+    for _ in range(ROUNDS):
+        length = random.choice([0, random.randint(1, 25)])
+        score = [random.randint(0, length - 1), random.randint(0, length - 1)] if length else [0, 0]
+        owner = random.choice([-1, 0, 1])
+        f = {
+            "cube_log2": random.randint(0, 6),
+            "cube_owner": owner & 0x3,
+            "move": random.randint(0, 1),
+            "crawford": random.randint(0, 1) if length else 0,
+            "game_state": 1,
+            "turn": random.randint(0, 1),
+            "doubled": random.randint(0, 1),
+            "resigned": random.randint(0, 3),
+            "match_length": length,
+            "score0": score[0],
+            "score1": score[1],
+            "no_jacoby": random.randint(0, 1),
+        }
+        # gnubg always writes the larger die first.
+        f["die1"], f["die2"] = sorted((random.randint(0, 6), random.randint(0, 6)), reverse=True)
+
+        ours = ids.encode_match_id(f)
+        cube_info = gnubg.cubeinfo(1 << f["cube_log2"], owner, f["move"], length, tuple(score),
+                                   f["crawford"], 1 - f["no_jacoby"], 0)
+        pos_info = gnubg.posinfo(f["turn"], f["resigned"], f["doubled"], f["game_state"],
+                                 (f["die1"], f["die2"]))
+        theirs = gnubg.matchid(cube_info, pos_info)
+        if ours != theirs:
+            failures.append(f"matchid {f}: {ours} != {theirs}")
+        elif ids.decode_match_id(ours) != f:
+            failures.append(f"decode_match_id {ours}")
+
+
+def main():
+    failures = []
+    check_positions(failures)
+    check_matches(failures)
+    for line in failures[:20]:
+        print(line)
+    print(f"check_ids: {2 * ROUNDS} cases, {len(failures)} mismatches")
+    sys.stdout.flush()
+    os._exit(1 if failures else 0)
+
+
+main()
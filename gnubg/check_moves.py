@@ -0,0 +1,70 @@
+# check_moves.py
+"""
+Cross-checks movegen.format_move against gnubg's own move notation. Runs
+INSIDE gnubg's embedded Python, from this directory:
+
+    gnubg -t -q -p check_moves.py
+
+Every legal play (movegen.legal_moves) of random positions and rolls is
+formatted by both: gnubg.movetupletostring goes through FormatMove, the same
+function that writes the moves in `hint` output, so a forced move the
+service answers itself must read exactly like the engine's. Positions with
+a forced move are counted separately. Any mismatch is printed and the
+process exits non-zero.
+"""
+import os
+import random
+import sys
+
+import gnubg
+
+sys.path.insert(0, os.getcwd())  # gnubg exec()s the script without __file__
+import movegen
+
+ROUNDS = int(os.environ.get("CHECK_MOVES_ROUNDS", "2000"))
+
+
+def _random_position():
+    """(p, o) with 15 checkers each (some on the bar) and no point held by both sides."""
+    p, o = [0] * 25, [0] * 25
+    for _ in range(15):
+        p[0 if random.random() < 0.03 else random.randint(1, 24)] += 1
+    free = [i for i in range(25) if i == 0 or not p[25 - i]]  # opponent point i = our 25 - i
+    for _ in range(15):
+        o[0 if random.random() < 0.03 else random.choice(free)] += 1
+    return p, o
+
+
+def _to_gnubg(arr):
+    """BoardData side (0 = bar, 1-24) -> gnubg side (0-23 = points, 24 = bar)."""
+    return tuple(arr[1:25]) + (arr[0],)
+
+
+def _move_tuple(play):
+    """movegen steps -> gnubg move tuple: 1-based points, 25 = bar, 0 = off."""
+    return tuple(pt for step in play for pt in step)
+
+
+def main():
+    failures = []
+    plays_checked = forced = 0
+    for _ in range(ROUNDS):
+        p, o = _random_position()
+        dice = [random.randint(1, 6), random.randint(1, 6)]
+        plays = movegen.legal_moves(p, o, dice)
+        forced += len(plays) == 1
+        board = (_to_gnubg(o), _to_gnubg(p))
+        for play in plays:
+            plays_checked += 1
+            ours = movegen.format_move(p, o, play)
+            theirs = gnubg.movetupletostring(_move_tuple(play), board)
+            if ours != theirs:
+                failures.append(f"{p} {o} {dice} {play}: {ours!r} != {theirs!r}")
+    for line in failures[:20]:
+        print(line)
+    print(f"check_moves: {plays_checked} plays ({forced} forced), {len(failures)} mismatches")
+    sys.stdout.flush()
+    os._exit(1 if failures else 0)
+
+
+main()
@@ -0,0 +1,290 @@
+# engine.py
+import asyncio
+import contextvars
+import functools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backends
+import logic
+import metrics
+import pool
+import tracing
+
+
+class EngineBusy(Exception):
+    """Wait queue is full; the caller should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int, reason: str = "engine busy"):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExpired(EngineBusy):
+    """The caller's deadline passed while the job was still queued; it was dropped without running."""
+
+
+class AsyncEngine:
+    """
+    asyncio front for the blocking backends.
+    At most `concurrency` engine jobs run at once (each on its own thread),
+    at most `max_queue` callers wait for a slot; anyone beyond that gets
+    EngineBusy immediately instead of piling up more 3-ply jobs.
+    """
+
+    def __init__(self, concurrency: int, max_queue: int):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._sem = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="engine")
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.expired = 0    # dropped from the queue, deadline already passed
+        self.aborted = 0    # stopped while running (deadline or every caller gone)
+        self._avg_job = 1.0  # EWMA of job duration, seconds
+        self._flights = {}  # key -> task of the run identical callers are waiting on
+        self._waiters = {}  # run task -> callers still waiting on it
+
+    def retry_after(self) -> int:
+        rounds = (self.waiting + self.running) / self.concurrency
+        return max(1, math.ceil(rounds * self._avg_job))
+
+    async def run(self, fn, *args, bounded: bool = True, deadline: float = None):
+        """
+        Runs fn(*args) on an engine thread once a slot is free.
+        bounded=False skips the queue limit (callers that meter themselves, e.g. batches).
+        deadline (time.monotonic()) drops the job if it is still queued by then
+        and aborts it (pool.ABORT) if it is still running; so does cancelling
+        the caller. The slot is held until the engine thread has let go.
+        """
+        if bounded and self._sem.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise EngineBusy(self.retry_after())
+
+        self.waiting += 1
+        queued = time.perf_counter()
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+            tracing.record("queue_wait", queued, time.perf_counter())
+
+        if deadline is not None and time.monotonic() >= deadline:
+            self._sem.release()
+            self.expired += 1
+            metrics.CANCELLED.inc(reason="expired")
+            tracing.annotate(cancelled="expired")
+            raise DeadlineExpired(self.retry_after(), "deadline passed while queued")
+
+        self.running += 1
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        abort = threading.Event()
+        # Fewer threads per job the more jobs share the CPUs (scheduler.py).
+        threads = logic.SCHEDULER.threads(self.running + self.waiting)
+        tracing.annotate(threads=threads)
+        ctx = contextvars.copy_context()  # carries the request's trace onto the engine thread
+        ctx.run(pool.ABORT.set, abort)
+        ctx.run(pool.JOB_THREADS.set, threads)
+        job = asyncio.wrap_future(self._executor.submit(ctx.run, functools.partial(fn, *args)))
+        timer = None
+        if deadline is not None:
+            timer = loop.call_later(deadline - time.monotonic(), self._abort, abort, "deadline")
+        try:
+            return await asyncio.shield(job)
+        except asyncio.CancelledError:
+            self._abort(abort, "abandoned")
+            await asyncio.wait([job])
+            if not job.cancelled():
+                job.exception()  # the job's own error is moot, its caller is gone
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._avg_job = 0.8 * self._avg_job + 0.2 * (time.monotonic() - start)
+            self.running -= 1
+            self._sem.release()
+
+    def _abort(self, abort: threading.Event, reason: str):
+        if not abort.is_set():
+            abort.set()
+            self.aborted += 1
+            metrics.CANCELLED.inc(reason=reason)
+
+    async def run_shared(self, key: tuple, fn, *args, bounded: bool = True, timeout: float = None,
+                         deadline: float = None):
+        """
+        run(fn, *args), once per key at a time: callers arriving while a run for
+        the same key is in flight wait for that run instead of starting another
+        (and get a copy of its result with source "coalesced"). One caller going
+        away does not cancel the run for the others; the last one does.
+        timeout bounds how long a joining caller waits (EngineError after);
+        deadline is the starting caller's, passed to run(). Runs with and
+        without a deadline are never shared: a caller without one must not
+        inherit somebody else's abort.
+        """
+        key = key + (deadline is not None,)
+        task = self._flights.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(self.run(fn, *args, bounded=bounded, deadline=deadline))
+            self._flights[key] = task
+            task.add_done_callback(functools.partial(self._landed, key))
+        else:
+            self.coalesced += 1
+            metrics.COALESCED.inc(kind=key[0])
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            if leader:
+                return await asyncio.shield(task)
+            try:
+                with tracing.span("coalesced"):
+                    res = await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                raise backends.EngineError(f"ERROR: identical run still going after {timeout:.1f}s")
+            return dict(res, source="coalesced")
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()  # nobody is waiting for the answer any more
+
+    def _landed(self, key: tuple, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every caller has gone
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "in_flight": len(self._flights),
+            "coalesced": self.coalesced,
+            "expired": self.expired,
+            "aborted": self.aborted,
+            "scheduler": logic.SCHEDULER.stats(),
+            "avg_job_seconds": round(self._avg_job, 3),
+        }
+
+
+_engine = None
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        _engine = AsyncEngine(logic.ENGINE_CONCURRENCY, logic.ENGINE_QUEUE)
+    return _engine
+
+
+# --- ASYNC ENTRY POINTS (cache first, engine slot only on a miss) ---
+
+# Rough cost ratio between consecutive plies; the next ply is not started
+# when last_ply_time * DEEPENING_GROWTH would overrun the deadline.
+DEEPENING_GROWTH = 8.0
+
+# The first (0-ply) pass always gets at least this long, even past the deadline.
+MIN_FIRST_PASS = 1.0
+
+
+def _flight_key(kind: str, pid: str, mid: str, plies: int = None, top_n: int = 1) -> tuple:
+    """
+    Everything an engine run depends on; identical concurrent runs share one
+    (AsyncEngine.run_shared). Built on the cache key (backends._key), so runs
+    that would fill the same entry coalesce: cube runs are side-neutral and
+    analyze() classifies the result for each caller.
+    """
+    return kind, backends._key(pid, mid, kind, plies), 0 if kind == "cube" else max(top_n, logic.HINT_MOVES)
+
+
+def _full_flight_key(pid: str, cube_mid: str, move_mid: str, plies: int = None, top_n: int = 1) -> tuple:
+    return ("full", backends._key(pid, cube_mid, "cube", plies),
+            backends._key(pid, move_mid, "move", plies), max(top_n, logic.HINT_MOVES))
+
+
+async def _deepen(lookup_fn, eval_fn, key_fn, deadline_ms: int) -> dict:
+    """
+    Iterative deepening against a deadline: 0, 1, ... PLIES ply, returning the
+    deepest result that finished in time (result["ply"] says which).
+    lookup_fn(plies, count=...) is the stored-result probe, key_fn(plies)
+    the single-flight key of a pass.
+    """
+    deadline = time.monotonic() + deadline_ms / 1000.0
+    best = None
+    start_ply = 0
+
+    # Deepest cached result first; a full-depth hit ends the search. Only the
+    # full-depth probe counts in the cache statistics: one lookup per request.
+    for plies in range(logic.PLIES, -1, -1):
+        hit = lookup_fn(plies, count=plies == logic.PLIES)
+        if hit is not None:
+            hit.setdefault("ply", plies)
+            if plies == logic.PLIES:
+                return hit
+            best, start_ply = hit, plies + 1
+            break
+
+    last_cost = None
+    for plies in range(start_ply, logic.PLIES + 1):
+        remaining = deadline - time.monotonic()
+        if best is None:
+            remaining = max(remaining, MIN_FIRST_PASS)
+        elif remaining <= 0 or (last_cost is not None and last_cost * DEEPENING_GROWTH > remaining):
+            break
+
+        t0 = time.monotonic()
+        try:
+            best = await get_engine().run_shared(key_fn(plies), eval_fn, plies, remaining, timeout=remaining,
+                                                 deadline=t0 + remaining)
+        except (backends.EngineError, DeadlineExpired):
+            if best is None:
+                raise
+            break  # ran out of time at this depth, keep the shallower answer
+        last_cost = time.monotonic() - t0
+
+    return best
+
+
+async def analyze(pid: str, mid: str, kind: str, receiving_double: bool,
+                  bounded: bool = True, deadline_ms: int = None, top_n: int = 1) -> dict:
+    if deadline_ms:
+        res = await _deepen(
+            functools.partial(backends.lookup, pid, mid, kind, receiving_double, top_n=top_n),
+            functools.partial(backends.evaluate, pid, mid, kind, receiving_double, top_n=top_n),
+            lambda plies: _flight_key(kind, pid, mid, plies, top_n),
+            deadline_ms,
+        )
+    else:
+        res = backends.lookup(pid, mid, kind, receiving_double, top_n=top_n)
+        if res is not None:
+            return res
+        evaluate = functools.partial(backends.evaluate, pid, mid, kind, receiving_double, top_n=top_n)
+        res = await get_engine().run_shared(_flight_key(kind, pid, mid, top_n=top_n), evaluate, bounded=bounded)
+    # A shared run may have been started by the other side of the double.
+    return backends.for_side(res, receiving_double) if kind == "cube" else res
+
+
+async def analyze_full(pid: str, cube_mid: str, move_mid: str, deadline_ms: int = None, top_n: int = 1) -> dict:
+    if deadline_ms:
+        return await _deepen(
+            functools.partial(backends.lookup_full, pid, cube_mid, move_mid, top_n=top_n),
+            functools.partial(backends.evaluate_full, pid, cube_mid, move_mid, top_n=top_n),
+            lambda plies: _full_flight_key(pid, cube_mid, move_mid, plies, top_n),
+            deadline_ms,
+        )
+
+    res = backends.lookup_full(pid, cube_mid, move_mid, top_n=top_n)
+    if res is not None:
+        return res
+    evaluate = functools.partial(backends.evaluate_full, pid, cube_mid, move_mid, top_n=top_n)
+    return await get_engine().run_shared(_full_flight_key(pid, cube_mid, move_mid, top_n=top_n), evaluate)
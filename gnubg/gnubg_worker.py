@@ -0,0 +1,121 @@
+# gnubg_worker.py
+"""
+Runs INSIDE gnubg's embedded Python:  gnubg -t -q -p gnubg_worker.py
+
+Reads one JSON request per line on stdin and answers with one JSON line
+{"id": ..., "ok": bool, "result"|"error": ...} on stdout. gnubg's own
+console output is redirected to /dev/null so it cannot corrupt the protocol.
+"""
+import json
+import os
+import sys
+
+import gnubg
+
+# Keep a private handle on the real stdout, then silence fd 1 for gnubg.
+_proto = os.fdopen(os.dup(1), "w", buffering=1, encoding="utf-8")
+_devnull = os.open(os.devnull, os.O_WRONLY)
+os.dup2(_devnull, 1)
+
+
+def _reply(req_id, ok: bool, payload):
+    key = "result" if ok else "error"
+    _proto.write(json.dumps({"id": req_id, "ok": ok, key: payload}) + "\n")
+    _proto.flush()
+
+
+# --- OPERATIONS ---
+
+def op_init(req):
+    for cmd in req.get("commands", []):
+        gnubg.command(cmd)
+    return {"pid": os.getpid()}
+
+
+def _setup(req, match_id: str):
+    plies = req.get("plies", 3)
+    gnubg.command(f"set evaluation chequerplay evaluation plies {plies}")
+    gnubg.command(f"set evaluation cubedecision evaluation plies {plies}")
+    gnubg.command(f"set matchid {match_id}")
+    gnubg.command(f"set board {req['pos_id']}")
+
+
+def _candidates(hint: dict):
+    out = []
+    for h in hint.get("hint", []):
+        details = h.get("details") or {}
+        out.append({
+            "move": h.get("move"),
+            "equity": h.get("equity"),
+            "eqdiff": h.get("eqdiff"),
+            "probs": list(details.get("probs", ())),
+        })
+    return out
+
+
+def _cube():
+    optimal, no_double, take, drop, decision, text = gnubg.cfevaluate()
+    return {
+        "optimal": optimal,
+        "no_double": no_double,
+        "double_take": take,
+        "double_pass": drop,
+        "decision": decision,
+        "recommendation": text,
+    }
+
+
+def op_hint(req):
+    """Move ranking for kind="move", cubeful cube equities for kind="cube"."""
+    kind = req.get("kind", "move")
+    _setup(req, req["match_id"])
+    if kind == "move":
+        return {"type": "move", "candidates": _candidates(gnubg.hint(req.get("max_moves", 1)))}
+    return {"type": "cube", "cube": _cube()}
+
+
+def op_full(req):
+    """Cube decision before the roll (cube_match_id), then the move for the rolled dice (match_id)."""
+    _setup(req, req["cube_match_id"])
+    cube = _cube()
+    _setup(req, req["match_id"])
+    return {"type": "full", "cube": cube, "candidates": _candidates(gnubg.hint(req.get("max_moves", 1)))}
+
+
+OPS = {
+    "init": op_init,
+    "hint": op_hint,
+    "full": op_full,
+}
+
+
+def main():
+    # pool.GnubgWorker._interrupt cancels a job with SIGINT: the request gets an
+    # error reply and the worker stays warm for the next one.
+    while True:
+        try:
+            line = sys.stdin.readline()
+        except KeyboardInterrupt:  # arrived after its request had already been answered
+            continue
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except ValueError:
+            continue
+
+        op = req.get("op")
+        if op == "exit":
+            break
+        try:
+            _reply(req.get("id"), True, OPS[op](req))
+        except KeyboardInterrupt:
+            _reply(req.get("id"), False, "interrupted")
+        except Exception as e:
+            _reply(req.get("id"), False, f"{type(e).__name__}: {e}")
+
+
+main()
@@ -0,0 +1,163 @@
+# ids.py
+"""
+gnubg position and match IDs on plain ints and bytes.
+
+Position ID: 80-bit key, for each side (player NOT on roll first) points
+1-24 then the bar, one '1' bit per checker followed by a '0' bit; bits are
+little-endian within each byte, 10 bytes, base64 without padding.
+Match ID: 67-bit key laid out as in gnubg's matchid.c, 9 bytes, base64.
+
+The *_ids functions encode many positions at once with NumPy when it is
+installed and fall back to the scalar encoder otherwise.
+"""
+import base64
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional, only used by the batch encoders
+    np = None
+
+POSITION_BYTES = 10
+MATCH_BYTES = 9
+_POSITION_MASK = (1 << (8 * POSITION_BYTES)) - 1
+
+# (field, width) in bit order, see MatchID() in gnubg_engine/matchid.c
+MATCH_FIELDS: Tuple[Tuple[str, int], ...] = (
+    ("cube_log2", 4),
+    ("cube_owner", 2),    # 0 / 1 = player, 3 = centred
+    ("move", 1),          # player on roll
+    ("crawford", 1),
+    ("game_state", 3),    # 1 = playing
+    ("turn", 1),          # player to act
+    ("doubled", 1),
+    ("resigned", 2),
+    ("die1", 3),
+    ("die2", 3),
+    ("match_length", 15),  # 0 = money game
+    ("score0", 15),
+    ("score1", 15),
+    ("no_jacoby", 1),
+)
+
+
+def _b64encode(key: bytes) -> str:
+    return base64.b64encode(key).decode("ascii").rstrip("=")
+
+
+def _b64decode(s: str) -> bytes:
+    return base64.b64decode(s + "=" * (-len(s) % 4))
+
+
+# --- 1. POSITION ID ---
+
+def _side_bits(arr: Sequence[int], key: int, pos: int) -> Tuple[int, int]:
+    """Appends one side (points 1-24, then bar = arr[0]) to key at bit pos."""
+    for i in (*range(1, 25), 0):
+        n = arr[i]
+        key |= ((1 << n) - 1) << pos
+        pos += n + 1
+    return key, pos
+
+
+def position_key(p_board: Sequence[int], o_board: Sequence[int]) -> bytes:
+    """10-byte position key; p_board is the player on roll."""
+    key, pos = _side_bits(o_board, 0, 0)
+    key, _ = _side_bits(p_board, key, pos)
+    return (key & _POSITION_MASK).to_bytes(POSITION_BYTES, "little")
+
+
+def encode_position_id(p_board: Sequence[int], o_board: Sequence[int]) -> str:
+    return _b64encode(position_key(p_board, o_board))
+
+
+def decode_position_id(pid: str) -> Tuple[List[int], List[int]]:
+    """(p_board, o_board) in the BoardData layout (index 0 = bar)."""
+    key = int.from_bytes(_b64decode(pid), "little")
+    sides = ([0] * 25, [0] * 25)
+    slot = 0  # 0..49: opponent points 1-24 + bar, then ours
+    for _ in range(8 * POSITION_BYTES):
+        if slot >= 50:
+            break
+        side, i = divmod(slot, 25)
+        if key & 1:
+            sides[side][(i + 1) % 25] += 1
+        else:
+            slot += 1
+        key >>= 1
+    o_board, p_board = sides
+    return p_board, o_board
+
+
+# --- 2. MATCH ID ---
+
+def match_key(fields: Dict[str, int]) -> bytes:
+    """9-byte match key; missing fields are 0, values are truncated to their width."""
+    key = pos = 0
+    for name, width in MATCH_FIELDS:
+        key |= (int(fields.get(name, 0)) & ((1 << width) - 1)) << pos
+        pos += width
+    return key.to_bytes(MATCH_BYTES, "little")
+
+
+def encode_match_id(fields: Dict[str, int]) -> str:
+    return _b64encode(match_key(fields))
+
+
+def decode_match_id(mid: str) -> Dict[str, int]:
+    key = int.from_bytes(_b64decode(mid), "little")
+    out = {}
+    for name, width in MATCH_FIELDS:
+        out[name] = key & ((1 << width) - 1)
+        key >>= width
+    return out
+
+
+# --- 3. BATCH ENCODERS ---
+
+def _b64rows(keys, width: int) -> List[str]:
+    """Base64 of each row of a (n, width) uint8 array in one call."""
+    padded = -width % 3
+    if padded:
+        keys = np.pad(keys, ((0, 0), (0, padded)))
+    chars = (width + padded) // 3 * 4
+    keep = (8 * width + 5) // 6
+    text = base64.b64encode(keys.tobytes()).decode("ascii")
+    return [text[i:i + keep] for i in range(0, len(text), chars)]
+
+
+def encode_position_ids(p_boards, o_boards) -> List[str]:
+    """Position IDs for n boards, given as (n, 25) arrays or lists of boards."""
+    if np is None:
+        return [encode_position_id(p, o) for p, o in zip(p_boards, o_boards)]
+
+    # gnubg slot order: opponent points 1-24, bar, then ours
+    order = list(range(1, 25)) + [0]
+    counts = np.concatenate([np.asarray(o_boards, dtype=np.int64)[:, order],
+                             np.asarray(p_boards, dtype=np.int64)[:, order]], axis=1)
+    n_bits = 8 * POSITION_BYTES
+
+    # Every bit up to the last separator is 1, except the separators themselves.
+    stops = np.cumsum(counts + 1, axis=1) - 1
+    bits = np.arange(n_bits)[None, :] < stops[:, -1:]
+    rows, cols = np.nonzero(stops < n_bits)
+    bits[rows, stops[rows, cols]] = False
+
+    keys = np.packbits(bits, axis=1, bitorder="little")
+    return _b64rows(keys, POSITION_BYTES)
+
+
+def encode_match_ids(fields: Dict[str, Sequence[int]]) -> List[str]:
+    """Match IDs for n states given column-wise: field name -> n values (missing = 0)."""
+    n = len(next(iter(fields.values())))
+    if np is None:
+        return [encode_match_id({k: v[i] for k, v in fields.items()}) for i in range(n)]
+
+    columns = []
+    for name, width in MATCH_FIELDS:
+        col = np.asarray(fields.get(name, np.zeros(n)), dtype=np.int64)
+        columns.append((col[:, None] >> np.arange(width)) & 1)
+    bits = np.concatenate(columns, axis=1).astype(bool)
+
+    keys = np.packbits(bits, axis=1, bitorder="little")
+    return _b64rows(keys, MATCH_BYTES)
@@ -2,11 +2,16 @@
 import subprocess
 import os
 import re
-import math
-import base64
-from typing import List, Dict, Tuple
+import json
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 
+import ids
+import pool
+import scheduler
+
 current_dir = Path(__file__).resolve().parent
 # Adjust path if necessary
 gnubg_path = current_dir.parent / "gnubg_engine" / "gnubg"
@@ -16,126 +21,294 @@ GNUBG_PATH = str(gnubg_path)
 TIMEOUT = 60.0  # Increased timeout slightly as 3-ply analysis takes longer
 
 # Configuration Constants
-THREADS = 16
+PLIES = int(os.environ.get("GNUBG_PLIES", "3"))   # chequerplay and cube evaluation depth
 CACHE_SIZE = 65536  # Set a large cache (size in entries or appropriate unit for gnubg)
 
+# Number of long-lived gnubg processes. 0 = spawn a fresh process per request (old behaviour).
+# "auto" = one per 4 CPUs (scheduler.auto_workers).
+_CPUS = scheduler.available_cpus()
+_pool_env = os.environ.get("GNUBG_POOL_SIZE", "auto")
+POOL_SIZE = scheduler.auto_workers(len(_CPUS)) if _pool_env == "auto" else int(_pool_env)
+
+# Threads per evaluation. "auto" = picked per job from the CPUs and the queue (scheduler.py);
+# a number fixes it. THREADS is the most any job gets (workers start with it).
+_threads_env = os.environ.get("GNUBG_THREADS", "auto")
+SCHEDULER = scheduler.Scheduler(_CPUS, None if _threads_env == "auto" else int(_threads_env),
+                                pin=scheduler.PIN, workers=max(POOL_SIZE, 1))
+THREADS = SCHEDULER.fixed_threads or SCHEDULER.max_threads
+
+# "cli" = text scripts scraped by parse_output, "module" = gnubg_worker.py via embedded Python
+ENGINE_BACKEND = os.environ.get("GNUBG_BACKEND", "cli")
+
+# Engine jobs evaluated at once, and how many more may wait before we answer 503.
+ENGINE_CONCURRENCY = int(os.environ.get("GNUBG_ENGINE_CONCURRENCY", str(max(POOL_SIZE, 1))))
+ENGINE_QUEUE = int(os.environ.get("GNUBG_ENGINE_QUEUE", str(4 * max(POOL_SIZE, 1))))
+
+# Result cache: in-memory LRU budget, plus an optional SQLite file that survives restarts.
+RESULT_CACHE_MB = int(os.environ.get("GNUBG_RESULT_CACHE_MB", "64"))
+RESULT_CACHE_DB = os.environ.get("GNUBG_RESULT_CACHE_DB") or None
+
+# Precomputed analysis table (build_opening.py), checked before the cache and the engine. "" = off.
+OPENING_TABLE = os.environ.get("GNUBG_OPENING_TABLE", str(current_dir / "data" / "opening.tbl"))
+
+# Candidates asked of gnubg per move hint (and cached), so later top_n requests up to this are free.
+HINT_MOVES = int(os.environ.get("GNUBG_HINT_MOVES", "5"))
+
+# CLI backend: ask gnubg's embedded Python for JSON hints; "0" = scrape the hint text only.
+STRUCTURED_OUTPUT = os.environ.get("GNUBG_STRUCTURED", "1") != "0"
+
+# Cube rollout jobs (rollout.py): default trials, jobs run at once, optional SQLite file for finished results.
+ROLLOUT_TRIALS = int(os.environ.get("GNUBG_ROLLOUT_TRIALS", "1296"))
+ROLLOUT_JOBS = int(os.environ.get("GNUBG_ROLLOUT_JOBS", "1"))
+ROLLOUT_DB = os.environ.get("GNUBG_ROLLOUT_DB") or None
+
 # --- 1. GENERATE ID (Synthesis P1 + P2) ---
 
-def _bits_to_bytes_le(bits: str, byte_count: int = None) -> bytes:
-    """Packs bit string into bytes (Little-Endian bits within byte)."""
-    if byte_count:
-        target_len = byte_count * 8
-        if len(bits) < target_len:
-            bits += '0' * (target_len - len(bits))
-        bits = bits[:target_len]
-    else:
-        rem = len(bits) % 8
-        if rem: bits += '0' * (8 - rem)
-
-    out = bytearray()
-    for i in range(0, len(bits), 8):
-        chunk = bits[i:i+8]
-        val = 0
-        for idx, bit_char in enumerate(chunk):
-            if bit_char == '1':
-                val |= (1 << idx)
-        out.append(val)
-    return bytes(out)
-
-def _int_to_bits(val: int, width: int) -> str:
-    return "".join(['1' if (val >> i) & 1 else '0' for i in range(width)])
+def _match_fields(match: object, dice: List[int], double_offered: bool) -> Dict[str, int]:
+    """ids.MATCH_FIELDS values for the request (the player on roll is always 0)."""
+    cube = int(match.cube_value)
+    own_map = {0: 0, 1: 1, 3: 3}
+    return {
+        "cube_log2": cube.bit_length() - 1 if cube >= 1 else 0,
+        "cube_owner": own_map.get(match.cube_holder, 3),
+        "move": 1 if double_offered else 0,
+        "crawford": 1 if match.crawford else 0,
+        "game_state": 1,  # Playing
+        "turn": 0,  # We always take action in this API
+        "doubled": 1 if double_offered else 0,
+        "resigned": 0,
+        "die1": dice[0] if dice else 0,
+        "die2": dice[1] if len(dice) > 1 else 0,
+        "match_length": match.match_length,
+        "score0": match.score_player,
+        "score1": match.score_opponent,
+        "no_jacoby": 0 if match.jacoby else 1,
+    }
 
 def get_ids(
     p_board: List[int], o_board: List[int],
     match: object, dice: List[int], double_offered: bool
 ) -> Tuple[str, str]:
+    pid = ids.encode_position_id(p_board, o_board)
+    mid = ids.encode_match_id(_match_fields(match, dice, double_offered))
+    return pid, mid
 
-    # --- POSITION ID ---
-    def encode_checkers(arr):
-        s = ""
-        for i in range(1, 25): s += "1" * arr[i] + "0"
-        s += "1" * arr[0] + "0"
-        return s
+def get_cube_ids(
+    p_board: List[int], o_board: List[int],
+    match: object, double_offered: bool
+) -> Tuple[str, str]:
+    """IDs for a cube decision (no dice), from the doubler's perspective."""
+    sim_match = match.copy()
 
-    raw_pid_bits = encode_checkers(o_board) + encode_checkers(p_board)
-    pid_bytes = _bits_to_bytes_le(raw_pid_bits, byte_count=10) # 80 bits
-    pid = base64.b64encode(pid_bytes).decode('ascii').rstrip('=')
+    if double_offered:
+        # === WE ARE BEING DOUBLED ===
+        # Swap boards
+        p_board, o_board = o_board, p_board
 
-    # --- MATCH ID ---
-    on_roll_val = 1 if double_offered else 0
-    turn_owner_val = 0 # We always take action in this API
+        # Swap scores
+        sim_match.score_player = match.score_opponent
+        sim_match.score_opponent = match.score_player
 
-    log2 = int(math.log2(match.cube_value)) if match.cube_value >= 1 else 0
+        # Swap cube owner
+        if match.cube_holder == 0:
+            sim_match.cube_holder = 1
+        elif match.cube_holder == 1:
+            sim_match.cube_holder = 0
 
-    own_map = {0: 0, 1: 1, 3: 3}
-    own_bits = own_map.get(match.cube_holder, 3)
-
-    d1 = dice[0] if dice else 0
-    d2 = dice[1] if len(dice) > 1 else 0
-
-    mbits = (
-        _int_to_bits(log2, 4) +
-        _int_to_bits(own_bits, 2) +
-        _int_to_bits(on_roll_val, 1) +
-        _int_to_bits(1 if match.crawford else 0, 1) +
-        _int_to_bits(1, 3) + # GameState=Playing
-        _int_to_bits(turn_owner_val, 1) +
-        _int_to_bits(1 if double_offered else 0, 1) +
-        _int_to_bits(0, 2) + # Resign
-        _int_to_bits(d1, 3) +
-        _int_to_bits(d2, 3) +
-        _int_to_bits(match.match_length, 15) +
-        _int_to_bits(match.score_player, 15) +
-        _int_to_bits(match.score_opponent, 15) +
-        _int_to_bits(1 if not match.jacoby else 0, 1)
-    )
+    return get_ids(p_board, o_board, sim_match, [0, 0], double_offered=False)
 
-    mid_bytes = _bits_to_bytes_le(mbits, byte_count=9)
-    mid = base64.b64encode(mid_bytes).decode('ascii').rstrip('=')
+def canonical_match_id(mid: str, kind: str) -> str:
+    """
+    Match ID for cache keys: fields that cannot change a `kind` ("move" or
+    "cube") evaluation are normalised, so equivalent states share one entry
+    (the engine still gets the real ID). Player on roll as player 0, no
+    pending double or resignation, dice high-low (none for cube decisions),
+    no scores or Crawford in money play, Jacoby only where it can apply
+    (money, cube centred), Crawford only when someone is 1-away.
+    """
+    f = ids.decode_match_id(mid)
+    if f["move"] == 1:
+        # Mirrored perspective: same state seen with player 1 on roll.
+        f["score0"], f["score1"] = f["score1"], f["score0"]
+        if f["cube_owner"] in (0, 1):
+            f["cube_owner"] ^= 1
+    f.update(move=0, turn=0, doubled=0, resigned=0, game_state=1)
+    if kind == "cube":
+        f["die1"] = f["die2"] = 0
+    elif f["die1"] < f["die2"]:
+        f["die1"], f["die2"] = f["die2"], f["die1"]
+    if f["match_length"] == 0:
+        f.update(score0=0, score1=0, crawford=0)
+        if f["cube_owner"] != 3:
+            f["no_jacoby"] = 1
+    else:
+        f["no_jacoby"] = 1
+        if f["match_length"] - 1 not in (f["score0"], f["score1"]):
+            f["crawford"] = 0
+    return ids.encode_match_id(f)
 
-    return pid, mid
+def request_ids(req: object) -> Tuple[str, str, str, bool]:
+    """
+    (pos_id, match_id, kind, receiving_double) for a HintRequest: dice [0, 0]
+    or double_offered make it a cube decision, anything else checker play.
+    """
+    if req.double_offered or not any(req.dice):
+        pid, mid = get_cube_ids(req.board.player_board, req.board.opponent_board, req.match, req.double_offered)
+        return pid, mid, "cube", req.double_offered
+    pid, mid = get_ids(req.board.player_board, req.board.opponent_board, req.match, req.dice, double_offered=False)
+    return pid, mid, "move", False
 
 # --- 2. EXECUTION AND PARSING ---
 
-def run_gnubg(pid: str, mid: str) -> str:
-    """
-    Constructs the script with high-performance settings and specific ply depth,
-    then executes GNUbg.
-    """
-    commands = [
-        # 1. Performance Settings
-        f"set threads {THREADS}",
-        f"set cache {CACHE_SIZE}",
-        
-        # 2. Evaluation Settings (Applied EVERY time before hint)
-        "set evaluation chequerplay evaluation plies 3",
-        "set evaluation cubedecision evaluation plies 3",
-        
-        # 3. Game State
+# Applied once when a pooled worker starts (weights, bearoff db and MET load here too).
+_WORKER_INIT = [
+    f"set threads {THREADS}",
+    f"set cache {CACHE_SIZE}",
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> pool.GnubgPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.register(pool.GnubgPool(
+                    [GNUBG_PATH, "-t", "-q"],
+                    _WORKER_INIT,
+                    size=POOL_SIZE,
+                    start_timeout=TIMEOUT,
+                    cpusets=SCHEDULER.cpusets(POOL_SIZE),
+                ))
+    return _pool
+
+def build_commands(pid: str, mid: str, plies: int = PLIES, action: str = "hint 1") -> List[str]:
+    """Per-request part of the script (worker-level settings live in _WORKER_INIT)."""
+    return [
+        # 1. Evaluation Settings (Applied EVERY time before hint)
+        f"set evaluation chequerplay evaluation plies {plies}",
+        f"set evaluation cubedecision evaluation plies {plies}",
+
+        # 2. Game State
         f"set matchid {mid}",
         f"set board {pid}",
-        
-        # 4. Action
-        "hint 1", # Execute analysis
-        "exit"
+
+        # 3. Action
+        action, # Execute analysis ("hint 1" or structured_hint())
     ]
-    
-    script = "\n".join(commands) + "\n"
 
+# Marks the JSON lines printed by structured_hint().
+STRUCTURED_TAG = "@@JSON@@"
+
+# One-line Python run by gnubg, printing the same shapes as gnubg_worker.py
+# (op_hint): {"type": "move", "candidates": [...]} or {"type": "cube", "cube": {...}}.
+_STRUCTURED_MOVE = (
+    ">import gnubg, json; print('" + STRUCTURED_TAG + "' + json.dumps({'type': 'move', 'candidates': ["
+    "{'move': h.get('move'), 'equity': h.get('equity'), 'eqdiff': h.get('eqdiff'), "
+    "'probs': list((h.get('details') or {}).get('probs', ()))} for h in gnubg.hint(%d).get('hint', [])]}), flush=True)"
+)
+_STRUCTURED_CUBE = (
+    ">import gnubg, json; print('" + STRUCTURED_TAG + "' + json.dumps({'type': 'cube', 'cube': dict(zip("
+    "('optimal', 'no_double', 'double_take', 'double_pass', 'decision', 'recommendation'), "
+    "gnubg.cfevaluate()))}), flush=True)"
+)
+
+def structured_hint(kind: str, max_moves: int = 1) -> str:
+    """Action line for build_commands() that prints a tagged JSON hint instead of text."""
+    return _STRUCTURED_MOVE % max_moves if kind == "move" else _STRUCTURED_CUBE
+
+def parse_structured(raw: str) -> List[dict]:
+    """Every tagged JSON payload in the output, in order (empty if gnubg printed none)."""
+    out = []
+    for line in raw.splitlines():
+        if line.startswith(STRUCTURED_TAG):
+            try:
+                out.append(json.loads(line[len(STRUCTURED_TAG):]))
+            except ValueError:
+                pass
+    return out
+
+def _run_once(commands: List[str], timeout: float) -> str:
+    threads = pool.JOB_THREADS.get()
+    init = _WORKER_INIT + ([f"set threads {threads}"] if threads else [])
+    script = "\n".join(init + commands + ["exit"]) + "\n"
+    proc = subprocess.Popen(
+        [GNUBG_PATH, "-t", "-q"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+    # Waited for in slices so a cancelled job (pool.ABORT) stops the process early.
+    abort = pool.ABORT.get()
+    deadline = time.monotonic() + timeout
+    script_in = script
+    while True:
+        try:
+            out, _ = proc.communicate(script_in, timeout=min(pool.ABORT_POLL, timeout) if abort else timeout)
+            return out
+        except subprocess.TimeoutExpired:
+            script_in = None  # already sent
+            cancelled = abort is not None and abort.is_set()
+            if cancelled or time.monotonic() >= deadline:
+                proc.kill()
+                proc.communicate()
+                if cancelled:
+                    raise pool.JobCancelled("gnubg job cancelled")
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+
+def run_script(commands: List[str], timeout: float = TIMEOUT) -> str:
+    """
+    Runs a script on a pooled gnubg worker (or a one-shot process when
+    POOL_SIZE is 0) and returns its raw output, or "ERROR: ..." on failure.
+    """
     try:
-        proc = subprocess.run(
-            [GNUBG_PATH, "-t", "-q"],
-            input=script,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            timeout=TIMEOUT,
-            errors='replace'
-        )
-        return proc.stdout
+        if POOL_SIZE <= 0:
+            return _run_once(commands, timeout)
+        return get_pool().run(commands, timeout=timeout)
     except Exception as e:
         return f"ERROR: {e}"
 
+def run_gnubg(pid: str, mid: str, plies: int = PLIES, timeout: float = TIMEOUT) -> str:
+    return run_script(build_commands(pid, mid, plies), timeout)
+
+def run_gnubg_structured(pid: str, mid: str, kind: str, plies: int = PLIES,
+                         timeout: float = TIMEOUT, max_moves: int = 1) -> Tuple[str, List[dict]]:
+    """Like run_gnubg, but returns (raw, parse_structured(raw))."""
+    raw = run_script(build_commands(pid, mid, plies, structured_hint(kind, max_moves)), timeout)
+    return raw, parse_structured(raw)
+
+# Printed between the two hints of a combined run.
+COMBINED_SPLIT = "@@CUBE-END@@"
+
+def run_gnubg_combined(pid: str, cube_mid: str, move_mid: str,
+                       plies: int = PLIES, timeout: float = TIMEOUT) -> Tuple[str, str]:
+    """
+    Cube hint (no dice) and checker-play hint in ONE gnubg session.
+    Returns (cube_output, move_output).
+    """
+    commands = build_commands(pid, cube_mid, plies)
+    commands.append(f">print('{COMBINED_SPLIT}', flush=True)")
+    commands += build_commands(pid, move_mid, plies)[2:]  # eval settings already applied
+
+    raw = run_script(commands, timeout)
+    if raw.startswith("ERROR") or COMBINED_SPLIT not in raw:
+        return raw, raw
+
+    cube_raw, move_raw = raw.split(COMBINED_SPLIT, 1)
+    return cube_raw, move_raw.lstrip("\r\n")
+
+def run_gnubg_combined_structured(pid: str, cube_mid: str, move_mid: str, plies: int = PLIES,
+                                  timeout: float = TIMEOUT, max_moves: int = 1) -> Tuple[str, List[dict]]:
+    """Combined run with structured hints: payloads are [cube, move] when both succeed."""
+    commands = build_commands(pid, cube_mid, plies, structured_hint("cube"))
+    commands += build_commands(pid, move_mid, plies, structured_hint("move", max_moves))[2:]
+    raw = run_script(commands, timeout)
+    return raw, parse_structured(raw)
+
 # Regex for parsing moves
 _MOVE_ISLAND_RE = re.compile(
     r"((?:"
@@ -148,6 +321,13 @@ _MOVE_ISLAND_RE = re.compile(
 
 _PROPER_CUBE_RE = re.compile(r"proper cube action:\s*(?P<action>.+?)(?:\((?P<pct>[\d.,]+)%\))?\s*$", re.IGNORECASE)
 
+# "1. No double   +0.486" in the hint's "Cubeful equities:" block (EMG, not MWC percentages).
+_CUBEFUL_RE = re.compile(
+    r"^\s*\d\.\s+(?P<name>no double|double, take|double, pass)\s+(?P<eq>[-+]?\d+\.\d+)\s*(?:\(|$)",
+    re.IGNORECASE | re.MULTILINE,
+)
+_CUBEFUL_KEYS = {"no double": "no_double", "double, take": "double_take", "double, pass": "double_pass"}
+
 def _expand_chain_token(token: str) -> List[Dict[str, int]]:
     token = token.strip()
     cnt = 1
@@ -211,19 +391,8 @@ def _reduce_turn_path(atomic: List[Dict[str, int]]) -> List[Dict[str, int]]:
     reduced.sort(key=lambda x: (x['from'], x['to']), reverse=True)
     return reduced
 
-def parse_output(raw: str, receiving_double: bool):
-    lines = raw.splitlines()
-
-    # 1. Parsing Move
-    move_str = None
-    for line in lines:
-        if "Eq.:" in line:
-            left = line.split("Eq.:")[0]
-            m = _MOVE_ISLAND_RE.search(left)
-            if m:
-                move_str = m.group(1).strip()
-                break
-
+def expand_move(move_str: str) -> Tuple[List[Dict[str, int]], List[Dict[str, int]]]:
+    """'24/20 13/8(2)' -> (atomic segments, reduced from/to pairs)."""
     atomic = []
     reduced = []
     if move_str:
@@ -231,17 +400,11 @@ def parse_output(raw: str, receiving_double: bool):
         for t in tokens:
             atomic.extend(_expand_chain_token(t))
         reduced = _reduce_turn_path(atomic)
+    return atomic, reduced
 
-    # 2. Parsing Cube
-    c_act = "unknown"
-    c_txt = "Unknown"
-
-    m_prop = _PROPER_CUBE_RE.search(raw)
-    action_raw = ""
-    if m_prop:
-        action_raw = m_prop.group("action").lower()
-    else:
-        action_raw = raw.lower()
+def classify_cube(action_raw: str, receiving_double: bool) -> Tuple[str, str]:
+    """Maps gnubg's cube recommendation text to (cube_action, cube_text)."""
+    action_raw = action_raw.lower()
 
     if receiving_double:
         if "beaver" in action_raw:
@@ -274,4 +437,39 @@ def parse_output(raw: str, receiving_double: bool):
              else:
                  c_act, c_txt = "no_double", "No Double (Default)"
 
-    return move_str, atomic, reduced, c_act, c_txt
\ No newline at end of file
+    return c_act, c_txt
+
+def cube_recommendation(raw: str) -> str:
+    """gnubg's "Proper cube action" text from a cube hint, or "" if it printed none."""
+    m_prop = _PROPER_CUBE_RE.search(raw)
+    return m_prop.group("action") if m_prop else ""
+
+def parse_cube_equities(raw: str) -> Optional[Dict[str, float]]:
+    """no_double, double_take, double_pass and optimal from a cube hint's text, or None if not all printed."""
+    eq = {_CUBEFUL_KEYS[m.group("name").lower()]: float(m.group("eq")) for m in _CUBEFUL_RE.finditer(raw)}
+    if len(eq) != 3:
+        return None
+    eq["optimal"] = max(eq["no_double"], min(eq["double_take"], eq["double_pass"]))
+    return eq
+
+def parse_output(raw: str, receiving_double: bool):
+    lines = raw.splitlines()
+
+    # 1. Parsing Move
+    move_str = None
+    for line in lines:
+        if "Eq.:" in line:
+            left = line.split("Eq.:")[0]
+            m = _MOVE_ISLAND_RE.search(left)
+            if m:
+                move_str = m.group(1).strip()
+                break
+
+    atomic, reduced = expand_move(move_str)
+
+    # 2. Parsing Cube
+    action_raw = cube_recommendation(raw) or raw
+
+    c_act, c_txt = classify_cube(action_raw, receiving_double)
+
+    return move_str, atomic, reduced, c_act, c_txt
@@ -1,121 +1,581 @@
 # main.py
+import asyncio
+import json
+from typing import List
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from models import HintRequest, HintResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from models import BoardData, HintRequest, HintResponse, MatchData, RolloutRequest
 import logic
-from visualizer import print_console_debug
+import backends
+import engine
+import ids
+import metrics
+import movegen
+import opening
+import pool
+import reqlog
+import rollout
+import tracing
+import wire
 
 app = FastAPI(title="Gnubg API", version="2.1")
 
-@app.post("/get-optimal-move", response_model=HintResponse)
-def get_optimal_move(req: HintRequest):
+@app.exception_handler(engine.EngineBusy)
+async def engine_busy_handler(request: Request, exc: engine.EngineBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+class ClientDisconnected(Exception):
+    """The caller hung up before the answer was ready; its engine work has been cancelled."""
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nobody reads this; 499 (client closed request) keeps it apart from real errors in logs and metrics.
+    return Response(status_code=499)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Per-request trace + endpoint latency; the correlation ID is echoed in X-Request-ID."""
+    trace = tracing.start(request.url.path, request.headers.get(tracing.REQUEST_ID_HEADER))
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[tracing.REQUEST_ID_HEADER] = trace.request_id
+        return response
+    finally:
+        route = request.scope.get("route")
+        trace.endpoint = route.path if route is not None else "other"
+        tracing.finish(trace, status)
+        metrics.REQUEST.observe(trace.duration_ms / 1000.0, endpoint=trace.endpoint)
+
+@app.on_event("startup")
+def load_opening_table():
+    table = opening.load(logic.OPENING_TABLE)
+    if table is not None:
+        reqlog.logger.info("opening table: %d positions from %s", table.count, table.path)
+
+# Parallel engine jobs per /analyze-batch call (one per pooled worker).
+BATCH_WORKERS = max(logic.POOL_SIZE, 1)
+
+async def _disconnected(request: Request):
+    """Returns once the client hangs up (the body is already read, so the next message is the disconnect)."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def _unless_disconnected(request: Request, req: HintRequest, kind: str, work):
     """
-    Endpoint for optimal checker play.
+    Awaits the engine coroutine `work`; if the client hangs up first, cancels
+    it (which stops the engine job unless another caller shares it), logs
+    the request as cancelled and raises ClientDisconnected.
     """
+    task = asyncio.ensure_future(work)
+    watch = asyncio.ensure_future(_disconnected(request))
     try:
-        # 1. Generate ID
-        pid, mid = logic.get_ids(
-            req.board.player_board,
-            req.board.opponent_board,
-            req.match,
-            req.dice,
-            double_offered=False
-        )
+        await asyncio.wait({task, watch}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watch.cancel()
+        if not task.done():
+            task.cancel()
+    if task.done() and not task.cancelled():
+        return task.result()
+    metrics.DISCONNECTS.inc(endpoint=request.url.path)
+    tracing.annotate(cancelled="disconnect")
+    reqlog.cancelled(req, kind, "client disconnected")
+    raise ClientDisconnected()
+
+def _double_ids(req: HintRequest):
+    """IDs for a cube decision, from the doubler's perspective."""
+    return logic.get_cube_ids(req.board.player_board, req.board.opponent_board, req.match, req.double_offered)
 
-        # 2. Run GNUbg (now with 3-ply and multi-thread)
-        raw_out = logic.run_gnubg(pid, mid)
+def _forced_move(req: HintRequest):
+    """
+    Result for positions with no legal move or exactly one, without the engine.
+    None when there is a real choice to make (or the dice are not a roll).
+    """
+    if not all(1 <= d <= 6 for d in req.dice):
+        return None
+    p_board, o_board = req.board.player_board, req.board.opponent_board
+    plays = movegen.legal_moves(p_board, o_board, req.dice, limit=2)
+    if len(plays) > 1:
+        return None
 
-        if "ERROR" in raw_out:
-            print(f"GNUbg Critical Error:\n{raw_out}")
-            raise HTTPException(status_code=500, detail=raw_out)
+    atomic = [{'from': f, 'to': t} for f, t in plays[0]] if plays else []
+    reduced = logic._reduce_turn_path(atomic)
+    move_raw = movegen.format_move(p_board, o_board, plays[0]) if plays else None
+    c_act, c_txt = logic.classify_cube("", False)
+    return {
+        "raw": None,
+        "move_raw": move_raw,
+        "atomic": atomic,
+        "reduced": reduced,
+        "candidates": [{"move": move_raw, "atomic": atomic, "reduced": reduced}] if plays else [],
+        "cube_action": c_act,
+        "cube_text": c_txt,
+        "ply": None,
+        "cached": False,
+        "source": "forced",
+    }
 
-        # 3. Parse
-        mv_str, atomic, reduced, c_act, c_txt = logic.parse_output(raw_out, receiving_double=False)
+def _count_result(res: dict, kind: str):
+    source = res.get("source", "engine")
+    metrics.RESULTS.inc(kind=kind, cube_action=res["cube_action"] if kind != "move" else "", source=source)
+    tracing.annotate(source=source, ply=res.get("ply"))
 
-        response = HintResponse(
+def _ok_response(pid: str, mid: str, res: dict, kind: str = "move", top_n: int = 1) -> HintResponse:
+    """
+    HintResponse from a backend result ("move", "cube" or "full"); cube
+    answers leave the checker-play fields empty. Counted in metrics.RESULTS.
+    """
+    move = kind != "cube"
+    _count_result(res, kind)
+    candidates = (res.get("candidates") or [])[:top_n] if move else []
+    best = candidates[0] if candidates else None
+    with tracing.span("validate"):
+        return HintResponse(
             status="ok",
             pos_id=pid,
             match_id=mid,
-            best_move_raw=mv_str,
-            best_move_atomic=atomic,
-            best_move_reduced=reduced,
-            cube_action=c_act,
-            cube_text=c_txt
+            best_move_raw=res["move_raw"] if move else None,
+            best_move_atomic=res["atomic"] if move else [],
+            best_move_reduced=res["reduced"] if move else [],
+            cube_action=res["cube_action"],
+            cube_text=res["cube_text"],
+            equity=best.get("equity") if best else None,
+            probs=(best.get("probs") or None) if best else None,
+            cube_equities=res.get("cube_equities"),
+            candidates=candidates,
+            ply=res.get("ply")
         )
 
-        # === LOGGING ===
-        print_console_debug(req, response, decision_type="move", gnubg_output=raw_out)
-        # ===============
+def _check_legal(req: HintRequest, res: dict):
+    """Refuses to hand out an engine/parser move that is not legal for this roll."""
+    with tracing.span("validate"):
+        legal = movegen.is_legal(req.board.player_board, req.board.opponent_board, req.dice, res["reduced"])
+    if not legal:
+        raise backends.EngineError(f"ERROR: illegal move {res['move_raw']!r} for dice {req.dice}")
+
+@app.post("/get-optimal-move", response_model=HintResponse)
+async def get_optimal_move(req: HintRequest, request: Request):
+    """
+    Endpoint for optimal checker play.
+    """
+    try:
+        # 1. Generate ID
+        with tracing.span("ids"):
+            pid, mid = logic.get_ids(
+                req.board.player_board,
+                req.board.opponent_board,
+                req.match,
+                req.dice,
+                double_offered=False
+            )
+        tracing.annotate(pos_id=pid, match_id=mid, kind="move", deadline_ms=req.deadline_ms)
+
+        # 2. Run GNUbg (3-ply, multi-thread) and parse, unless the move is forced
+        try:
+            res = _forced_move(req)
+            if res is None:
+                res = await _unless_disconnected(request, req, "move", engine.analyze(
+                    pid, mid, kind="move", receiving_double=False, deadline_ms=req.deadline_ms, top_n=req.top_n))
+                _check_legal(req, res)
+        except backends.EngineError as e:
+            reqlog.error(req, "move", e)
+            raise HTTPException(status_code=500, detail=str(e))
+
+        response = _ok_response(pid, mid, res, top_n=req.top_n)
+        reqlog.request(req, response, "move", raw=res["raw"])
 
         return response
+    except (HTTPException, engine.EngineBusy, ClientDisconnected):
+        raise
     except Exception as e:
-        print(f"ERROR: {e}")
+        reqlog.error(req, "move", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/get-double-decision", response_model=HintResponse)
-def get_double_decision(req: HintRequest):
+async def get_double_decision(req: HintRequest, request: Request):
     """
     Endpoint for cube decisions.
     """
     try:
-        sim_match = req.match.copy()
+        with tracing.span("ids"):
+            pid, mid = _double_ids(req)
+        tracing.annotate(pos_id=pid, match_id=mid, kind="cube", receiving_double=req.double_offered,
+                         deadline_ms=req.deadline_ms)
 
-        if req.double_offered:
-            # === WE ARE BEING DOUBLED ===
-            # Swap boards
-            p_board_sim = req.board.opponent_board
-            o_board_sim = req.board.player_board
+        try:
+            res = await _unless_disconnected(request, req, "cube", engine.analyze(
+                pid, mid, kind="cube", receiving_double=req.double_offered, deadline_ms=req.deadline_ms))
+        except backends.EngineError as e:
+            reqlog.error(req, "cube", e)
+            raise HTTPException(status_code=500, detail=str(e))
 
-            # Swap scores
-            sim_match.score_player = req.match.score_opponent
-            sim_match.score_opponent = req.match.score_player
+        response = _ok_response(pid, mid, res, kind="cube")
+        reqlog.request(req, response, "cube", raw=res["raw"])
 
-            # Swap cube owner
-            if req.match.cube_holder == 0:
-                sim_match.cube_holder = 1
-            elif req.match.cube_holder == 1:
-                sim_match.cube_holder = 0
+        return response
+    except (HTTPException, engine.EngineBusy, ClientDisconnected):
+        raise
+    except Exception as e:
+        reqlog.error(req, "cube", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-            use_double_flag = False
+@app.post("/get-full-analysis", response_model=HintResponse)
+async def get_full_analysis(req: HintRequest, request: Request):
+    """
+    Cube decision before rolling AND optimal checker play for req.dice,
+    from a single engine session.
+    """
+    if req.double_offered:
+        raise HTTPException(status_code=400, detail="double_offered is not supported here, use /get-double-decision")
 
-        else:
-            # === WE ARE THINKING OF DOUBLING ===
-            p_board_sim = req.board.player_board
-            o_board_sim = req.board.opponent_board
-            use_double_flag = False
-
-        pid, mid = logic.get_ids(
-            p_board_sim,
-            o_board_sim,
-            sim_match,
-            [0, 0],
-            double_offered=use_double_flag
-        )
+    try:
+        with tracing.span("ids"):
+            pid, move_mid = logic.get_ids(
+                req.board.player_board,
+                req.board.opponent_board,
+                req.match,
+                req.dice,
+                double_offered=False
+            )
+            _, cube_mid = logic.get_ids(
+                req.board.player_board,
+                req.board.opponent_board,
+                req.match,
+                [0, 0],
+                double_offered=False
+            )
+        tracing.annotate(pos_id=pid, match_id=move_mid, cube_match_id=cube_mid, kind="full",
+                         deadline_ms=req.deadline_ms)
 
-        raw_out = logic.run_gnubg(pid, mid)
+        try:
+            res = await _unless_disconnected(request, req, "full", engine.analyze_full(
+                pid, cube_mid, move_mid, deadline_ms=req.deadline_ms, top_n=req.top_n))
+            _check_legal(req, res)
+        except backends.EngineError as e:
+            reqlog.error(req, "full", e)
+            raise HTTPException(status_code=500, detail=str(e))
 
-        if "ERROR" in raw_out:
-            print(f"GNUbg Critical Error:\n{raw_out}")
-            raise HTTPException(status_code=500, detail=raw_out)
+        response = _ok_response(pid, move_mid, res, kind="full", top_n=req.top_n)
+        reqlog.request(req, response, "full", raw=res["raw"])
 
-        _, _, _, c_act, c_txt = logic.parse_output(raw_out, receiving_double=req.double_offered)
+        return response
+    except (HTTPException, engine.EngineBusy, ClientDisconnected):
+        raise
+    except Exception as e:
+        reqlog.error(req, "full", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        response = HintResponse(
-            status="ok",
-            pos_id=pid,
-            match_id=mid,
-            best_move_raw=None,
-            cube_action=c_act,
-            cube_text=c_txt
-        )
 
-        print_console_debug(req, response, decision_type="double", gnubg_output=raw_out)
+@app.post("/analyze-batch")
+async def analyze_batch(reqs: List[HintRequest]):
+    """
+    Many positions at once. Requests with dice [0, 0] or double_offered are
+    cube decisions, the rest are checker play. Identical positions are
+    evaluated once; results stream back as NDJSON lines
+    {"index": i, "result": HintResponse} in completion order.
+    """
+    tracing.annotate(kind="batch", positions=len(reqs))
+    jobs = {}      # (pid, mid, kind, receiving_double, top_n) -> [indices]
+    first = {}     # same key -> first request (identical IDs mean identical boards)
+    failed = []    # (index, pid, mid, error) for requests that never reach the engine
+
+    for i, req in enumerate(reqs):
+        try:
+            with tracing.span("ids"):
+                pid, mid, kind, rd = logic.request_ids(req)
+        except Exception as e:
+            failed.append((i, "", "", str(e)))
+            continue
+        key = (pid, mid, kind, rd, req.top_n)
+        jobs.setdefault(key, []).append(i)
+        first.setdefault(key, req)
 
-        return response
+    def line(index: int, resp: HintResponse) -> str:
+        return '{"index": %d, "result": %s}\n' % (index, resp.model_dump_json(by_alias=True))
+
+    def error_response(pid: str, mid: str, msg: str) -> HintResponse:
+        return HintResponse(status="error", pos_id=pid, match_id=mid,
+                            cube_action="unknown", cube_text="Unknown", error_msg=msg)
+
+    async def run_job(key):
+        pid, mid, kind, rd, top_n = key
+        try:
+            res = _forced_move(first[key]) if kind == "move" else None
+            if res is None:
+                res = await engine.analyze(pid, mid, kind, rd, bounded=False, top_n=top_n)
+                if kind == "move":
+                    _check_legal(first[key], res)
+            return key, _ok_response(pid, mid, res, kind=kind, top_n=top_n)
+        except Exception as e:
+            return key, error_response(pid, mid, str(e))
+
+    async def stream():
+        for i, pid, mid, msg in failed:
+            yield line(i, error_response(pid, mid, msg))
+
+        # Keep at most BATCH_WORKERS jobs in flight so a big batch never floods the engine queue.
+        pending_keys = iter(list(jobs))
+        in_flight = set()
+        try:
+            while True:
+                while len(in_flight) < BATCH_WORKERS:
+                    key = next(pending_keys, None)
+                    if key is None:
+                        break
+                    in_flight.add(asyncio.ensure_future(run_job(key)))
+                if not in_flight:
+                    break
+
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key, resp = task.result()
+                    for i in jobs[key]:
+                        yield line(i, resp)
+        finally:
+            # Client went away: drop whatever has not finished.
+            for task in in_flight:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# --- ROLLOUTS ---
+
+# Seconds between progress checks of an SSE stream.
+ROLLOUT_POLL = 0.5
+
+def _rollout_job(job_id: str) -> rollout.RolloutView:
+    job = rollout.get_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown rollout job {job_id}")
+    return job
+
+@app.post("/rollouts", status_code=202)
+def submit_rollout(req: RolloutRequest):
+    """
+    Starts (or joins an identical running) cube-decision rollout; the doubler
+    and the taker share one job, each id reporting the decision for its side.
+    Poll GET /rollouts/{id} or stream GET /rollouts/{id}/events; once done,
+    cube hints for this position are answered from the rollout.
+    """
+    if req.match.match_length:
+        raise HTTPException(status_code=400, detail="rollouts are supported for money games only")
+    with tracing.span("ids"):
+        pid, mid = logic.get_cube_ids(req.board.player_board, req.board.opponent_board, req.match, req.double_offered)
+    tracing.annotate(pos_id=pid, match_id=mid, kind="rollout")
+    job = rollout.get_manager().submit(pid, mid, req.double_offered, req.trials, req.plies, req.seed)
+    return job.snapshot()
+
+@app.get("/rollouts/{job_id}")
+def rollout_status(job_id: str):
+    """
+    Status, progress (trials, equities, 95% intervals) and, when done, the decision.
+    """
+    return _rollout_job(job_id).snapshot()
+
+@app.get("/rollouts/{job_id}/events")
+async def rollout_events(job_id: str):
+    """
+    Server-sent events: one "progress" event per change, the last one in a final state.
+    """
+    job = _rollout_job(job_id)
+
+    async def stream():
+        seen = None
+        while True:
+            if job.version != seen:
+                snap = job.snapshot()
+                seen = snap["version"]
+                yield f"event: progress\ndata: {json.dumps(snap)}\n\n"
+                if snap["status"] in rollout.FINAL:
+                    return
+            await asyncio.sleep(ROLLOUT_POLL)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/rollouts/{job_id}")
+def cancel_rollout(job_id: str):
+    """
+    Cancels this id's view of a queued or running rollout. The gnubg
+    processes are killed once no other caller's view of the job is left.
+    """
+    job = rollout.get_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown rollout job {job_id}")
+    return job.snapshot()
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters of the evaluation result cache and the opening table,
+    plus rollout jobs by status and the number of stored rollouts. "keys"
+    compares the result cache's hit rate on canonical keys with the one
+    entries stored under raw match IDs would have given.
+    """
+    table = opening.get_table()
+    return dict(backends.get_cache().stats(), opening=table.stats() if table is not None else None,
+                rollouts=rollout.get_manager().stats(), keys=backends.KEY_STATS.stats())
+
+@app.get("/engine/stats")
+def engine_stats():
+    """
+    Concurrency, queue depth and rejections of the engine layer.
+    """
+    return dict(engine.get_engine().stats(), wire=_wire_server.stats() if _wire_server is not None else None)
+
+@app.get("/admin/slowest")
+def admin_slowest(n: int = 20):
+    """
+    Slowest of the recently finished requests with their spans and
+    position/match IDs, for replaying them against the engine.
+    """
+    return tracing.slowest(max(1, min(n, tracing.TRACE_WINDOW)))
+
+# --- BINARY TRANSPORT (wire.py) ---
+
+_wire_server = None
+
+def _wire_request(w: wire.WireRequest):
+    """
+    (HintRequest, pos_id, match_id, cube_match_id) for a wire request, IDs as
+    the HTTP endpoints compute them. The HintRequest is built unvalidated,
+    only for _forced_move/_check_legal.
+    """
+    if w.boards is not None:
+        player, opponent = w.boards
+        dice = w.match["dice"]
+        match = MatchData.model_construct(**{k: v for k, v in w.match.items() if k != "dice"})
+        if w.kind == "cube":
+            pid, mid = logic.get_cube_ids(player, opponent, match, w.receiving_double)
+            cube_mid = mid
+        else:
+            pid, mid = logic.get_ids(player, opponent, match, dice, double_offered=False)
+            _, cube_mid = logic.get_ids(player, opponent, match, [0, 0], double_offered=False)
+    else:
+        pid, mid = w.pos_id, w.match_id
+        try:
+            fields = ids.decode_match_id(mid)
+            player, opponent = ids.decode_position_id(pid)
+        except ValueError as e:
+            raise wire.WireError(f"bad position or match ID: {e}")
+        dice = [fields["die1"], fields["die2"]]
+        cube_mid = ids.encode_match_id(dict(fields, die1=0, die2=0)) if w.kind == "full" else mid
+        match = None
+    if w.kind != "cube" and not all(1 <= d <= 6 for d in dice):
+        raise wire.WireError(f"dice {dice} are not a roll")
+    req = HintRequest.model_construct(
+        board=BoardData.model_construct(player_board=player, opponent_board=opponent), match=match,
+        dice=dice, double_offered=w.receiving_double, deadline_ms=w.deadline_ms, top_n=w.top_n)
+    return req, pid, mid, cube_mid
+
+async def _wire_answer(w: wire.WireRequest) -> bytes:
+    """The endpoints' work for one wire request, answered as a frame (errors included)."""
+    trace = tracing.start("wire/" + w.kind)
+    status = 200
+    try:
+        with tracing.span("ids"):
+            req, pid, mid, cube_mid = _wire_request(w)
+        tracing.annotate(pos_id=pid, match_id=mid, kind=w.kind, deadline_ms=w.deadline_ms)
+        if w.kind == "cube":
+            res = await engine.analyze(pid, mid, "cube", w.receiving_double, deadline_ms=w.deadline_ms)
+        elif w.kind == "move":
+            res = _forced_move(req)
+            if res is None:
+                res = await engine.analyze(pid, mid, "move", False, deadline_ms=w.deadline_ms, top_n=w.top_n)
+                _check_legal(req, res)
+        else:
+            res = await engine.analyze_full(pid, cube_mid, mid, deadline_ms=w.deadline_ms, top_n=w.top_n)
+            _check_legal(req, res)
+        _count_result(res, w.kind)
+        return wire.encode_result(w.id, pid, mid, res, w.kind, w.top_n)
+    except engine.EngineBusy as e:
+        status = 503
+        return wire.encode_error(w.id, str(e), retry_after=e.retry_after)
+    except wire.WireError as e:
+        status = 400
+        return wire.encode_error(w.id, str(e))
+    except asyncio.CancelledError:
+        # Connection closed with the request unanswered; the engine job is cancelled with it.
+        status = 499
+        metrics.DISCONNECTS.inc(endpoint=trace.endpoint)
+        raise
     except Exception as e:
-        print(f"ERROR: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        status = 500
+        reqlog.error(None, w.kind, e, exc_info=not isinstance(e, backends.EngineError))
+        return wire.encode_error(w.id, str(e))
+    finally:
+        tracing.finish(trace, status)
+        metrics.REQUEST.observe(trace.duration_ms / 1000.0, endpoint=trace.endpoint)
+
+@app.on_event("startup")
+async def start_wire():
+    global _wire_server
+    if wire.PORT or wire.SOCKET_PATH:
+        _wire_server = await wire.WireServer(_wire_answer).start()
+        reqlog.logger.info("binary transport on %s", ", ".join(_wire_server.addresses()))
+
+@app.on_event("shutdown")
+async def stop_wire():
+    if _wire_server is not None:
+        await _wire_server.close()
+
+# --- METRICS ---
+
+def _pool_total(field: str) -> int:
+    return sum(p.stats()[field] for p in pool.pools())
+
+def _cache_stat(field: str):
+    return lambda: backends.get_cache().stats()[field]
+
+def _opening_hits() -> int:
+    table = opening.get_table()
+    return table.hits if table is not None else 0
+
+metrics.REGISTRY.callback("gnubg_engine_queue_depth", "Requests waiting for an engine slot.",
+                          lambda: engine.get_engine().waiting)
+metrics.REGISTRY.callback("gnubg_engine_running", "Engine jobs running now.",
+                          lambda: engine.get_engine().running)
+metrics.REGISTRY.callback("gnubg_engine_rejected_total", "Requests answered 503 (queue full).",
+                          lambda: engine.get_engine().rejected, kind="counter")
+metrics.REGISTRY.callback("gnubg_engine_in_flight", "Distinct engine runs in flight (identical requests share one).",
+                          lambda: engine.get_engine().stats()["in_flight"])
+metrics.REGISTRY.callback("gnubg_worker_cancels_total", "gnubg jobs interrupted or killed because their caller gave up.",
+                          lambda: _pool_total("cancelled"), kind="counter")
+metrics.REGISTRY.callback("gnubg_engine_jobs_by_threads_total", "Engine jobs started, by threads the scheduler gave them.",
+                          lambda: logic.SCHEDULER.stats()["jobs_by_threads"], kind="counter", label="threads")
+metrics.REGISTRY.callback("gnubg_workers_alive", "Live gnubg worker processes.",
+                          lambda: _pool_total("alive"))
+metrics.REGISTRY.callback("gnubg_worker_restarts_total", "gnubg worker restarts (crash or timeout).",
+                          lambda: _pool_total("restarts"), kind="counter")
+metrics.REGISTRY.callback("gnubg_worker_timeouts_total", "gnubg jobs killed for running past their timeout.",
+                          lambda: _pool_total("timeouts"), kind="counter")
+metrics.REGISTRY.callback("gnubg_cache_hits_total", "Result cache hits.", _cache_stat("hits"), kind="counter")
+metrics.REGISTRY.callback("gnubg_cache_misses_total", "Result cache misses.", _cache_stat("misses"), kind="counter")
+metrics.REGISTRY.callback("gnubg_cache_hit_ratio", "Result cache hits / lookups.", _cache_stat("hit_rate"))
+metrics.REGISTRY.callback("gnubg_cache_bytes", "Result cache memory in use.", _cache_stat("bytes"))
+metrics.REGISTRY.callback("gnubg_cache_canonical_hits_total",
+                          "Cache and table hits that only canonical match IDs found (raw IDs would have missed).",
+                          lambda: backends.KEY_STATS.stats()["canonical_hits"], kind="counter")
+metrics.REGISTRY.callback("gnubg_opening_hits_total", "Answers found in the opening table.",
+                          _opening_hits, kind="counter")
+metrics.REGISTRY.callback("gnubg_log_dropped_total", "Request log records dropped (writer behind).",
+                          reqlog.dropped, kind="counter")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """
+    Prometheus text format: phase/endpoint latency histograms, queue depth,
+    worker restarts and timeouts, cache hit rate and results by cube action.
+    """
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=5007)
\ No newline at end of file
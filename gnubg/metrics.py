@@ -0,0 +1,144 @@
+# metrics.py
+"""
+Minimal Prometheus text-format metrics (no client library needed).
+Counters and histograms are updated in place; callback metrics read live
+numbers (pool, cache, queue) when /metrics is scraped.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Sequence, Tuple
+
+# Seconds; covers cache hits (sub-ms) up to a full 3-ply run with queueing.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0.0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                yield f"{self.name}{_labels(self.labels, key)} {v:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, s):
+                    yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + (f'{bound:g}',))} {n}"
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {s[-1]}"
+                yield f"{self.name}_sum{_labels(self.labels, key)} {s[-2]:.6f}"
+                yield f"{self.name}_count{_labels(self.labels, key)} {s[-1]}"
+
+
+class Callback:
+    """Gauge or counter whose value(s) come from fn(): a number, or {label value: number}."""
+
+    def __init__(self, name: str, doc: str, fn: Callable, kind: str = "gauge", label: str = None):
+        self.name, self.doc, self.fn, self.kind, self.label = name, doc, fn, kind, label
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return  # source not available (e.g. pool not started yet)
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} {self.kind}"
+        if isinstance(value, dict):
+            for k, v in sorted(value.items()):
+                yield f"{self.name}{_labels((self.label,), (k,))} {v:g}"
+        else:
+            yield f"{self.name} {value:g}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, doc, labels))
+
+    def histogram(self, name: str, doc: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def callback(self, name: str, doc: str, fn: Callable, kind: str = "gauge", label: str = None) -> Callback:
+        return self._add(Callback(name, doc, fn, kind, label))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Shared by main / engine / backends.
+PHASE = REGISTRY.histogram(
+    "gnubg_phase_seconds", "Time per request phase (ids, queue_wait, engine, parse).", ["phase"])
+REQUEST = REGISTRY.histogram(
+    "gnubg_request_seconds", "End-to-end handler time per endpoint.", ["endpoint"])
+RESULTS = REGISTRY.counter(
+    "gnubg_results_total", "Answers by decision kind, cube action and where they came from.",
+    ["kind", "cube_action", "source"])
+COALESCED = REGISTRY.counter(
+    "gnubg_coalesced_total", "Requests that waited for an identical engine run already in flight.", ["kind"])
+CANCELLED = REGISTRY.counter(
+    "gnubg_engine_cancelled_total",
+    "Engine jobs dropped from the queue (expired) or stopped while running (deadline, abandoned).", ["reason"])
+DISCONNECTS = REGISTRY.counter(
+    "gnubg_client_disconnects_total", "Requests whose client hung up before the answer.", ["endpoint"])
@@ -27,11 +27,42 @@ class HintRequest(BaseModel):
     dice: List[int] = Field(..., min_length=2, max_length=2)
     # Flag: if True, double is offered TO us, we decide Take/Pass.
     double_offered: bool = False
+    # Latency budget. If set, the engine deepens 0 -> 1 -> 2 -> 3 ply and returns the deepest result ready in time.
+    deadline_ms: Optional[int] = Field(None, gt=0)
+    # Number of ranked moves to return in HintResponse.candidates (same engine run).
+    top_n: int = Field(1, ge=1, le=20)
+
+class RolloutRequest(BaseModel):
+    board: BoardData
+    match: MatchData
+    # Same perspective rules as HintRequest: True = the double is offered TO us.
+    double_offered: bool = False
+    # Games per rolled-out position (default GNUBG_ROLLOUT_TRIALS); multiples of 36 suit quasi-random dice.
+    trials: Optional[int] = Field(None, ge=36, le=1296 * 100)
+    # Evaluation depth used for the plays and cube decisions inside the rollout.
+    plies: int = Field(0, ge=0, le=2)
+    # Fixed seed for reproducible rollouts; random when omitted.
+    seed: Optional[int] = Field(None, ge=0)
 
 class AtomicMove(BaseModel):
     from_pt: int = Field(..., alias="from")
     to_pt: int = Field(..., alias="to")
 
+class Candidate(BaseModel):
+    move: Optional[str] = None               # "24/20 13/8"
+    equity: Optional[float] = None           # Cubeful; None for forced moves
+    eqdiff: Optional[float] = None           # Versus the best move (0 for the best, negative below)
+    probs: List[float] = []                  # Win, win gammon, win bg, lose gammon, lose bg
+    atomic: List[AtomicMove] = []
+    reduced: List[AtomicMove] = []
+
+class CubeEquities(BaseModel):
+    # Cubeful equities from the doubler's side
+    no_double: float
+    double_take: float
+    double_pass: float
+    optimal: float
+
 class HintResponse(BaseModel):
     status: Literal["ok", "error"]
     pos_id: str
@@ -46,4 +77,15 @@ class HintResponse(BaseModel):
     cube_action: str  # "no_double", "double_pass", "take", "pass"
     cube_text: str    # Readable text
 
+    # Engine numbers (None for forced moves or when only the hint text was available)
+    equity: Optional[float] = None               # Best move, cubeful
+    probs: Optional[List[float]] = None          # Win, win gammon, win bg, lose gammon, lose bg
+    cube_equities: Optional[CubeEquities] = None
+
+    # Best top_n moves, best first (empty for cube decisions)
+    candidates: List[Candidate] = []
+
+    # Evaluation depth the answer comes from (< 3 when a deadline cut the search short)
+    ply: Optional[int] = None
+
     error_msg: Optional[str] = None
\ No newline at end of file
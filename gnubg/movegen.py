@@ -0,0 +1,246 @@
+# movegen.py
+"""
+Legal move generator on the BoardData arrays (index 0 = bar, 1-24 = points,
+each side from its own perspective). Moves use the same numbering as the
+parsed hints: 25 = bar, 0 = off, and the player moves from 24 towards 1.
+"""
+from typing import Dict, List, Optional, Tuple
+
+Step = Tuple[int, int]  # (from, to)
+
+BAR = 25
+OFF = 0
+
+
+def _to_internal(p_board: List[int], o_board: List[int]):
+    """
+    pts[1..24] = our checkers, pts[25] = our bar.
+    opp[q]     = opponent checkers on OUR point q (their point 25-q), opp[0] = their bar.
+    """
+    pts = [0] * 26
+    opp = [0] * 26
+    for i in range(1, 25):
+        pts[i] = p_board[i]
+        opp[25 - i] = o_board[i]
+    pts[BAR] = p_board[0]
+    opp[0] = o_board[0]
+    return pts, opp
+
+
+def _step(pts: List[int], opp: List[int], frm: int, die: int):
+    """Returns (pts, opp, to) after moving one checker frm -> frm-die, or None if illegal."""
+    if pts[frm] == 0:
+        return None
+    if pts[BAR] and frm != BAR:
+        return None
+
+    to = frm - die
+    if to >= 1:
+        if opp[to] >= 2:
+            return None
+        pts, opp = pts[:], opp[:]
+        pts[frm] -= 1
+        pts[to] += 1
+        if opp[to] == 1:  # hit
+            opp[to] = 0
+            opp[0] += 1
+        return pts, opp, to
+
+    # Bearing off: everything must be home (points 1-6).
+    if any(pts[i] for i in range(7, 26)):
+        return None
+    if to < 0 and any(pts[i] for i in range(frm + 1, 7)):
+        return None  # higher die only bears off from the highest occupied point
+    pts = pts[:]
+    pts[frm] -= 1
+    return pts, opp, OFF
+
+
+def _max_dice(pts, opp, dice: Tuple[int, ...], memo: dict) -> int:
+    """Most dice playable from here. Blocks never change during a turn, so `pts` alone keys the memo."""
+    key = (tuple(pts), dice)
+    if key in memo:
+        return memo[key]
+    best = 0
+    for die in sorted(set(dice), reverse=True):
+        rest = list(dice)
+        rest.remove(die)
+        rest = tuple(rest)
+        for frm in range(BAR, 0, -1):
+            nxt = _step(pts, opp, frm, die)
+            if nxt is None:
+                continue
+            best = max(best, 1 + _max_dice(nxt[0], nxt[1], rest, memo))
+            if best == len(dice):
+                break
+        if best == len(dice):
+            break
+    memo[key] = best
+    return best
+
+
+def _roll(pts, opp, dice: List[int]):
+    """(dice to play, how many of them must be played) under the "as many dice as possible" rules."""
+    d1, d2 = dice[0], dice[1]
+    roll = [d1] * 4 if d1 == d2 else [d1, d2]
+    most = _max_dice(pts, opp, tuple(roll), {})
+    if most == 1 and d1 != d2:
+        # Only one die can be played: the larger one if it can be.
+        big = max(d1, d2)
+        if any(_step(pts, opp, frm, big) for frm in range(BAR, 0, -1)):
+            return [big], 1
+        return [min(d1, d2)], 1
+    return roll, most
+
+
+def _sequences(pts, opp, dice: List[int], left: int, path: List[Step]):
+    """Yields (path, pts, opp) for every way to play `left` of the dice, larger die first."""
+    if left == 0:
+        yield path, pts, opp
+        return
+    for die in sorted(set(dice), reverse=True):
+        rest = list(dice)
+        rest.remove(die)
+        for frm in range(BAR, 0, -1):
+            nxt = _step(pts, opp, frm, die)
+            if nxt is not None:
+                n_pts, n_opp, to = nxt
+                yield from _sequences(n_pts, n_opp, rest, left - 1, path + [(frm, to)])
+
+
+def legal_moves(p_board: List[int], o_board: List[int], dice: List[int], limit: int = None) -> List[List[Step]]:
+    """
+    All legal plays for the roll, one per distinct resulting position.
+    Applies the "use as many dice as possible" and "play the larger die if
+    only one can be played" rules. An empty list means no legal move.
+    limit stops after that many plays (2 is enough to tell a forced move).
+    """
+    if not dice[0] or not dice[1]:
+        return []
+    pts, opp = _to_internal(p_board, o_board)
+    roll, most = _roll(pts, opp, dice)
+    if most == 0:
+        return []
+
+    plays: Dict[tuple, List[Step]] = {}
+    for path, f_pts, f_opp in _sequences(pts, opp, roll, most, []):
+        plays.setdefault(tuple(f_pts) + tuple(f_opp), path)
+        if limit and len(plays) >= limit:
+            break
+    return list(plays.values())
+
+
+def _layout_after(p_board: List[int], steps) -> Optional[tuple]:
+    """Our checker layout after from/to steps (hits do not change it), None if impossible."""
+    pts = [0] * 26
+    for i in range(1, 25):
+        pts[i] = p_board[i]
+    pts[BAR] = p_board[0]
+    for s in steps:
+        frm, to = (s["from"], s["to"]) if isinstance(s, dict) else s
+        if not (0 < frm <= BAR and 0 <= to < frm) or pts[frm] == 0:
+            return None
+        pts[frm] -= 1
+        if to != OFF:
+            pts[to] += 1
+    return tuple(pts)
+
+
+def _reaches(pts, opp, dice: List[int], left: int, target: tuple, memo: set) -> bool:
+    """True if playing `left` more dice can end in the layout `target`; memo holds dead ends."""
+    if left == 0:
+        return tuple(pts) == target
+    key = (tuple(pts), tuple(sorted(dice)))
+    if key in memo:
+        return False
+    for die in set(dice):
+        rest = list(dice)
+        rest.remove(die)
+        for frm in range(BAR, 0, -1):
+            nxt = _step(pts, opp, frm, die)
+            if nxt is not None and _reaches(nxt[0], nxt[1], rest, left - 1, target, memo):
+                return True
+    memo.add(key)
+    return False
+
+
+def is_legal(p_board: List[int], o_board: List[int], dice: List[int], steps) -> bool:
+    """
+    True if the move (atomic or reduced from/to pairs, dicts or tuples) ends
+    in the same layout as some legal play. An empty move is legal only when
+    nothing can be played. Searches for that one layout only, without
+    listing every play.
+    """
+    if not dice[0] or not dice[1]:
+        return not steps
+    pts, opp = _to_internal(p_board, o_board)
+    roll, most = _roll(pts, opp, dice)
+    if not steps:
+        return most == 0
+    target = _layout_after(p_board, steps)
+    if target is None or most == 0:
+        return False
+    return _reaches(pts, opp, roll, most, target, set())
+
+
+def apply_move(p_board: List[int], o_board: List[int], steps) -> Tuple[List[int], List[int]]:
+    """(p_board, o_board) after playing steps (from/to pairs), hits sent to the opponent's bar."""
+    pts, opp = _to_internal(p_board, o_board)
+    for s in steps:
+        frm, to = (s["from"], s["to"]) if isinstance(s, dict) else s
+        pts[frm] -= 1
+        if to != OFF:
+            pts[to] += 1
+            if opp[to] == 1:
+                opp[to] = 0
+                opp[0] += 1
+    p = [pts[BAR]] + pts[1:25]
+    o = [opp[0]] + [opp[25 - i] for i in range(1, 25)]
+    return p, o
+
+
+def format_move(p_board: List[int], o_board: List[int], steps: List[Step]) -> str:
+    """
+    gnubg's notation for a play (FormatMove in gnubg's drawboard.c), e.g.
+    'bar/22 13/7*/5 6/5(2)': moves sorted from the highest point, one
+    checker's moves joined (a point where it hit stays in, marked '*'),
+    identical checker paths grouped with a count.
+    """
+    def name(pt: int) -> str:
+        return "bar" if pt == BAR else "off" if pt == OFF else str(pt)
+
+    _, opp = _to_internal(p_board, o_board)  # opp[pt] > 0: a blot there is hit
+    paths = [list(m) for m in sorted(steps, reverse=True)]
+    for i, path in enumerate(paths):
+        for j in range(i + 1, len(paths)):
+            if path and paths[j] and path[-1] == paths[j][0]:
+                if opp[path[-1]]:
+                    path.append(paths[j][1])
+                else:
+                    path[-1] = paths[j][1]
+                paths[j] = None
+
+    groups: List[list] = []  # [path, count], first occurrence first
+    for path in filter(None, paths):
+        for g in groups:
+            if g[0] == path:
+                g[1] += 1
+                break
+        else:
+            groups.append([path, 1])
+
+    hit, tokens = set(), []
+    for path, count in groups:
+        token = name(path[0])
+        for pt in path[1:-1]:
+            token += f"/{name(pt)}*"
+            hit.add(pt)
+        dest = path[-1]
+        token += f"/{name(dest)}"
+        if dest != OFF and opp[dest] and dest not in hit:
+            token += "*"
+            hit.add(dest)
+        if count > 1:
+            token += f"({count})"
+        tokens.append(token)
+    return " ".join(tokens)
@@ -0,0 +1,142 @@
+# opening.py
+"""
+Precomputed analysis table (openings, early replies, frequent positions).
+
+File layout, all integers little-endian:
+    b"GNBGTBL1"
+    u32 meta_len, meta (JSON: settings the table was built with)
+    u32 count
+    count x (16-byte key digest, u32 offset, u32 length), sorted by digest
+    values: JSON results (same shape as the result cache), offsets from here
+
+The file is memory-mapped and searched in place, so loading is instant and
+the pages are shared between service processes.
+"""
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+MAGIC = b"GNBGTBL1"
+DIGEST = 16
+_RECORD = struct.Struct(f"<{DIGEST}sII")
+_U32 = struct.Struct("<I")
+
+
+def digest(key: bytes) -> bytes:
+    """Fixed-size table key for a cache.make_key() key."""
+    return hashlib.blake2b(key, digest_size=DIGEST).digest()
+
+
+def write_table(path: str, entries: Dict[bytes, dict], meta: dict):
+    """Writes entries (digest(key) -> result) as a table file, replacing path."""
+    blobs = sorted((d, json.dumps(v, separators=(",", ":")).encode("utf-8")) for d, v in entries.items())
+    meta_blob = json.dumps(dict(meta, count=len(blobs)), sort_keys=True).encode("utf-8")
+
+    index = bytearray()
+    offset = 0
+    for d, blob in blobs:
+        index += _RECORD.pack(d, offset, len(blob))
+        offset += len(blob)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_U32.pack(len(meta_blob)))
+        f.write(meta_blob)
+        f.write(_U32.pack(len(blobs)))
+        f.write(index)
+        for _, blob in blobs:
+            f.write(blob)
+    os.replace(tmp, path)
+
+
+class _Digests:
+    """Sequence view of the sorted digests, for bisect."""
+
+    def __init__(self, buf, start: int, count: int):
+        self._buf, self._start, self._count = buf, start, count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        pos = self._start + i * _RECORD.size
+        return self._buf[pos:pos + DIGEST]
+
+
+class OpeningTable:
+    """Read-only, memory-mapped table; get() returns a fresh result dict or None."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._buf[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not an analysis table")
+        pos = len(MAGIC)
+        (meta_len,) = _U32.unpack_from(self._buf, pos)
+        pos += _U32.size
+        self.meta = json.loads(self._buf[pos:pos + meta_len])
+        pos += meta_len
+        (self.count,) = _U32.unpack_from(self._buf, pos)
+        pos += _U32.size
+
+        self._index = pos
+        self._values = pos + self.count * _RECORD.size
+        self._digests = _Digests(self._buf, self._index, self.count)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes, count: bool = True) -> Optional[dict]:
+        d = digest(key)
+        i = bisect.bisect_left(self._digests, d)
+        if i == self.count or self._digests[i] != d:
+            self.misses += count
+            return None
+        _, offset, length = _RECORD.unpack_from(self._buf, self._index + i * _RECORD.size)
+        start = self._values + offset
+        self.hits += count
+        return json.loads(self._buf[start:start + length])
+
+    def items(self) -> Iterable[Tuple[bytes, dict]]:
+        """(digest, result) pairs, for rebuilding a bigger table."""
+        for i in range(self.count):
+            d, offset, length = _RECORD.unpack_from(self._buf, self._index + i * _RECORD.size)
+            start = self._values + offset
+            yield d, json.loads(self._buf[start:start + length])
+
+    def stats(self) -> dict:
+        return {"path": self.path, "entries": self.count, "hits": self.hits, "misses": self.misses, "meta": self.meta}
+
+    def close(self):
+        self._buf.close()
+        self._file.close()
+
+
+_table = None
+_table_lock = threading.Lock()
+_loaded = False
+
+
+def load(path: Optional[str]) -> Optional[OpeningTable]:
+    """Maps the table at path once; a missing file just disables the table."""
+    global _table, _loaded
+    with _table_lock:
+        if not _loaded:
+            _loaded = True
+            try:
+                _table = OpeningTable(path) if path else None
+            except FileNotFoundError:
+                _table = None
+    return _table
+
+
+def get_table() -> Optional[OpeningTable]:
+    return _table
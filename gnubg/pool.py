@@ -0,0 +1,376 @@
+# pool.py
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from typing import List, Optional
+
+
+class WorkerError(Exception):
+    """Worker process died or produced no usable output."""
+
+
+class WorkerTimeout(WorkerError):
+    """Worker did not finish the job in time and was killed."""
+
+
+class PoolExhausted(WorkerError):
+    """No idle worker became available in time."""
+
+
+class JobCancelled(WorkerError):
+    """The caller gave up on the job (client gone, deadline passed) and the worker was stopped."""
+
+
+class JobError(Exception):
+    """The worker is healthy but reported an error for this job."""
+
+
+# Abort flag of the job running in this context (set by engine.AsyncEngine.run); once set, the job is dropped.
+ABORT: "contextvars.ContextVar[Optional[threading.Event]]" = contextvars.ContextVar("abort", default=None)
+
+# Threads the scheduler gave the job running in this context (engine.AsyncEngine.run); None = leave as is.
+JOB_THREADS: "contextvars.ContextVar[Optional[int]]" = contextvars.ContextVar("job_threads", default=None)
+
+# Seconds between abort checks while waiting for output.
+ABORT_POLL = 0.05
+
+# How long an interrupted gnubg gets to finish the abandoned job before it is killed.
+INTERRUPT_GRACE = 1.0
+
+
+# --- 1. SINGLE WORKER ---
+
+class GnubgWorker:
+    """
+    One long-lived `gnubg -t -q` process.
+    Commands are written to stdin; the end of a job is detected by a unique
+    sentinel printed through gnubg's embedded Python (`>print(...)`).
+    """
+
+    EXIT_LINE = "exit"
+
+    _ids = itertools.count(1)
+
+    def __init__(self, cmd: List[str], init_commands: List[str], cwd: str = None, cpus: List[int] = None):
+        self.cmd = cmd
+        self.init_commands = list(init_commands)
+        self.cwd = cwd
+        self.cpus = cpus  # pinned to these CPUs (scheduler.py), None = anywhere
+        self.threads: Optional[int] = None  # last "set threads" sent to this process
+        self.worker_id = next(self._ids)
+        self.jobs_done = 0
+        self.restarts = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self._proc: Optional[subprocess.Popen] = None
+        self._lines: Optional[queue.Queue] = None
+        self._started = False
+        self._seq = itertools.count(1)
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._proc.pid if self._proc else None
+
+    def start(self, timeout: float):
+        self._started = True
+        self._proc = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            cwd=self.cwd,
+        )
+        if self.cpus:
+            # Before warm-up: gnubg's evaluation threads are created later and inherit the mask.
+            try:
+                os.sched_setaffinity(self._proc.pid, self.cpus)
+            except (AttributeError, OSError):
+                pass
+        self.threads = None
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=self._pump, args=(self._proc.stdout, self._lines),
+            name=f"gnubg-worker-{self.worker_id}", daemon=True
+        ).start()
+
+        self._warm_up(timeout)
+
+    def _warm_up(self, timeout: float):
+        # Load weights / bearoff db / MET once and drain the banner.
+        self.run(self.init_commands, timeout=timeout)
+
+    @staticmethod
+    def _pump(stream, lines: queue.Queue):
+        for line in stream:
+            lines.put(line)
+        lines.put(None)  # EOF marker
+
+    def stop(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if proc.poll() is None:
+                proc.stdin.write(self.EXIT_LINE + "\n")
+                proc.stdin.flush()
+                proc.wait(timeout=2.0)
+        except Exception:
+            pass
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def kill(self):
+        proc, self._proc = self._proc, None
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def restart(self, timeout: float):
+        self.kill()
+        self.restarts += 1
+        self.start(timeout)
+
+    def ensure_running(self, timeout: float):
+        """Starts the process on first use, replaces it if it crashed or was killed."""
+        if self.alive:
+            return
+        if self._started:
+            self.restart(timeout)
+        else:
+            self.start(timeout)
+
+    def _send(self, text: str):
+        if not self.alive:
+            raise WorkerError(f"worker {self.worker_id} is not running")
+        try:
+            self._proc.stdin.write(text)
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.kill()
+            raise WorkerError(f"worker {self.worker_id} stdin closed: {e}")
+
+    def _read_until(self, is_last, timeout: float) -> List[str]:
+        """
+        Collects output lines up to and including the first one accepted by is_last.
+        Gives up (JobCancelled) as soon as the context's ABORT flag is set.
+        """
+        out = []
+        abort = ABORT.get()
+        deadline = time.monotonic() + timeout
+        while True:
+            if abort is not None and abort.is_set():
+                self._interrupt(is_last)
+                raise JobCancelled(f"worker {self.worker_id}: job cancelled")
+            remaining = deadline - time.monotonic()
+            try:
+                line = self._lines.get(timeout=max(min(remaining, ABORT_POLL) if abort else remaining, 0.0))
+            except queue.Empty:
+                if time.monotonic() < deadline:
+                    continue
+                self.timeouts += 1
+                self.kill()
+                raise WorkerTimeout(f"worker {self.worker_id} timed out after {timeout:.1f}s")
+
+            if line is None:
+                self.kill()
+                raise WorkerError(f"worker {self.worker_id} exited unexpectedly")
+            out.append(line)
+            if is_last(line):
+                return out
+
+    def _interrupt(self, is_last):
+        """
+        Stops the running job: SIGINT makes gnubg abandon the evaluation, and
+        once the job's end marker comes through the worker is clean and stays
+        warm. If it does not come back within INTERRUPT_GRACE it is killed
+        (and restarted on its next checkout).
+        """
+        self.cancelled += 1
+        proc = self._proc
+        if proc is None or proc.poll() is not None:
+            return
+        try:
+            proc.send_signal(signal.SIGINT)
+        except OSError:
+            pass
+        deadline = time.monotonic() + INTERRUPT_GRACE
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                line = self._lines.get(timeout=max(remaining, 0.0))
+            except queue.Empty:
+                break
+            if line is None:
+                break
+            if is_last(line):
+                return
+        self.kill()
+
+    def _script(self, commands: List[str], timeout: float) -> str:
+        sentinel = f"@@END-{self.worker_id}-{next(self._seq)}@@"
+        self._send("\n".join(commands + [f">print('{sentinel}', flush=True)"]) + "\n")
+
+        out = self._read_until(lambda line: line.rstrip("\r\n") == sentinel, timeout)
+        return "".join(out[:-1])
+
+    def run(self, commands: List[str], timeout: float) -> str:
+        """Feeds commands and returns everything gnubg printed for them."""
+        out = self._script(commands, timeout)
+        self.jobs_done += 1
+        return out
+
+    def _configure(self, commands: List[str], timeout: float):
+        self._script(commands, timeout)
+
+    def set_threads(self, threads: int, timeout: float):
+        """Switches gnubg's evaluation thread count (only sent when it changes)."""
+        if threads != self.threads:
+            self._configure([f"set threads {threads}"], timeout)
+            self.threads = threads
+
+
+class ModuleWorker(GnubgWorker):
+    """
+    gnubg running gnubg_worker.py through its embedded Python (`gnubg -t -q -p`).
+    Speaks one JSON object per line in each direction; results come back
+    already structured, so nothing has to be scraped from hint text.
+    """
+
+    EXIT_LINE = '{"op": "exit"}'
+
+    def _warm_up(self, timeout: float):
+        self.call({"op": "init", "commands": self.init_commands}, timeout=timeout)
+
+    def _request(self, request: dict, timeout: float) -> dict:
+        req_id = next(self._seq)
+        self._send(json.dumps(dict(request, id=req_id)) + "\n")
+
+        prefix = '{"id": %d,' % req_id
+        out = self._read_until(lambda line: line.startswith(prefix), timeout)
+        resp = json.loads(out[-1])
+        if not resp.get("ok"):
+            raise JobError(resp.get("error", "unknown worker error"))
+        return resp["result"]
+
+    def call(self, request: dict, timeout: float) -> dict:
+        try:
+            return self._request(request, timeout)
+        finally:
+            self.jobs_done += 1
+
+    def _configure(self, commands: List[str], timeout: float):
+        self._request({"op": "init", "commands": commands}, timeout)
+
+
+# --- 2. POOL ---
+
+class GnubgPool:
+    """
+    Fixed-size pool of GnubgWorker processes.
+    Workers are started lazily; crashed or hung workers are replaced on the
+    next checkout so a single bad job never takes a slot down for good.
+    """
+
+    def __init__(self, cmd: List[str], init_commands: List[str], size: int,
+                 start_timeout: float = 60.0, cwd: str = None, worker_cls=GnubgWorker,
+                 cpusets: List[List[int]] = None):
+        if size < 1:
+            raise ValueError("pool size must be >= 1")
+        self.size = size
+        self.start_timeout = start_timeout
+        # LIFO keeps the most recently used (warmest eval cache) worker busy.
+        self._idle: queue.Queue = queue.LifoQueue()
+        self._workers = [worker_cls(cmd, init_commands, cwd=cwd, cpus=cpusets[i] if cpusets else None)
+                         for i in range(size)]
+        self._closed = False
+        for w in self._workers:
+            self._idle.put(w)
+
+    def _checkout(self, timeout: float) -> GnubgWorker:
+        if self._closed:
+            raise WorkerError("pool is closed")
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolExhausted(f"no idle gnubg worker within {timeout:.1f}s")
+
+        try:
+            worker.ensure_running(self.start_timeout)
+        except Exception:
+            worker.kill()
+            self._idle.put(worker)
+            raise
+        return worker
+
+    def _dispatch(self, job, timeout: float):
+        start = time.monotonic()
+        worker = self._checkout(timeout)
+        try:
+            threads = JOB_THREADS.get()
+            if threads:
+                worker.set_threads(threads, max(timeout - (time.monotonic() - start), 0.1))
+            remaining = max(timeout - (time.monotonic() - start), 0.1)
+            return job(worker, remaining)
+        finally:
+            # A failed worker is left dead and restarted on its next checkout.
+            self._idle.put(worker)
+
+    def run(self, commands: List[str], timeout: float) -> str:
+        """Text job on a GnubgWorker: returns the raw gnubg output."""
+        return self._dispatch(lambda w, t: w.run(commands, t), timeout)
+
+    def call(self, request: dict, timeout: float) -> dict:
+        """JSON job on a ModuleWorker: returns the structured result."""
+        return self._dispatch(lambda w, t: w.call(request, t), timeout)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "alive": sum(1 for w in self._workers if w.alive),
+            "jobs_done": sum(w.jobs_done for w in self._workers),
+            "restarts": sum(w.restarts for w in self._workers),
+            "timeouts": sum(w.timeouts for w in self._workers),
+            "cancelled": sum(w.cancelled for w in self._workers),
+        }
+
+    def close(self):
+        self._closed = True
+        for w in self._workers:
+            w.stop()
+
+
+_pools: List[GnubgPool] = []
+
+
+def register(pool: GnubgPool) -> GnubgPool:
+    """Tracks a pool so its processes are shut down at interpreter exit."""
+    _pools.append(pool)
+    return pool
+
+
+def pools() -> List[GnubgPool]:
+    """Every registered pool (for stats and metrics)."""
+    return list(_pools)
+
+
+@atexit.register
+def _close_all():
+    for p in _pools:
+        p.close()
@@ -0,0 +1,146 @@
+# reqlog.py
+"""
+Request log: one structured (JSON) record per answered request, formatted
+and written by a background thread (QueueHandler -> QueueListener), so the
+request path only pays for building a small dict and a queue put.
+
+GNUBG_LOG_LEVEL   error | warning | info (one line per request) | debug (plus
+                  the board view of every request and its raw engine output)
+GNUBG_LOG_SAMPLE  fraction of info-level requests that keep the raw engine
+                  output; errors always keep it
+GNUBG_LOG_FILE    JSONL file instead of stderr. Lines carry the request body
+                  under "request", so build_opening.py extend can read them.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+import tracing
+import visualizer
+
+LOG_LEVEL = os.environ.get("GNUBG_LOG_LEVEL", "info").upper()
+LOG_SAMPLE = float(os.environ.get("GNUBG_LOG_SAMPLE", "0.01"))
+LOG_FILE = os.environ.get("GNUBG_LOG_FILE") or None
+
+# Records waiting for the writer; beyond this they are dropped (and counted) rather than stall requests.
+LOG_QUEUE = int(os.environ.get("GNUBG_LOG_QUEUE", "10000"))
+
+logger = logging.getLogger("gnubg")
+
+
+class _Handoff(logging.handlers.QueueHandler):
+    """
+    Queues the record untouched: the stock prepare() would format it on the
+    request thread, which is exactly the work this moves off it.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _Handoff.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        out = {"ts": round(record.created, 3), "level": record.levelname.lower(), "msg": record.getMessage()}
+        out.update(getattr(record, "fields", {}))
+        req = getattr(record, "req", None)
+        if req is not None:
+            out["request"] = req.model_dump()
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, separators=(",", ":"), default=str)
+
+
+class BoardFormatter(logging.Formatter):
+    """Debug view of a request record: visualizer board, decision and raw output."""
+
+    def format(self, record) -> str:
+        decision_type = "double" if record.fields.get("kind") == "cube" else "move"
+        return visualizer.render_debug(record.req, record.response, decision_type, record.fields.get("raw"))
+
+
+def _is_answer(record) -> bool:
+    return getattr(record, "response", None) is not None
+
+
+def _setup():
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+    out = logging.FileHandler(LOG_FILE, encoding="utf-8") if LOG_FILE else logging.StreamHandler(sys.stderr)
+    out.setFormatter(JsonFormatter())
+    handlers = [out]
+    if logger.isEnabledFor(logging.DEBUG):
+        board = logging.StreamHandler(sys.stdout)
+        board.setFormatter(BoardFormatter())
+        board.addFilter(_is_answer)
+        handlers.append(board)
+
+    q = queue.Queue(maxsize=LOG_QUEUE)
+    listener = logging.handlers.QueueListener(q, *handlers)
+    listener.start()
+    atexit.register(listener.stop)  # flushes what is still queued
+    logger.addHandler(_Handoff(q))
+
+
+_setup()
+
+
+def _fields(kind: str) -> dict:
+    """Correlation ID and the IDs/source the handler already put on the trace."""
+    trace = tracing.current()
+    attrs = trace.attrs if trace is not None else {}
+    return {
+        "request_id": trace.request_id if trace is not None else None,
+        "kind": kind,
+        "pos_id": attrs.get("pos_id"),
+        "match_id": attrs.get("match_id"),
+        "source": attrs.get("source"),
+    }
+
+
+def request(req, response, kind: str, raw: str = None):
+    """Answered request (kind: move, cube or full); raw output only if debugging or sampled."""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    fields = _fields(kind)
+    fields.update(
+        dice=req.dice,
+        move=response.best_move_raw,
+        cube_action=response.cube_action,
+        ply=response.ply,
+    )
+    if raw and (logger.isEnabledFor(logging.DEBUG) or random.random() < LOG_SAMPLE):
+        fields["raw"] = raw
+    logger.info("request", extra={"fields": fields, "req": req, "response": response})
+
+
+def error(req, kind: str, err, exc_info: bool = False):
+    """Failed request; the error text (the engine output for engine errors) is always kept."""
+    fields = _fields(kind)
+    fields["error"] = str(err)
+    logger.error("request failed", extra={"fields": fields, "req": req}, exc_info=exc_info)
+
+
+def cancelled(req, kind: str, reason: str):
+    """Request given up before it was answered; its engine work was cancelled."""
+    fields = _fields(kind)
+    fields["cancelled"] = reason
+    logger.warning("request cancelled", extra={"fields": fields, "req": req})
+
+
+def dropped() -> int:
+    """Records dropped because the writer fell LOG_QUEUE behind."""
+    return _Handoff.dropped
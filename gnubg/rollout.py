@@ -0,0 +1,392 @@
+# rollout.py
+"""
+Cube-decision rollouts as background jobs (money games).
+
+A job rolls out the no-double position and the double/take position (cube
+turned, opponent owns it) with gnubg's `rollout` command. The two run in
+two gnubg processes with the same seed, so both see the same dice and their
+difference is less noisy than two independent rollouts.
+
+gnubg only prints rollout progress when stdout is a terminal, so each
+process writes to a pty. The progress blocks, every tenth of the trials,
+are parsed into the job's progress: trials, equities and 95% confidence
+intervals.
+
+Finished results go to backends.store_rollout. From then on, cube hints for
+the same position answer from the rollout (source "rollout").
+
+Rollout processes run outside the engine's slots but not outside its CPU
+budget: while a job runs, its two processes count as jobs for
+logic.SCHEDULER, so they and the engine's hint jobs split the cores (and,
+when pinning, rollouts stay on the scheduler's CPUs).
+
+A job is side-neutral: the doubler and the taker of the same decision share
+it, each through a RolloutView that classifies the result for its side.
+"""
+import os
+import pty
+import random
+import re
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import backends
+import engine
+import ids
+import logic
+
+# Terminal job states; everything else is "queued" or "running".
+FINAL = ("done", "cancelled", "failed")
+
+# Finished jobs kept for polling; older ones are forgotten (their results stay in the rollout store).
+KEEP_FINISHED = 200
+
+Z95 = 1.96
+
+# Each rollout is normalised to its own cube; the taken double plays for twice the stake.
+_STAKE = {"no_double": 1.0, "double_take": 2.0}
+
+_EQUITY_RE = re.compile(r"\bCL\s+[-+]?\d+\.\d+\s+CF\s+([-+]?\d+\.\d+)")
+_GAMES_RE = re.compile(r"^\s*(\d+)\s+games\b")
+
+
+def double_take_id(mid: str) -> str:
+    """Match ID after a double is taken: cube turned once, owned by the opponent, same player to roll."""
+    fields = dict(ids.decode_match_id(mid))
+    fields["cube_log2"] += 1
+    fields["cube_owner"] = 1
+    return ids.encode_match_id(fields)
+
+
+def rollout_commands(pid: str, mid: str, trials: int, plies: int, seed: int, threads: int):
+    return [
+        f"set threads {threads}",
+        f"set cache {logic.CACHE_SIZE}",
+        f"set rollout trials {trials}",
+        f"set rollout seed {seed}",
+        "set rollout cubeful on",
+        "set rollout varredn on",
+        "set rollout quasirandom on",
+        "set rollout truncation off",
+        f"set rollout chequerplay plies {plies}",
+        f"set rollout cubedecision plies {plies}",
+        f"set matchid {mid}",
+        f"set board {pid}",
+        "rollout",
+        "exit",
+    ]
+
+
+def decide(nd: float, dt: float, dp: float = 1.0):
+    """(optimal equity, recommendation) in gnubg's wording, for logic.classify_cube."""
+    optimal = max(nd, min(dt, dp))
+    if min(dt, dp) > nd:
+        return optimal, "Double, take" if dt <= dp else "Double, pass"
+    if dt > dp:
+        return optimal, "Too good to double, pass"
+    return optimal, "No double, take"
+
+
+class RolloutJob:
+    def __init__(self, pid: str, mid: str, trials: int, plies: int, seed: int):
+        self.id = uuid.uuid4().hex
+        self.pid, self.mid = pid, mid
+        self.trials, self.plies, self.seed = trials, plies, seed
+        self.status = "queued"
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Per rolled-out position: latest (games, equity, stddev) in units of the current cube.
+        self.progress = {"no_double": None, "double_take": None}
+        self.version = 0  # bumped on every change, for the SSE stream
+        self.views = 0  # RolloutViews not cancelled; the last one cancelling stops the job
+        self._cancel = threading.Event()
+        self._procs = []
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return self.pid, self.mid, self.trials, self.plies
+
+    def _changed(self, **attrs):
+        with self._lock:
+            for k, v in attrs.items():
+                setattr(self, k, v)
+            self.version += 1
+
+    def _update(self, name: str, games: int, equity: float, stddev: float):
+        with self._lock:
+            self.progress[name] = (games, equity * _STAKE[name], stddev * _STAKE[name])
+            self.version += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            progress = dict(self.progress)
+            status, result, error, version = self.status, self.result, self.error, self.version
+        done = [p[0] for p in progress.values() if p is not None]
+        return {
+            "id": self.id,
+            "status": status,
+            "pos_id": self.pid,
+            "match_id": self.mid,
+            "trials": self.trials,
+            "plies": self.plies,
+            "seed": self.seed,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "version": version,
+            "progress": {
+                "trials_done": min(done) if len(done) == 2 else 0,
+                **{name: None if p is None else {"trials": p[0], "equity": p[1], "ci95": Z95 * p[2]}
+                   for name, p in progress.items()},
+            },
+            "result": result,
+            "error": error,
+        }
+
+    # --- running ---
+
+    def cancel(self):
+        self._cancel.set()
+        for proc in list(self._procs):
+            _kill(proc)
+        with self._lock:
+            if self.status == "queued":
+                self.status, self.finished = "cancelled", time.time()
+                self.version += 1
+
+    def run(self):
+        if self._cancel.is_set():
+            return
+        self._changed(status="running", started=time.time())
+        states = {"no_double": self.mid, "double_take": double_take_id(self.mid)}
+        outputs = {}
+
+        def roll(name: str, mid: str, threads: int):
+            outputs[name] = self._roll(name, rollout_commands(self.pid, mid, self.trials, self.plies, self.seed, threads))
+
+        try:
+            with logic.SCHEDULER.background(len(states)):
+                load = engine.get_engine()
+                threads = logic.SCHEDULER.threads(load.running + load.waiting)
+                workers = [threading.Thread(target=roll, args=(name, mid, threads), name=f"rollout-{name}")
+                           for name, mid in states.items()]
+                for w in workers:
+                    w.start()
+                for w in workers:
+                    w.join()
+
+            if self._cancel.is_set():
+                self._changed(status="cancelled", finished=time.time())
+                return
+            missing = [name for name in states if self.progress[name] is None]
+            if missing:
+                tail = (outputs.get(missing[0]) or "").strip()[-500:]
+                raise RuntimeError(f"no rollout output for {missing[0]}: {tail!r}")
+            self._finish()
+        except Exception as e:
+            self._changed(status="failed", error=str(e), finished=time.time())
+
+    def _roll(self, name: str, commands) -> str:
+        """Runs one rollout in its own gnubg on a pty, feeding progress blocks into the job; returns the output."""
+        master, slave = pty.openpty()
+        try:
+            proc = subprocess.Popen(
+                [logic.GNUBG_PATH, "-t", "-q"],
+                stdin=subprocess.PIPE, stdout=slave, stderr=slave,
+                start_new_session=True,  # own process group, so cancel() can kill it outright
+            )
+        finally:
+            os.close(slave)
+        if logic.SCHEDULER.pin:
+            try:
+                os.sched_setaffinity(proc.pid, logic.SCHEDULER.cpus)
+            except (AttributeError, OSError):
+                pass
+        self._procs.append(proc)
+        if self._cancel.is_set():
+            _kill(proc)
+
+        try:
+            proc.stdin.write(("\n".join(commands) + "\n").encode("utf-8"))
+            proc.stdin.close()
+        except OSError:
+            pass
+
+        out, buf, equity, stddev = [], b"", None, None
+        while True:
+            try:
+                chunk = os.read(master, 4096)
+            except OSError:  # EIO: gnubg closed the pty
+                break
+            if not chunk:
+                break
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for raw in lines:
+                line = raw.decode("utf-8", "replace").replace("\r", "")
+                out.append(line)
+                m = _EQUITY_RE.search(line)
+                if m:
+                    if line.lstrip().startswith("["):
+                        stddev = float(m.group(1))
+                    else:
+                        equity = float(m.group(1))
+                    continue
+                m = _GAMES_RE.match(line)
+                if m and equity is not None and stddev is not None:
+                    self._update(name, int(m.group(1)), equity, stddev)
+        os.close(master)
+        proc.wait()
+        return "\n".join(out)
+
+    def _finish(self):
+        games_nd, nd, sd_nd = self.progress["no_double"]
+        games_dt, dt, sd_dt = self.progress["double_take"]
+        optimal, recommendation = decide(nd, dt)
+        cube_equities = {"no_double": nd, "double_take": dt, "double_pass": 1.0, "optimal": optimal}
+        details = {
+            "trials": min(games_nd, games_dt),
+            "plies": self.plies,
+            "seed": self.seed,
+            "ci95": {"no_double": Z95 * sd_nd, "double_take": Z95 * sd_dt},
+        }
+        result = {"cube_equities": cube_equities, "recommendation": recommendation, "rollout": details}
+        backends.store_rollout(self.pid, self.mid, result)
+        self._changed(status="done", finished=time.time(), result=result)
+
+
+class RolloutView:
+    """
+    One side's handle on a (possibly shared) job: its snapshot classifies the
+    decision for that side. Cancelling a view detaches it; the job itself is
+    only stopped when no other view is left (RolloutManager.cancel).
+    """
+
+    def __init__(self, job: RolloutJob, receiving_double: bool):
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self.receiving_double = receiving_double
+        self.cancelled = False
+        job.views += 1
+
+    @property
+    def status(self) -> str:
+        return "cancelled" if self.cancelled else self.job.status
+
+    @property
+    def version(self) -> int:
+        return self.job.version + self.cancelled
+
+    def detach(self) -> bool:
+        """Cancels this view; True if it was the job's last one."""
+        if self.cancelled:
+            return False
+        self.cancelled = True
+        self.job.views -= 1
+        return self.job.views == 0
+
+    def snapshot(self) -> dict:
+        snap = self.job.snapshot()
+        if self.cancelled:
+            snap["status"], snap["result"] = "cancelled", None
+        snap["version"] += self.cancelled
+        snap["id"] = self.id
+        snap["receiving_double"] = self.receiving_double
+        result = snap["result"]
+        if result is not None:
+            c_act, c_txt = logic.classify_cube(result["recommendation"], self.receiving_double)
+            snap["result"] = {"cube_action": c_act, "cube_text": c_txt, **result}
+        return snap
+
+
+def _kill(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+# --- JOB REGISTRY ---
+
+class RolloutManager:
+    """
+    Runs up to logic.ROLLOUT_JOBS jobs at once; identical unfinished
+    submissions share one job, whichever side of the double they are on.
+    Job ids handed out are RolloutView ids, one per side.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(workers, 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rollout")
+        self._jobs: "OrderedDict[str, RolloutView]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, pid: str, mid: str, receiving_double: bool,
+               trials: int = None, plies: int = 0, seed: int = None) -> RolloutView:
+        job = RolloutJob(pid, mid, trials or logic.ROLLOUT_TRIALS, plies,
+                         seed if seed is not None else random.randrange(1 << 31))
+        with self._lock:
+            shared = None
+            for view in self._jobs.values():
+                other = view.job
+                if other.key == job.key and other.status not in FINAL and (seed is None or other.seed == seed):
+                    if view.cancelled:
+                        continue
+                    if view.receiving_double == receiving_double:
+                        return view
+                    shared = other
+            view = RolloutView(shared or job, receiving_double)
+            self._jobs[view.id] = view
+            self._trim()
+        if shared is None:
+            self._executor.submit(job.run)
+        return view
+
+    def get(self, job_id: str) -> Optional[RolloutView]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[RolloutView]:
+        """Detaches the view; the shared job is stopped once every view on it is cancelled."""
+        view = self.get(job_id)
+        if view is not None:
+            with self._lock:
+                last = view.detach()
+            if last:
+                view.job.cancel()
+        return view
+
+    def _trim(self):
+        finished = [v.id for v in self._jobs.values() if v.status in FINAL]
+        for job_id in finished[:max(len(finished) - KEEP_FINISHED, 0)]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in {v.job.id: v.job for v in self._jobs.values()}.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "jobs": counts,
+                "stored": backends.get_rollout_store().stats()["entries"]}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> RolloutManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = RolloutManager(logic.ROLLOUT_JOBS)
+    return _manager
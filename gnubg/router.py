@@ -0,0 +1,530 @@
+# router.py
+"""
+Sharding front for several copies of this service (main.py).
+
+Each copy keeps its own result cache, so round-robin balancing stores every
+popular position once per copy and each copy only sees its share of the
+repeats. The router sends each request by a hash of its (pos_id, match_id)
+over a consistent-hash ring instead: a position always reaches the same
+copy, and adding or removing a copy only moves the keys that copy owns.
+
+    GNUBG_SHARDS=http://127.0.0.1:5008,http://127.0.0.1:5009 python router.py
+
+Nodes are health-checked in the background (GET /engine/stats). A node that
+fails GNUBG_SHARD_FAIL_AFTER checks in a row, or drops a forwarded request
+on the floor, is skipped until a check succeeds again. Its keys go to the
+next node clockwise, and so does a request whose node cannot be reached.
+Engine errors (500) and backpressure (503 + Retry-After) come from a live
+node and are passed through as they are. Nodes are added and removed at
+runtime through /router/nodes.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+import logic
+import tracing
+from models import HintRequest, HintResponse, RolloutRequest
+
+# Comma-separated base URLs of the analysis nodes.
+SHARDS = [u.strip() for u in os.environ.get("GNUBG_SHARDS", "").split(",") if u.strip()]
+
+# Ring points per node; more points = more even key shares.
+VNODES = int(os.environ.get("GNUBG_SHARD_VNODES", "160"))
+
+# Health checks: seconds between rounds, per-check timeout, failed checks before a node is skipped.
+HEALTH_INTERVAL = float(os.environ.get("GNUBG_SHARD_HEALTH_INTERVAL", "2"))
+HEALTH_TIMEOUT = float(os.environ.get("GNUBG_SHARD_HEALTH_TIMEOUT", "1"))
+FAIL_AFTER = int(os.environ.get("GNUBG_SHARD_FAIL_AFTER", "2"))
+
+# Forwarded requests: connect timeout (failover is quick) and total timeout (3-ply runs are not).
+CONNECT_TIMEOUT = float(os.environ.get("GNUBG_SHARD_CONNECT_TIMEOUT", "1"))
+REQUEST_TIMEOUT = float(os.environ.get("GNUBG_SHARD_TIMEOUT", str(2 * logic.TIMEOUT)))
+
+# Rollout job IDs remembered with the node that runs them.
+KEEP_JOBS = 1000
+
+# The node is gone (or never answered): try the next one. A read timeout is not here, the node is only slow.
+FAILOVER_ERRORS = (httpx.NetworkError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+# Response headers worth passing back to the client.
+PASS_HEADERS = ("content-type", "retry-after", tracing.REQUEST_ID_HEADER.lower())
+
+SHARD_HEADER = "X-Shard-Node"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# --- 1. RING ---
+
+class HashRing:
+    """Consistent-hash ring with `vnodes` points per node."""
+
+    def __init__(self, vnodes: int = VNODES):
+        self.vnodes = vnodes
+        self._nodes = set()
+        self._points: List[int] = []
+        self._owners: List[str] = []
+
+    def add(self, node: str):
+        if node not in self._nodes:
+            self._nodes.add(node)
+            self._rebuild()
+
+    def remove(self, node: str):
+        if node in self._nodes:
+            self._nodes.discard(node)
+            self._rebuild()
+
+    def _rebuild(self):
+        pairs = sorted((_hash(f"{node}#{i}"), node) for node in self._nodes for i in range(self.vnodes))
+        # Swapped together, so a concurrent preference() sees the old ring or the new one.
+        self._points, self._owners = [h for h, _ in pairs], [n for _, n in pairs]
+
+    def preference(self, key: str) -> List[str]:
+        """Distinct nodes clockwise from the key: the owner first, then the ones that take over from it."""
+        points, owners = self._points, self._owners
+        out = []
+        start = bisect.bisect(points, _hash(key))
+        for i in range(len(points)):
+            node = owners[(start + i) % len(points)]
+            if node not in out:
+                out.append(node)
+                if len(out) == len(self._nodes):
+                    break
+        return out
+
+    def shares(self) -> Dict[str, float]:
+        """Fraction of the key space each node owns."""
+        points, owners = self._points, self._owners
+        out = {node: 0.0 for node in self._nodes}
+        for i, node in enumerate(owners):
+            # Point i owns the arc from the previous point up to it.
+            out[node] += ((points[i] - points[i - 1]) % (1 << 64)) / float(1 << 64)
+        if len(points) == 1:
+            out[owners[0]] = 1.0
+        return out
+
+
+# --- 2. NODES ---
+
+class Node:
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = False    # until the first health check passes
+        self.failures = 0       # consecutive failed health checks
+        self.forwarded = 0      # requests answered
+        self.dropped = 0        # forwarded requests lost to connection errors
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def stats(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "forwarded": self.forwarded,
+            "dropped": self.dropped,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+        }
+
+
+class NoNode(Exception):
+    """No healthy node is left for the request."""
+
+
+class ShardRouter:
+    def __init__(self, urls: List[str], vnodes: int = VNODES):
+        self.ring = HashRing(vnodes)
+        self.nodes: Dict[str, Node] = {}
+        self.failovers = 0
+        self.client: Optional[httpx.AsyncClient] = None
+        for url in urls:
+            self.add(url)
+
+    def add(self, url: str) -> Node:
+        url = url.rstrip("/")
+        node = self.nodes.get(url)
+        if node is None:
+            node = self.nodes[url] = Node(url)
+            self.ring.add(url)
+        return node
+
+    def remove(self, url: str) -> Optional[Node]:
+        node = self.nodes.pop(url.rstrip("/"), None)
+        if node is not None:
+            self.ring.remove(node.url)
+        return node
+
+    def route(self, key: str) -> List[Node]:
+        """Healthy nodes in failover order for the key (its owner first)."""
+        nodes = [self.nodes.get(url) for url in self.ring.preference(key)]
+        return [n for n in nodes if n is not None and n.healthy]
+
+    def mark_dropped(self, node: Node, err: Exception):
+        """A forwarded request hit a connection error: skip the node until a health check passes."""
+        node.dropped += 1
+        node.healthy = False
+        node.failures = max(node.failures, FAIL_AFTER)
+        node.last_error = f"{type(err).__name__}: {err}"
+
+    async def check(self, node: Node):
+        try:
+            resp = await self.client.get(node.url + "/engine/stats", timeout=HEALTH_TIMEOUT)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            node.failures += 1
+            node.last_error = f"{type(e).__name__}: {e}"
+            if node.failures >= FAIL_AFTER:
+                node.healthy = False
+        else:
+            node.failures = 0
+            node.healthy = True
+        node.last_check = time.time()
+
+    async def send(self, key: str, method: str, path: str, **kwargs):
+        """(node, response) from the first node on the key's failover list that answers."""
+        for i, node in enumerate(self.route(key)):
+            try:
+                resp = await self.client.request(method, node.url + path, **kwargs)
+            except FAILOVER_ERRORS as e:
+                self.mark_dropped(node, e)
+                continue
+            node.forwarded += 1
+            if i:
+                self.failovers += 1
+            return node, resp
+        raise NoNode("no healthy analysis node")
+
+    def stats(self) -> dict:
+        shares = self.ring.shares()
+        return {
+            "failovers": self.failovers,
+            "nodes": {url: dict(node.stats(), share=round(shares.get(url, 0.0), 4))
+                      for url, node in self.nodes.items()},
+        }
+
+
+router = ShardRouter(SHARDS)
+
+# Rollout job ID -> URL of the node running it (job IDs are only known to that node).
+_jobs: "OrderedDict[str, str]" = OrderedDict()
+
+app = FastAPI(title="Gnubg shard router", version="2.1")
+
+
+@app.on_event("startup")
+async def start_router():
+    router.client = httpx.AsyncClient(
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=64),
+    )
+    await _check_all()
+    app.state.health = asyncio.ensure_future(_health_loop())
+
+
+@app.on_event("shutdown")
+async def stop_router():
+    app.state.health.cancel()
+    await router.client.aclose()
+
+
+async def _check_all():
+    await asyncio.gather(*(router.check(node) for node in list(router.nodes.values())))
+
+
+async def _health_loop():
+    while True:
+        await asyncio.sleep(HEALTH_INTERVAL)
+        await _check_all()
+
+
+# --- 3. FORWARDING ---
+
+def _request_id(request: Request) -> str:
+    """Incoming correlation ID, or a new one, so router and node log the same ID."""
+    return request.headers.get(tracing.REQUEST_ID_HEADER) or uuid.uuid4().hex
+
+
+def _forward_headers(request_id: str) -> dict:
+    return {"Content-Type": "application/json", tracing.REQUEST_ID_HEADER: request_id}
+
+
+def _reply(node: Node, resp: httpx.Response) -> Response:
+    headers = {k: v for k, v in resp.headers.items() if k.lower() in PASS_HEADERS}
+    headers[SHARD_HEADER] = node.url
+    return Response(content=resp.content, status_code=resp.status_code, headers=headers)
+
+
+def shard_key(path: str, req: BaseModel) -> str:
+    """
+    pos_id:match_id as the node's cache keys them (canonical match ID) for this
+    endpoint. A full analysis fills both the move and the cube entry; it goes
+    by the cube key, so it lands where /get-double-decision for the position
+    will look (the cube entry serves every roll, the move entry one).
+    """
+    try:
+        if path in ("/get-double-decision", "/rollouts", "/get-full-analysis"):
+            pid, mid = logic.get_cube_ids(req.board.player_board, req.board.opponent_board,
+                                          req.match, req.double_offered)
+            kind = "cube"
+        else:
+            pid, mid, kind, _ = logic.request_ids(req)
+        mid = logic.canonical_match_id(mid, kind)
+    except Exception:
+        # Board the node will refuse anyway; any node can say so.
+        return req.model_dump_json()
+    return f"{pid}:{mid}"
+
+
+async def _forward(request: Request, path: str, model):
+    """(node, node response) for a POST routed by its shard key."""
+    body = await request.body()
+    try:
+        req = model.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    try:
+        node, resp = await router.send(shard_key(path, req), "POST", path, content=body,
+                                       headers=_forward_headers(_request_id(request)))
+    except NoNode as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except httpx.TimeoutException as e:
+        raise HTTPException(status_code=504, detail=f"analysis node timed out: {e}")
+    return node, resp
+
+
+@app.post("/get-optimal-move", response_model=HintResponse)
+async def get_optimal_move(request: Request):
+    return _reply(*await _forward(request, "/get-optimal-move", HintRequest))
+
+
+@app.post("/get-double-decision", response_model=HintResponse)
+async def get_double_decision(request: Request):
+    return _reply(*await _forward(request, "/get-double-decision", HintRequest))
+
+
+@app.post("/get-full-analysis", response_model=HintResponse)
+async def get_full_analysis(request: Request):
+    return _reply(*await _forward(request, "/get-full-analysis", HintRequest))
+
+
+_BATCH = TypeAdapter(List[HintRequest])
+
+
+def _batch_error(index: int, msg: str) -> str:
+    resp = HintResponse(status="error", pos_id="", match_id="", cube_action="unknown", cube_text="Unknown",
+                        error_msg=msg)
+    return '{"index": %d, "result": %s}\n' % (index, resp.model_dump_json(by_alias=True))
+
+
+async def _batch_part(node: Node, indices: List[int], items: list, request_id: str, lines: asyncio.Queue) -> List[int]:
+    """
+    Sends items[indices] to one node and queues its lines under the original
+    indices. Returns the indices left unanswered when the node went away.
+    """
+    left = set(indices)
+    try:
+        async with router.client.stream("POST", node.url + "/analyze-batch", json=[items[i] for i in indices],
+                                        headers=_forward_headers(request_id)) as resp:
+            if resp.status_code != 200:
+                detail = (await resp.aread()).decode("utf-8", "replace")
+                for i in indices:
+                    await lines.put(_batch_error(i, f"node answered {resp.status_code}: {detail}"))
+                left.clear()
+            else:
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    msg = json.loads(line)
+                    i = indices[msg["index"]]
+                    left.discard(i)
+                    await lines.put('{"index": %d, "result": %s}\n' % (i, json.dumps(msg["result"])))
+            node.forwarded += 1
+    except FAILOVER_ERRORS as e:
+        router.mark_dropped(node, e)
+    except httpx.TimeoutException as e:
+        for i in sorted(left):
+            await lines.put(_batch_error(i, f"analysis node timed out: {e}"))
+        left.clear()
+    finally:
+        await lines.put(None)
+    return sorted(left)
+
+
+@app.post("/analyze-batch")
+async def analyze_batch(request: Request):
+    """
+    Splits the batch by owning node, sends the parts in parallel and merges
+    their NDJSON streams (indices mapped back to this batch). Parts whose
+    node goes away mid-stream are re-sent, unanswered items only, to the
+    next node.
+    """
+    body = await request.body()
+    try:
+        reqs = _BATCH.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    items = json.loads(body)
+    keys = [shard_key("/analyze-batch", req) for req in reqs]
+    request_id = _request_id(request)
+
+    async def stream():
+        pending, rounds = list(range(len(items))), 0
+        while pending:
+            parts: Dict[str, List[int]] = {}
+            for i in pending:
+                nodes = router.route(keys[i])
+                if not nodes:
+                    yield _batch_error(i, "no healthy analysis node")
+                    continue
+                parts.setdefault(nodes[0].url, []).append(i)
+            if rounds:
+                router.failovers += sum(len(v) for v in parts.values())
+            rounds += 1
+
+            lines = asyncio.Queue()
+            tasks = [asyncio.ensure_future(_batch_part(router.nodes[url], idx, items, request_id, lines))
+                     for url, idx in parts.items()]
+            try:
+                open_parts = len(tasks)
+                while open_parts:
+                    line = await lines.get()
+                    if line is None:
+                        open_parts -= 1
+                    else:
+                        yield line
+                left = await asyncio.gather(*tasks)
+            finally:
+                # Client went away: stop the parts still streaming.
+                for task in tasks:
+                    task.cancel()
+            pending = sorted(i for part in left for i in part)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# --- 4. ROLLOUTS ---
+
+def _job_node(job_id: str) -> Node:
+    node = router.nodes.get(_jobs.get(job_id, ""))
+    if node is None:
+        raise HTTPException(status_code=404, detail=f"unknown rollout job {job_id}")
+    return node
+
+
+async def _job_request(request: Request, method: str, job_id: str) -> Response:
+    node = _job_node(job_id)
+    try:
+        resp = await router.client.request(method, f"{node.url}/rollouts/{job_id}",
+                                           headers=_forward_headers(_request_id(request)))
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"rollout node {node.url}: {e}")
+    return _reply(node, resp)
+
+
+@app.post("/rollouts", status_code=202)
+async def submit_rollout(request: Request):
+    """
+    Runs on the node that owns the position, so the finished rollout lands in
+    the rollout store that answers its cube hints.
+    """
+    node, resp = await _forward(request, "/rollouts", RolloutRequest)
+    if resp.status_code == 202:
+        _jobs[resp.json()["id"]] = node.url
+        while len(_jobs) > KEEP_JOBS:
+            _jobs.popitem(last=False)
+    return _reply(node, resp)
+
+
+@app.get("/rollouts/{job_id}")
+async def rollout_status(job_id: str, request: Request):
+    return await _job_request(request, "GET", job_id)
+
+
+@app.delete("/rollouts/{job_id}")
+async def cancel_rollout(job_id: str, request: Request):
+    return await _job_request(request, "DELETE", job_id)
+
+
+@app.get("/rollouts/{job_id}/events")
+async def rollout_events(job_id: str):
+    node = _job_node(job_id)
+
+    async def stream():
+        # No overall timeout: the stream lasts as long as the rollout.
+        async with router.client.stream("GET", f"{node.url}/rollouts/{job_id}/events",
+                                        timeout=httpx.Timeout(None, connect=CONNECT_TIMEOUT)) as resp:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# --- 5. ADMIN ---
+
+class NodeRequest(BaseModel):
+    url: str
+
+
+@app.get("/router/nodes")
+def list_nodes():
+    """
+    Nodes with health, requests forwarded and dropped, and the share of the
+    key space each owns; plus the number of requests that failed over.
+    """
+    return router.stats()
+
+
+@app.post("/router/nodes")
+async def add_node(req: NodeRequest):
+    """
+    Adds a node to the ring (it takes over about 1/N of the keys) and checks it right away.
+    """
+    node = router.add(req.url)
+    await router.check(node)
+    return router.stats()
+
+
+@app.delete("/router/nodes")
+def remove_node(url: str):
+    """
+    Takes a node out of the ring; its keys move to the next nodes clockwise.
+    """
+    if router.remove(url) is None:
+        raise HTTPException(status_code=404, detail=f"unknown node {url}")
+    return router.stats()
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    /cache/stats of every node, by URL.
+    """
+    async def one(node: Node):
+        try:
+            resp = await router.client.get(node.url + "/cache/stats", timeout=HEALTH_TIMEOUT)
+            return node.url, resp.json()
+        except (httpx.HTTPError, ValueError) as e:
+            return node.url, {"error": str(e)}
+
+    return dict(await asyncio.gather(*(one(node) for node in list(router.nodes.values()))))
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("GNUBG_ROUTER_PORT", "5007")))
@@ -0,0 +1,144 @@
+# scheduler.py
+"""
+Threads per gnubg evaluation versus evaluations at once.
+
+A 3-ply evaluation with 16 threads is the fastest way to answer one
+request on an idle box, and the slowest way to answer eight at once: eight
+such jobs put 128 threads on the cores and every one of them finishes late.
+The scheduler splits the cores instead. Each job gets
+
+    threads = cores / (jobs running + jobs queued)
+
+decided when it starts, so a lone request still gets every core and a
+queue of them gets one or two threads each. Jobs already running keep what
+they started with. Long-running gnubg processes outside the engine's slots
+(cube rollouts) register with background() and count as jobs for as long
+as they run, on both sides of the split.
+
+GNUBG_CPUS   CPUs to plan with: a count ("8") or a list ("0-7,16-23").
+             Default: this process's CPU affinity, capped by a cgroup quota.
+GNUBG_PIN    "1" pins pooled worker i to its own slice of those CPUs
+             (cores / POOL_SIZE each) and caps its threads at the slice size,
+             so workers stop trading caches and cores with each other.
+
+logic.SCHEDULER is the process-wide instance, built from GNUBG_THREADS
+("auto" or a fixed number) and GNUBG_POOL_SIZE ("auto" = one worker per 4
+CPUs, 1..8).
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+PIN = os.environ.get("GNUBG_PIN", "0") == "1"
+
+# Pool size on auto: one worker per this many CPUs, within 1..MAX_AUTO_WORKERS.
+CPUS_PER_WORKER = 4
+MAX_AUTO_WORKERS = 8
+
+
+def _parse_cpus(spec: str) -> List[int]:
+    """ "8" -> first 8 allowed CPUs; "0-3,8" -> exactly those."""
+    if spec.isdigit():
+        return _allowed()[:max(int(spec), 1)]
+    cpus = set()
+    for part in spec.split(","):
+        lo, _, hi = part.strip().partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(cpus)
+
+
+def _allowed() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def _cgroup_quota() -> Optional[float]:
+    """CPUs' worth of time the cgroup (v2) allows, or None when unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        return None
+    if quota == "max":
+        return None
+    return int(quota) / int(period)
+
+
+def available_cpus() -> List[int]:
+    spec = os.environ.get("GNUBG_CPUS", "").strip()
+    if spec:
+        return _parse_cpus(spec)
+    cpus = _allowed()
+    quota = _cgroup_quota()
+    if quota is not None:
+        cpus = cpus[:max(int(quota), 1)]
+    return cpus
+
+
+def auto_workers(cpus: int) -> int:
+    return max(1, min(cpus // CPUS_PER_WORKER, MAX_AUTO_WORKERS))
+
+
+class Scheduler:
+    """Threads for the next job from the current load; CPU slices for pinned workers."""
+
+    def __init__(self, cpus: List[int], fixed_threads: int = None, pin: bool = False, workers: int = 1):
+        self.cpus = cpus
+        self.fixed_threads = fixed_threads
+        self.pin = pin
+        self.workers = max(workers, 1)
+        # Pinned workers never run more threads than their slice has CPUs.
+        self.max_threads = len(self.cpuset(0)) if pin else len(cpus)
+        self._jobs: Dict[int, int] = {}  # threads -> jobs started with that many
+        self.background_jobs = 0  # gnubg processes registered with background()
+        self._lock = threading.Lock()
+
+    def threads(self, active: int) -> int:
+        """Threads for a job starting while `active` jobs (itself included) run or wait, plus background ones."""
+        if self.fixed_threads:
+            n = self.fixed_threads
+        else:
+            n = len(self.cpus) // max(active + self.background_jobs, 1)
+        n = max(1, min(n, self.max_threads))
+        with self._lock:
+            self._jobs[n] = self._jobs.get(n, 0) + 1
+        return n
+
+    @contextmanager
+    def background(self, jobs: int):
+        """Counts `jobs` gnubg processes against the CPUs while the block runs."""
+        with self._lock:
+            self.background_jobs += jobs
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.background_jobs -= jobs
+
+    def cpuset(self, slot: int) -> List[int]:
+        """CPUs of pooled worker `slot` when pinning: an equal, disjoint slice (shared round-robin if too few)."""
+        size = len(self.cpus) // self.workers
+        if size < 1:
+            return [self.cpus[slot % len(self.cpus)]]
+        return self.cpus[slot * size:(slot + 1) * size]
+
+    def cpusets(self, workers: int) -> Optional[List[List[int]]]:
+        """Per-worker CPU lists for GnubgPool, or None when not pinning."""
+        if not self.pin:
+            return None
+        return [self.cpuset(i) for i in range(workers)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = dict(sorted(self._jobs.items()))
+        return {
+            "cpus": len(self.cpus),
+            "threads": self.fixed_threads or "auto",
+            "max_threads": self.max_threads,
+            "pinned": self.pin,
+            "background_jobs": self.background_jobs,
+            "jobs_by_threads": jobs,
+        }
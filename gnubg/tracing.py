@@ -0,0 +1,168 @@
+# tracing.py
+"""
+Per-request traces: a correlation ID, named spans (ids, queue_wait, engine,
+parse, validate) and attributes such as the position/match IDs.
+
+The current trace lives in a contextvar, so spans opened on engine threads
+land in the right request as long as the executor call copies the context
+(engine.AsyncEngine.run does). Finished traces go to a bounded in-memory
+window (for the slowest-requests endpoint) and, sampled, to a JSONL file.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+import metrics
+
+# Fraction of traces written to TRACE_FILE; traces slower than TRACE_SLOW_MS are always written.
+TRACE_SAMPLE = float(os.environ.get("GNUBG_TRACE_SAMPLE", "0.01"))
+TRACE_SLOW_MS = float(os.environ.get("GNUBG_TRACE_SLOW_MS", "5000"))
+TRACE_FILE = os.environ.get("GNUBG_TRACE_FILE") or None
+
+# Finished traces kept in memory for /admin/slowest.
+TRACE_WINDOW = int(os.environ.get("GNUBG_TRACE_WINDOW", "2000"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+class Trace:
+    def __init__(self, request_id: str, endpoint: str):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status: Optional[int] = None
+        self.attrs = {}
+        self.spans = []  # (name, start_ms, duration_ms, thread)
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, end: float):
+        with self._lock:
+            self.spans.append((name, round((start - self._t0) * 1000, 3), round((end - start) * 1000, 3),
+                               threading.current_thread().name))
+
+    def finish(self, status: int):
+        self.status = status
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [{"name": n, "start_ms": s, "duration_ms": d, "thread": t} for n, s, d, t in self.spans]
+        return {
+            "request_id": self.request_id,
+            "endpoint": self.endpoint,
+            "started": self.started,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attrs": dict(self.attrs),
+            "spans": spans,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def start(endpoint: str, request_id: str = None) -> Trace:
+    trace = Trace(request_id or uuid.uuid4().hex, endpoint)
+    _current.set(trace)
+    return trace
+
+
+def annotate(**attrs):
+    """Attributes for the current trace (e.g. pos_id, match_id, kind)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def record(name: str, start: float, end: float):
+    """Span from perf_counter() timestamps; also feeds the metrics.PHASE histogram."""
+    metrics.PHASE.observe(end - start, phase=name)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span(name, start, end)
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, t0, time.perf_counter())
+
+
+# --- FINISHED TRACES ---
+
+class _Recent:
+    """Last TRACE_WINDOW finished traces."""
+
+    def __init__(self, size: int):
+        self._items: List[Trace] = []
+        self._size = size
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._items.append(trace)
+            if len(self._items) > self._size:
+                del self._items[:len(self._items) - self._size]
+
+    def slowest(self, n: int) -> List[dict]:
+        with self._lock:
+            items = sorted(self._items, key=lambda t: t.duration_ms or 0.0, reverse=True)[:n]
+        return [t.to_dict() for t in items]
+
+
+_recent = _Recent(TRACE_WINDOW)
+_export: "queue.SimpleQueue[dict]" = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _write_loop(path: str):
+    with open(path, "a", encoding="utf-8") as f:
+        while True:
+            item = _export.get()
+            f.write(json.dumps(item, separators=(",", ":")) + "\n")
+            if _export.empty():
+                f.flush()
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, args=(TRACE_FILE,), name="trace-export", daemon=True)
+                _writer.start()
+
+
+def finish(trace: Trace, status: int):
+    """
+    Closes the trace. Analysis requests (the ones that annotated anything)
+    are kept for slowest() and exported if sampled; stats/metrics calls are not.
+    """
+    trace.finish(status)
+    if not trace.attrs:
+        return
+    _recent.add(trace)
+    if TRACE_FILE and (trace.duration_ms >= TRACE_SLOW_MS or random.random() < TRACE_SAMPLE):
+        _ensure_writer()
+        _export.put(trace.to_dict())
+
+
+def slowest(n: int) -> List[dict]:
+    return _recent.slowest(n)
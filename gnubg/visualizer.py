@@ -1,10 +1,12 @@
 # visualizer.py
 from models import HintRequest, HintResponse
 
-def print_console_debug(req: HintRequest, result: HintResponse, decision_type: str = "move", gnubg_output: str = None):
+def render_debug(req: HintRequest, result: HintResponse, decision_type: str = "move", gnubg_output: str = None) -> str:
     """
-    Prints visualization, decision details, and raw logs to console.
+    Visualization, decision details, and raw logs as console text
+    (written by reqlog's background thread at debug level).
     """
+    out = []
     p_board = req.board.player_board
     o_board = req.board.opponent_board
 
@@ -16,25 +18,25 @@ def print_console_debug(req: HintRequest, result: HintResponse, decision_type: s
     C_BLUE = "\033[94m"
     C_GRAY = "\033[90m"
 
-    print(f"\n{C_BOLD}{'='*60}{C_RESET}")
-    print(f"{C_BLUE}>>> NEW REQUEST: {decision_type.upper()}{C_RESET}")
+    out.append(f"\n{C_BOLD}{'='*60}{C_RESET}")
+    out.append(f"{C_BLUE}>>> NEW REQUEST: {decision_type.upper()}{C_RESET}")
 
     p_total = sum(p_board)
     o_total = sum(o_board)
 
     if p_total < 15 or o_total < 15:
-        print(f"{C_WARN}WARNING: Checkers count mismatch!{C_RESET}")
-        print(f"Hero On Board: {p_total} (Off/Bar calculated: {15-p_total})")
-        print(f"Opp  On Board: {o_total} (Off/Bar calculated: {15-o_total})")
+        out.append(f"{C_WARN}WARNING: Checkers count mismatch!{C_RESET}")
+        out.append(f"Hero On Board: {p_total} (Off/Bar calculated: {15-p_total})")
+        out.append(f"Opp  On Board: {o_total} (Off/Bar calculated: {15-o_total})")
         if o_total == 0:
-            print(f"{C_WARN}>>> Opponent board is EMPTY (all zeros). Check your JSON request!{C_RESET}")
+            out.append(f"{C_WARN}>>> Opponent board is EMPTY (all zeros). Check your JSON request!{C_RESET}")
 
     m = req.match
-    print(f"Match: {m.score_player}-{m.score_opponent} (to {m.match_length}) | Cube: {m.cube_value} (Holder: {m.cube_holder})")
+    out.append(f"Match: {m.score_player}-{m.score_opponent} (to {m.match_length}) | Cube: {m.cube_value} (Holder: {m.cube_holder})")
     if decision_type == "move":
-        print(f"Dice: {req.dice}")
+        out.append(f"Dice: {req.dice}")
     else:
-        print(f"Double Offered: {req.double_offered}")
+        out.append(f"Double Offered: {req.double_offered}")
 
     board_vis = ["  "] * 25
 
@@ -57,35 +59,42 @@ def print_console_debug(req: HintRequest, result: HintResponse, decision_type: s
     p_off = 15 - p_total
     o_off = 15 - o_total
 
-    print("-" * 65)
-    print(f" Bar: Hero={C_HERO}{p_bar}{C_RESET} | Opp={C_OPP}{o_bar}{C_RESET}")
-    print("-" * 65)
+    out.append("-" * 65)
+    out.append(f" Bar: Hero={C_HERO}{p_bar}{C_RESET} | Opp={C_OPP}{o_bar}{C_RESET}")
+    out.append("-" * 65)
 
     top_indices = range(13, 25)
     row_str = "|" + "|".join([board_vis[i] for i in top_indices]) + "|"
-    print(f"13-24: {row_str}")
+    out.append(f"13-24: {row_str}")
 
     bot_indices = range(12, 0, -1)
     row_str = "|" + "|".join([board_vis[i] for i in bot_indices]) + "|"
-    print(f"12-01: {row_str}")
+    out.append(f"12-01: {row_str}")
 
-    print("-" * 65)
+    out.append("-" * 65)
     off_comment_p = "(WIN?)" if p_off == 15 else ""
     off_comment_o = "(EMPTY DATA?)" if o_off == 15 and "O" not in str(board_vis) else ""
 
-    print(f" Off: Hero={C_HERO}{p_off}{C_RESET} {off_comment_p}| Opp={C_OPP}{o_off}{C_RESET} {off_comment_o}")
+    out.append(f" Off: Hero={C_HERO}{p_off}{C_RESET} {off_comment_p}| Opp={C_OPP}{o_off}{C_RESET} {off_comment_o}")
 
-    print(f"\n{C_BOLD}DECISION:{C_RESET}")
+    out.append(f"\n{C_BOLD}DECISION:{C_RESET}")
     if decision_type == "move":
-        print(f"Raw Move: {result.best_move_raw}")
-        print(f"Parsed:   {result.best_move_reduced}")
-        print(f"Cube:     {result.cube_text} ({result.cube_action})")
+        out.append(f"Raw Move: {result.best_move_raw}")
+        out.append(f"Parsed:   {result.best_move_reduced}")
+        out.append(f"Cube:     {result.cube_text} ({result.cube_action})")
     else:
-        print(f"Action:   {result.cube_text} ({result.cube_action})")
+        out.append(f"Action:   {result.cube_text} ({result.cube_action})")
 
     if gnubg_output:
-        print(f"\n{C_BOLD}--- GNUbg RAW OUTPUT (START) ---{C_RESET}")
-        print(f"{C_GRAY}{gnubg_output.strip()}{C_RESET}")
-        print(f"{C_BOLD}--- GNUbg RAW OUTPUT (END) ---{C_RESET}")
+        out.append(f"\n{C_BOLD}--- GNUbg RAW OUTPUT (START) ---{C_RESET}")
+        out.append(f"{C_GRAY}{gnubg_output.strip()}{C_RESET}")
+        out.append(f"{C_BOLD}--- GNUbg RAW OUTPUT (END) ---{C_RESET}")
+
+    out.append(f"{C_BOLD}{'='*60}{C_RESET}\n")
+    return "\n".join(out)
 
-    print(f"{C_BOLD}{'='*60}{C_RESET}\n")
\ No newline at end of file
+def print_console_debug(req: HintRequest, result: HintResponse, decision_type: str = "move", gnubg_output: str = None):
+    """
+    Prints render_debug() to console (synchronously; the service logs through reqlog).
+    """
+    print(render_debug(req, result, decision_type, gnubg_output))
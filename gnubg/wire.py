@@ -0,0 +1,413 @@
+# wire.py
+"""
+Compact binary transport next to the HTTP API, for callers on the same
+host or LAN: length-prefixed frames over TCP (GNUBG_WIRE_PORT) and/or a
+Unix domain socket (GNUBG_WIRE_SOCKET). No JSON, no pydantic on the way in.
+
+Every frame is a big-endian u32 body length followed by the body. A
+connection may pipeline any number of requests; answers come back as they
+finish (not in request order), tagged with the caller's request id. At
+most MAX_INFLIGHT requests per connection are worked on at once, further
+frames wait in the socket. Closing the connection cancels its unfinished
+requests (and their engine work, as a hung-up HTTP client does).
+
+Request body (sizes in bytes, integers big-endian):
+
+    4  request id (echoed)
+    1  op: 1 move, 2 cube, 3 full (cube decision before the roll + move)
+    1  flags: bit 0 the double is offered to us (cube), bit 1 boards follow (else IDs)
+    1  top_n (0 = 1)
+    1  reserved
+    4  deadline_ms (0 = none)
+    then IDs:    1 + len  position ID,  1 + len  match ID (dice in the match ID;
+                 for cube, the doubler's side, as /get-double-decision computes)
+    or boards:   25 + 25  player / opponent checkers (index 0 = bar),
+                 1 die1, 1 die2, 2 match_length, 2 score_player, 2 score_opponent,
+                 1 log2 cube value, 1 cube holder (0 us, 1 them, 3 centre),
+                 1 flags (bit 0 crawford, bit 1 jacoby)
+
+Response body:
+
+    4  request id, 1 status
+    OK:     str pos_id, str match_id, str cube_action, str source,
+            1 ply (signed, -1 = none), 1 flags (bit 0 cube equities follow),
+            [4 x f32 no_double, double_take, double_pass, optimal],
+            1 n candidates, each: str move, f32 equity, f32 eqdiff (NaN = none),
+            1 n + n x f32 probs, 1 n + n x (1 from, 1 to) reduced move
+    ERROR:  2 + len  message (UTF-8)
+    BUSY:   2 retry_after seconds, 2 + len  message
+
+"str" is a 1-byte length and ASCII. WireClient below speaks the protocol.
+"""
+import asyncio
+import math
+import os
+import socket
+import struct
+from typing import Dict, Iterable, List, Optional
+
+# Where to listen; both empty = transport off.
+HOST = os.environ.get("GNUBG_WIRE_HOST", "127.0.0.1")
+PORT = int(os.environ.get("GNUBG_WIRE_PORT", "0"))
+SOCKET_PATH = os.environ.get("GNUBG_WIRE_SOCKET", "")
+
+# Requests worked on at once per connection (pipelined frames beyond this wait).
+MAX_INFLIGHT = int(os.environ.get("GNUBG_WIRE_INFLIGHT", "64"))
+
+MAX_FRAME = 64 * 1024
+
+OPS = {1: "move", 2: "cube", 3: "full"}
+OP_CODES = {kind: op for op, kind in OPS.items()}
+
+F_RECEIVING_DOUBLE = 1
+F_BOARDS = 2
+
+OK, ERROR, BUSY = 0, 1, 2
+
+_FRAME = struct.Struct(">I")
+_REQUEST = struct.Struct(">IBBBxI")
+_MATCH = struct.Struct(">BBHHHBBB")
+_RESPONSE = struct.Struct(">IB")
+_CUBE = struct.Struct(">4f")
+_CANDIDATE = struct.Struct(">ff")
+
+_CUBE_EQUITIES = ("no_double", "double_take", "double_pass", "optimal")
+
+
+class WireError(ValueError):
+    """Malformed request frame; answered with ERROR (or the connection is closed)."""
+
+
+class WireRequest:
+    __slots__ = ("id", "kind", "receiving_double", "top_n", "deadline_ms",
+                 "pos_id", "match_id", "boards", "match")
+
+    def __init__(self, req_id: int, kind: str, receiving_double: bool, top_n: int, deadline_ms: Optional[int]):
+        self.id = req_id
+        self.kind = kind
+        self.receiving_double = receiving_double
+        self.top_n = top_n
+        self.deadline_ms = deadline_ms
+        self.pos_id = self.match_id = None
+        self.boards = None  # (player, opponent) when sent as boards
+        self.match = None   # MatchData fields + "dice", with boards
+
+
+# --- 1. CODEC ---
+
+def _str(body: bytes, at: int):
+    n = body[at]
+    end = at + 1 + n
+    if end > len(body):
+        raise WireError("truncated string")
+    return body[at + 1:end].decode("ascii"), end
+
+
+def _pack_str(s: Optional[str]) -> bytes:
+    b = (s or "").encode("ascii", "replace")[:255]
+    return bytes((len(b),)) + b
+
+
+def _f32(x) -> float:
+    return float("nan") if x is None else x
+
+
+def _or_none(x: float) -> Optional[float]:
+    return None if math.isnan(x) else x
+
+
+def peek_id(body: bytes) -> int:
+    return _FRAME.unpack_from(body)[0] if len(body) >= 4 else 0
+
+
+def decode_request(body: bytes) -> WireRequest:
+    if len(body) < _REQUEST.size:
+        raise WireError("short request")
+    req_id, op, flags, top_n, deadline_ms = _REQUEST.unpack_from(body)
+    if op not in OPS:
+        raise WireError(f"unknown op {op}")
+    req = WireRequest(req_id, OPS[op], bool(flags & F_RECEIVING_DOUBLE), min(max(top_n, 1), 20), deadline_ms or None)
+    at = _REQUEST.size
+    try:
+        if flags & F_BOARDS:
+            if len(body) < at + 50 + _MATCH.size:
+                raise WireError("short board request")
+            player, opponent = list(body[at:at + 25]), list(body[at + 25:at + 50])
+            if sum(player) > 15 or sum(opponent) > 15:
+                raise WireError("more than 15 checkers on a side")
+            d1, d2, length, score_p, score_o, cube_log2, holder, mflags = _MATCH.unpack_from(body, at + 50)
+            req.boards = (player, opponent)
+            req.match = {
+                "dice": [d1, d2],
+                "match_length": length,
+                "score_player": score_p,
+                "score_opponent": score_o,
+                "cube_value": 1 << cube_log2,
+                "cube_holder": holder,
+                "crawford": bool(mflags & 1),
+                "jacoby": bool(mflags & 2),
+            }
+        else:
+            req.pos_id, at = _str(body, at)
+            req.match_id, at = _str(body, at)
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise WireError(f"malformed request: {e}")
+    return req
+
+
+def encode_request(req_id: int, kind: str, pos_id: str = None, match_id: str = None,
+                   boards=None, match: dict = None, receiving_double: bool = False,
+                   top_n: int = 1, deadline_ms: int = None) -> bytes:
+    """Framed request: IDs, or boards=(player, opponent) with match = MatchData fields + "dice"."""
+    flags = (F_RECEIVING_DOUBLE if receiving_double else 0) | (F_BOARDS if boards is not None else 0)
+    body = _REQUEST.pack(req_id, OP_CODES[kind], flags, top_n, deadline_ms or 0)
+    if boards is not None:
+        m = match or {}
+        dice = m.get("dice", (0, 0))
+        body += bytes(boards[0]) + bytes(boards[1]) + _MATCH.pack(
+            dice[0], dice[1], m.get("match_length", 0), m.get("score_player", 0), m.get("score_opponent", 0),
+            max(int(m.get("cube_value", 1)), 1).bit_length() - 1, m.get("cube_holder", 3),
+            (1 if m.get("crawford") else 0) | (2 if m.get("jacoby") else 0))
+    else:
+        body += _pack_str(pos_id) + _pack_str(match_id)
+    return _FRAME.pack(len(body)) + body
+
+
+def encode_result(req_id: int, pid: str, mid: str, res: dict, kind: str, top_n: int = 1) -> bytes:
+    """Framed OK answer from a backend result (the dict _ok_response turns into a HintResponse)."""
+    cube = res.get("cube_equities")
+    ply = res.get("ply")
+    parts = [
+        _RESPONSE.pack(req_id, OK),
+        _pack_str(pid), _pack_str(mid), _pack_str(res["cube_action"]), _pack_str(res.get("source", "engine")),
+        struct.pack(">bB", -1 if ply is None else ply, 1 if cube else 0),
+    ]
+    if cube:
+        parts.append(_CUBE.pack(*(cube[k] for k in _CUBE_EQUITIES)))
+    candidates = (res.get("candidates") or [])[:top_n] if kind != "cube" else []
+    parts.append(bytes((len(candidates),)))
+    for c in candidates:
+        probs = c.get("probs") or ()
+        reduced = c.get("reduced") or ()
+        parts.append(_pack_str(c.get("move")))
+        parts.append(_CANDIDATE.pack(_f32(c.get("equity")), _f32(c.get("eqdiff"))))
+        parts.append(struct.pack(f">B{len(probs)}f", len(probs), *probs))
+        parts.append(bytes([len(reduced)] + [v for m in reduced for v in (m["from"], m["to"])]))
+    body = b"".join(parts)
+    return _FRAME.pack(len(body)) + body
+
+
+def encode_error(req_id: int, message: str, retry_after: int = None) -> bytes:
+    msg = message.encode("utf-8")[:65535]
+    if retry_after is None:
+        body = _RESPONSE.pack(req_id, ERROR) + struct.pack(">H", len(msg)) + msg
+    else:
+        body = _RESPONSE.pack(req_id, BUSY) + struct.pack(">HH", min(retry_after, 65535), len(msg)) + msg
+    return _FRAME.pack(len(body)) + body
+
+
+def decode_response(body: bytes) -> dict:
+    """Response body -> dict: id, status ("ok", "error", "busy") and the HintResponse-like fields."""
+    req_id, status = _RESPONSE.unpack_from(body)
+    at = _RESPONSE.size
+    if status != OK:
+        out = {"id": req_id, "status": "busy" if status == BUSY else "error"}
+        if status == BUSY:
+            (out["retry_after"],) = struct.unpack_from(">H", body, at)
+            at += 2
+        (n,) = struct.unpack_from(">H", body, at)
+        out["error_msg"] = body[at + 2:at + 2 + n].decode("utf-8", "replace")
+        return out
+
+    pid, at = _str(body, at)
+    mid, at = _str(body, at)
+    cube_action, at = _str(body, at)
+    source, at = _str(body, at)
+    ply, flags = struct.unpack_from(">bB", body, at)
+    at += 2
+    cube = None
+    if flags & 1:
+        cube = dict(zip(_CUBE_EQUITIES, _CUBE.unpack_from(body, at)))
+        at += _CUBE.size
+    candidates = []
+    count, at = body[at], at + 1
+    for _ in range(count):
+        move, at = _str(body, at)
+        equity, eqdiff = _CANDIDATE.unpack_from(body, at)
+        at += _CANDIDATE.size
+        n = body[at]
+        probs = list(struct.unpack_from(f">{n}f", body, at + 1))
+        at += 1 + 4 * n
+        n = body[at]
+        flat = body[at + 1:at + 1 + 2 * n]
+        at += 1 + 2 * n
+        candidates.append({"move": move or None, "equity": _or_none(equity), "eqdiff": _or_none(eqdiff),
+                           "probs": probs, "reduced": [{"from": flat[i], "to": flat[i + 1]} for i in range(0, 2 * n, 2)]})
+    best = candidates[0] if candidates else None
+    return {
+        "id": req_id, "status": "ok", "pos_id": pid, "match_id": mid,
+        "best_move_raw": best["move"] if best else None,
+        "best_move_reduced": best["reduced"] if best else [],
+        "cube_action": cube_action, "source": source, "ply": None if ply < 0 else ply,
+        "equity": best["equity"] if best else None, "probs": (best["probs"] or None) if best else None,
+        "cube_equities": cube, "candidates": candidates,
+    }
+
+
+# --- 2. SERVER ---
+
+class WireServer:
+    """
+    Serves framed requests with `handler(WireRequest) -> bytes` (a framed
+    answer, see encode_result/encode_error), several at once per connection.
+    """
+
+    def __init__(self, handler, max_inflight: int = MAX_INFLIGHT):
+        self.handler = handler
+        self.max_inflight = max(max_inflight, 1)
+        self.connections = 0
+        self.requests = 0
+        self._servers = []
+
+    async def start(self, host: str = HOST, port: int = PORT, path: str = SOCKET_PATH):
+        if port:
+            self._servers.append(await asyncio.start_server(self._serve, host, port))
+        if path:
+            if os.path.exists(path):
+                os.unlink(path)  # stale socket from an earlier run
+            self._servers.append(await asyncio.start_unix_server(self._serve, path))
+        return self
+
+    def addresses(self) -> List[str]:
+        out = []
+        for server in self._servers:
+            for sock in server.sockets:
+                name = sock.getsockname()
+                out.append(name if isinstance(name, str) else f"{name[0]}:{name[1]}")
+        return out
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        slots = asyncio.Semaphore(self.max_inflight)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    (size,) = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                    if size > MAX_FRAME:
+                        break
+                    body = await reader.readexactly(size)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                await slots.acquire()
+                task = asyncio.ensure_future(self._answer(body, writer, write_lock, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            # Caller gone: stop what it is still waiting for.
+            for task in tasks:
+                task.cancel()
+            self.connections -= 1
+            writer.close()
+
+    async def _answer(self, body: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock,
+                      slots: asyncio.Semaphore):
+        try:
+            self.requests += 1
+            try:
+                out = await self.handler(decode_request(body))
+            except WireError as e:
+                out = encode_error(peek_id(body), str(e))
+            async with write_lock:
+                if not writer.is_closing():
+                    writer.write(out)
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            slots.release()
+
+    def stats(self) -> dict:
+        return {"listening": self.addresses(), "connections": self.connections, "requests": self.requests}
+
+
+# --- 3. CLIENT ---
+
+class WireClient:
+    """
+    Blocking client. address: "host:port" or a Unix socket path.
+
+        with WireClient("127.0.0.1:5008") as c:
+            answers = c.analyze_many([dict(kind="move", pos_id=pid, match_id=mid), ...])
+    """
+
+    def __init__(self, address: str, timeout: float = 60.0):
+        if os.path.sep in address or ":" not in address:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(address)
+        else:
+            host, port = address.rsplit(":", 1)
+            self._sock = socket.create_connection((host, int(port)), timeout=timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self._sock.makefile("rb")
+        self._next_id = 0
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self) -> dict:
+        head = self._rfile.read(_FRAME.size)
+        if len(head) < _FRAME.size:
+            raise ConnectionError("connection closed")
+        (size,) = _FRAME.unpack(head)
+        return decode_response(self._rfile.read(size))
+
+    def analyze_many(self, requests: Iterable[dict], window: int = None) -> List[dict]:
+        """
+        Pipelines encode_request(**kwargs) for each request; answers in request
+        order. At most `window` (default MAX_INFLIGHT, the server's per-connection
+        limit) are unanswered at a time: past that the server stops reading, and
+        a client still sending would never get to read the replies filling up
+        its socket.
+        """
+        window = max(window or MAX_INFLIGHT, 1)
+        order: Dict[int, int] = {}  # request id -> index, while unanswered
+        out: Dict[int, dict] = {}
+        frames, n = [], 0
+
+        def read_one():
+            resp = self._read()
+            out[order.pop(resp.pop("id"))] = resp
+
+        for n, kwargs in enumerate(requests, 1):
+            if len(order) >= window:
+                if frames:
+                    self._sock.sendall(b"".join(frames))
+                    frames = []
+                read_one()
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            order[self._next_id] = n - 1
+            frames.append(encode_request(self._next_id, **kwargs))
+        if frames:
+            self._sock.sendall(b"".join(frames))
+        while order:
+            read_one()
+        return [out[i] for i in range(n)]
+
+    def analyze(self, **kwargs) -> dict:
+        return self.analyze_many([kwargs])[0]
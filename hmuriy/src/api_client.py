@@ -25,14 +25,12 @@ class GnubgClient:
             return None
 
     def get_optimal_move(self, board_data, match_data, dice):
-        print('zaprosili optimal move!')
         payload = {
             "board": board_data,
             "match": match_data,
             "dice": dice,
             "double_offered": False
         }
-        print(payload)
         return self._post("/get-optimal-move", payload)
 
     def get_double_decision(self, board_data, match_data, double_offered=False):
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import httpx
+
+
+class AsyncGnubgClient:
+    """
+    asyncio client for the gnubg analysis API.
+
+    api_urls: one base URL, a comma-separated string or a list of replicas.
+    One pooled httpx.AsyncClient is shared by all calls. Every call has a
+    deadline (seconds, default `timeout`). When a replica has not answered
+    after the p95 latency observed for that endpoint, the same request is
+    sent to the next replica and the first good answer wins (the slower
+    request is cancelled; the server stops its engine job). A replica that
+    fails (connection error, 5xx, 503 busy) is skipped for the next one.
+
+    Methods return the parsed JSON, or None on failure, like GnubgClient.
+    """
+
+    # Latencies kept per endpoint for the hedge delay, and the minimum before hedging starts.
+    WINDOW = 200
+    MIN_SAMPLES = 20
+    HEDGE_PCT = 95
+    MIN_HEDGE_DELAY = 0.02
+
+    def __init__(self, api_urls, timeout=25.0, max_connections=32, hedge=True):
+        if isinstance(api_urls, str):
+            api_urls = api_urls.split(",")
+        self.base_urls = [u.strip().rstrip('/') for u in api_urls if u.strip()]
+        self.timeout = timeout
+        self.hedge = hedge
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._latency = {}  # endpoint -> deque of seconds
+        self._next = 0      # round-robin start replica
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0, "errors": 0}
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    # --- HEDGING ---
+
+    def hedge_delay(self, endpoint):
+        """Seconds to wait before the hedged duplicate, or None while too few latencies are known."""
+        samples = self._latency.get(endpoint)
+        if not samples or len(samples) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        k = min(int(len(ordered) * self.HEDGE_PCT / 100), len(ordered) - 1)
+        return max(ordered[k], self.MIN_HEDGE_DELAY)
+
+    def _replicas(self):
+        """Replicas in the order to try them, starting round-robin."""
+        start = self._next
+        self._next = (self._next + 1) % len(self.base_urls)
+        return self.base_urls[start:] + self.base_urls[:start]
+
+    async def _send(self, base_url, endpoint, payload, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise httpx.TimeoutException("deadline passed")
+        t0 = time.monotonic()
+        response = await self._http.post(f"{base_url}{endpoint}", json=payload, timeout=remaining)
+        if response.status_code == 422:
+            print(f"🔥 [VALIDATION ERROR] {base_url}{endpoint}: {response.text}")
+        response.raise_for_status()
+        self._latency.setdefault(endpoint, deque(maxlen=self.WINDOW)).append(time.monotonic() - t0)
+        return response
+
+    async def _request(self, endpoint, payload, timeout=None, hedge=True):
+        """First good httpx.Response from the replicas, or None."""
+        self.stats["requests"] += 1
+        deadline = time.monotonic() + (timeout or self.timeout)
+        replicas = self._replicas()
+        delay = self.hedge_delay(endpoint) if (hedge and self.hedge) else None
+        pending = {}  # task -> (replica, is the hedged duplicate)
+        last_error = None
+
+        def launch(hedged=False):
+            url = replicas.pop(0)
+            pending[asyncio.ensure_future(self._send(url, endpoint, payload, deadline))] = (url, hedged)
+
+        launch()
+        try:
+            while pending:
+                wait = deadline - time.monotonic()
+                if delay is not None and replicas:
+                    wait = min(wait, delay)
+                if wait <= 0:
+                    break
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if replicas and delay is not None:
+                        # Slow answer: duplicate it on the next replica, keep the first one running.
+                        self.stats["hedged"] += 1
+                        delay = None
+                        launch(hedged=True)
+                        continue
+                    break
+                give_up = False
+                for task in done:
+                    url, hedged = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except httpx.HTTPStatusError as e:
+                        last_error = f"{url}: HTTP {e.response.status_code}"
+                        # 4xx: the request itself is wrong, another replica won't help
+                        give_up = give_up or e.response.status_code < 500
+                    except httpx.HTTPError as e:
+                        last_error = f"{url}: {type(e).__name__} {e}"
+                    else:
+                        if hedged:
+                            self.stats["hedge_wins"] += 1
+                        return response
+                if give_up:
+                    break
+                if not pending and replicas:
+                    self.stats["failovers"] += 1
+                    launch()
+            if last_error is None:
+                last_error = f"no answer within {timeout or self.timeout:g}s"
+        finally:
+            for task in pending:
+                task.cancel()
+        self.stats["errors"] += 1
+        print(f"🔥 [API ERROR] {endpoint}: {last_error}")
+        return None
+
+    async def _post(self, endpoint, payload, timeout=None):
+        response = await self._request(endpoint, payload, timeout)
+        return response.json() if response is not None else None
+
+    # --- ENDPOINTS ---
+
+    async def get_optimal_move(self, board_data, match_data, dice, timeout=None, **options):
+        """options: extra HintRequest fields (top_n, deadline_ms)."""
+        payload = {
+            "board": board_data,
+            "match": match_data,
+            "dice": dice,
+            "double_offered": False,
+            **options,
+        }
+        return await self._post("/get-optimal-move", payload, timeout)
+
+    async def get_double_decision(self, board_data, match_data, double_offered=False, timeout=None, **options):
+        payload = {
+            "board": board_data,
+            "match": match_data,
+            "dice": [0, 0],
+            "double_offered": double_offered,
+            **options,
+        }
+        return await self._post("/get-double-decision", payload, timeout)
+
+    async def get_full_analysis(self, board_data, match_data, dice, timeout=None, **options):
+        payload = {
+            "board": board_data,
+            "match": match_data,
+            "dice": dice,
+            **options,
+        }
+        return await self._post("/get-full-analysis", payload, timeout)
+
+    async def analyze_batch(self, payloads, timeout=None):
+        """
+        requests: HintRequest payloads (dice [0, 0] = cube decision).
+        Returns one HintResponse dict per request, in order (None if the batch failed).
+        Not hedged: a batch's latency depends on its size, not on the replica.
+        """
+        payloads = list(payloads)
+        response = await self._request("/analyze-batch", payloads, timeout, hedge=False)
+        out = [None] * len(payloads)
+        if response is None:
+            return out
+        for line in response.text.splitlines():
+            if line.strip():
+                item = json.loads(line)
+                out[item["index"]] = item["result"]
+        return out